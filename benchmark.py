@@ -0,0 +1,87 @@
+'''Micro benchmarks for the race state
+
+Usage is `python benchmark.py [matrix] [memory]`. Nothing here is used by the bot.
+'''
+
+import random
+import sys
+import timeit
+import tracemalloc
+
+from runner import Runner, RunnerSet, versions
+from srlmodels import SRLEntrant
+from timestamp import Timestamp
+from trackedsplits import RBYSplits
+
+RACE_SIZES = (4, 8, 16, 32, 64, 128, 256, 512)
+
+def build_race(runner_set_cls, size: int, splits: RBYSplits) -> RunnerSet:
+    '''Builds a race of the given size where runners are spread over splits'''
+    rng = random.Random(size)
+    runners = runner_set_cls()
+    for i in range(size):
+        runner = Runner(SRLEntrant(f'runner{i}', 9994, -3, '', 'Ready', f'twitch{i}', '0'))
+        runners.add(runner)
+        for position in range(1, rng.randint(1, 21)):
+            split = splits.by_position(position)
+            runner.add_split(split, Timestamp(split.Name, 0, position * 4, rng.randint(0, 59), 0))
+    return runners
+
+def split_standings_after_split(runners: RunnerSet, split) -> str:
+    '''Renders the split standings with the set's cached rendering stale, like after a split
+
+    The runners' own standing strings stay cached, as only one of them
+    changes with a split.
+    '''
+    runners.version = next(versions)
+    return runners.split_standings(split, runners)
+
+def bench_matrix() -> None:
+    '''Compares the pure python RunnerSet against MatrixRunnerSet'''
+    from splitmatrix import MatrixRunnerSet, np
+    if np is None:
+        print('numpy is not installed')
+        return
+
+    splits = RBYSplits()
+    split = splits['Brock']
+    print(f'{"runners":>8} {"op":>15} {"python us":>10} {"matrix us":>10}')
+    crossover = {}
+    for size in RACE_SIZES:
+        races = {cls: build_race(cls, size, splits) for cls in (RunnerSet, MatrixRunnerSet)}
+        ops = {
+            'split_ranking': lambda r: r.split_ranking(split, r),
+            'split_standings': lambda r: split_standings_after_split(r, split),
+        }
+        for op, fn in ops.items():
+            times = []
+            for runners in races.values():
+                number = max(10, 20000 // size)
+                times.append(timeit.timeit(lambda: fn(runners), number=number) / number * 1e6)
+            print(f'{size:>8} {op:>15} {times[0]:>10.1f} {times[1]:>10.1f}')
+            if times[1] < times[0]:
+                crossover.setdefault(op, size)
+
+    for op in ops:
+        print(f'{op}: matrix is faster from {crossover.get(op, "never")} runners')
+
+def bench_memory() -> None:
+    '''Measures the memory used per runner in a race of 100 runners'''
+    splits = RBYSplits()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    runners = build_race(RunnerSet, 100, splits)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    print(f'{len(runners)} runners: {size} bytes, {size // len(runners)} bytes per runner')
+
+BENCHMARKS = {
+    'matrix': bench_matrix,
+    'memory': bench_memory,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -29,3 +29,10 @@ def remove_user(user) -> None:
 def check_user(user) -> bool:
     '''Returns true if the specified user is in the blacklist'''
     return bool(Blacklist.get_or_none(Blacklist.username == user))
+
+def check_users(users) -> set[str]:
+    '''Returns the users in the blacklist out of the specified users'''
+    if not (users := list(users)):
+        return set()
+    query = Blacklist.select(Blacklist.username).where(Blacklist.username.in_(users))
+    return {row.username for row in query}
@@ -1,12 +1,21 @@
 import asyncio
+import os
+from collections import OrderedDict
 
 import irc
 import cfg
 import srlapi
-from race import Race
+from race import Race, COMMENT_REFRESH_DELAY, COMMENT_REFRESHES, LATE_ARRIVAL_WINDOW, SETTLE_WINDOW, SPLIT_DEADLINE
+from runner import AnnouncePolicy
 import blacklist
 import race_db
+import journal
+from journal import Journal, JOURNAL_QUEUE_SIZE, JOURNALED_EVENTS, read_events
+import scheduler
+import events
+from events import Announcement, Metrics, RaceFinished
 import timestamp
+from trackedsplits import RBYSplits, RBY_SPLITS_FILE
 
 from discord.ext import commands
 from discord import Message
@@ -20,12 +29,28 @@ file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 logger.addHandler(logging.StreamHandler())
 
+SPLIT_CATALOG_POLL_SECONDS = 5
+# finished races are compacted into a summary this many seconds after they
+# finish, and only the most recent summaries are kept
+FINISHED_RACE_RETENTION = 600
+RETAINED_SUMMARIES = 50
+
 
 class DiscordBot(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.races = {}
+        self.finished_races = OrderedDict() # key = race id, value = RaceSummary, least recently used first
         self.srl_irc = None
+        self.tracked_splits = RBYSplits()
+        self.split_catalog_mtime = None
+        self.scheduler = scheduler.scheduler
+        self.events = events.bus
+        self.metrics = Metrics()
+        self.events.subscribe('twitch', self.send_announcement, Announcement)
+        self.events.subscribe('journal', journal.writer, *JOURNALED_EVENTS, maxsize=JOURNAL_QUEUE_SIZE)
+        self.events.subscribe('discord', self.post_race_results, RaceFinished)
+        self.events.subscribe('metrics', self.metrics)
         self.twitch_irc = irc.IRC(cfg.TW_HOST, cfg.PORT, cfg.TW_NICK, cfg.TW_PASS, 'xd_bot_xd', True, True, bot=self)
 
     async def is_race_channel(ctx) -> bool:
@@ -43,33 +68,67 @@ class DiscordBot(commands.Cog):
 
         reply_text = f'Searching for race with user {user}'
         reply = await ctx.send(reply_text)
-        race_model = srlapi.find_race_with_user(user)
+        race_model = await srlapi.find_race_with_user(user)
         if race_model and race_model.game.id == 6:
             race_id = race_model.id
             if race_db.check_race(race_id):
                 reply_text = f'Already watching {race_id}:\n{race_model.summary_str()}'
             else:
-                await self.init_ircs(race_id)
-
                 logger.info(f'Found race {race_model}')
-                race_obj = Race(race_id, self)
+                # tracked before the livesplit room is joined, so its NAMES reply finds the race
+                race_obj = self.track_race(race_id)
+                await self.init_ircs(race_id)
                 race_obj.watch_msg = reply
-                self.races[race_id] = race_obj
                 race_db.add_race(race_id)
                 await race_obj.update_race()
-                await asyncio.sleep(2)
                 reply_text = f'Found a race! ID: {race_id}\n{race_model.summary_str()}\nThis race will now be tracked'
                 if 'silent' in args or 'silence' in args:
-                    race_obj.silenced = True
+                    race_obj.update_settings(silenced=True)
                     reply_text += ' silently'
                 if 'spoiler' in args:
-                    race_obj.spoiler = True
+                    race_obj.update_settings(spoiler=True)
                     reply_text += ' and marked as a spoiler'
         else:
             reply_text = f'Unable to find a race involving user {user}'
 
         await reply.edit(content=reply_text)
 
+    def track_race(self, race_id: str) -> Race:
+        '''Creates a watched race with deadlines, auto ignores, settling, batched late arrivals and a journal'''
+        race_obj = Race(race_id, self, self.tracked_splits)
+        race_obj.split_deadline = SPLIT_DEADLINE
+        race_obj.auto_ignore = True
+        race_obj.settle_window = SETTLE_WINDOW
+        race_obj.late_arrival_window = LATE_ARRIVAL_WINDOW
+        race_obj.start_journal(Journal(race_id))
+        self.races[race_id] = race_obj
+        return race_obj
+
+    async def recover_races(self) -> int:
+        '''Resumes the races that were being watched when the bot went down
+
+        Every unfinished race in the database with a journal is rebuilt from
+        SRL and its journal, and its channels are rejoined. Returns the
+        number of races recovered.
+        '''
+
+        count = 0
+        for race_id in race_db.unfinished_races():
+            if race_id in self.races:
+                continue
+            if not (events := read_events(race_id)):
+                logger.info(f'No journal for race {race_id}, not recovering it')
+                continue
+            race_obj = self.track_race(race_id)
+            await self.init_ircs(race_id)
+            if await race_obj.recover(events):
+                count += 1
+            else:
+                logger.warning(f'Could not find race {race_id} on SRL, not recovering it')
+                del self.races[race_id]
+                await self.srl_irc._part(race_obj.srl_livesplit_ch_name)
+        return count
+
     async def init_ircs(self, race_id: str) -> None:
         '''Initializes the SRL and TW IRC clients'''
         if not self.srl_irc:
@@ -106,11 +165,32 @@ class DiscordBot(commands.Cog):
 
         msg = f'Could not find race {race_id}'
         if race := self.races.get(race_id, None):
+            race.srl_cache.invalidate()
             await race.update_race()
             msg = f'Updating race {race_id}'
 
         await ctx.send(msg)
 
+    @commands.command()
+    @commands.check(is_race_channel)
+    async def gaps(self, ctx, race_id: str, user: str) -> None:
+        '''Posts how far behind the leader and the runner ahead a user is'''
+
+        msg = f'Could not find race {race_id}'
+        if race := self.races.get(race_id, None):
+            msg = race.runners.gaps_str(user) or f'Could not find user {user} in race {race_id}'
+        await ctx.send(msg)
+
+    @commands.command()
+    @commands.check(is_race_channel)
+    async def segments(self, ctx, race_id: str, user: str) -> None:
+        '''Posts the split-to-split times of a user'''
+
+        msg = f'Could not find race {race_id}'
+        if race := self.races.get(race_id, None):
+            msg = race.runners.segments_str(user) or f'Could not find user {user} in race {race_id}'
+        await ctx.send(msg)
+
     @commands.command()
     @commands.check(is_race_channel)
     async def update_comments(self, ctx, race_id: str) -> None:
@@ -137,7 +217,7 @@ class DiscordBot(commands.Cog):
 
         msg = f'Could not find race {race_id}'
         if race := self.races.get(race_id, None):
-            race.spoiler = True
+            race.update_settings(spoiler=True)
             msg = f'Race {race_id} has been marked as a spoiler.'
 
         await ctx.send(msg)
@@ -158,7 +238,7 @@ class DiscordBot(commands.Cog):
 
         msg = f'Could not find race {race_id}'
         if race := self.races.get(race_id, None):
-            ignored = race.runners.user_ignore(user, True)
+            ignored = race.ignore_runner(user, True)
             if ignored:
                 msg = f'Started ignoring user {user}'
             else:
@@ -170,7 +250,7 @@ class DiscordBot(commands.Cog):
     async def unignore(self, ctx, race_id: str, user: str) -> None:
         msg = f'Could not find race {race_id}'
         if race := self.races.get(race_id, None):
-            ignored = race.runners.user_ignore(user, False)
+            ignored = race.ignore_runner(user, False)
             if ignored:
                 msg = f'Started unignoring user {user}'
             else:
@@ -192,8 +272,11 @@ class DiscordBot(commands.Cog):
         if race_db.check_race(race_id):
             race_db.delete_race(race_id)
             if race := self.races.get(race_id, None):
+                race.cancel_jobs()
+                race.discard_journal()
                 await race.disconnect_ircs()
                 race.finished = True
+                self.schedule_eviction(race)
                 msg = f'No longer watching race {race_id}'
             else:
                 msg = f'Could not find race {race_id}'
@@ -231,6 +314,91 @@ class DiscordBot(commands.Cog):
 
         await ctx.send(msg)
 
+    @commands.command()
+    @commands.check(is_admin)
+    @commands.check(is_race_channel)
+    async def reload_splits(self, ctx) -> None:
+        '''Reloads the split catalog and aliases into all running races'''
+
+        if await self.load_split_catalog():
+            msg = f'Reloaded {len(self.tracked_splits.splits)} splits into {len(self.races)} races'
+        else:
+            msg = 'Failed to reload splits, check the logs'
+        await ctx.send(msg)
+
+    async def load_split_catalog(self) -> bool:
+        '''Rebuilds the split catalog and swaps it into every race
+
+        The catalog is read and compiled in an executor so the event loop is
+        not blocked. Returns False if the catalog could not be loaded, in
+        which case the current catalog is kept.
+        '''
+
+        try:
+            tracked_splits = await asyncio.get_event_loop().run_in_executor(None, RBYSplits)
+        except Exception:
+            logger.exception('Failed to load split catalog')
+            return False
+
+        self.tracked_splits = tracked_splits
+        for race in self.races.values():
+            race.set_tracked_splits(tracked_splits)
+        return True
+
+    def watch_split_catalog(self, path=RBY_SPLITS_FILE) -> None:
+        '''Polls the split catalog and reloads it whenever it changes'''
+
+        try:
+            self.split_catalog_mtime = os.path.getmtime(path)
+        except OSError as e:
+            # the first poll that can read it reloads the catalog
+            logger.warning(f'Failed to check split catalog {path}: {str(e)}')
+        self.scheduler.schedule('bot', 'split catalog', SPLIT_CATALOG_POLL_SECONDS,
+                                lambda: self.check_split_catalog(path),
+                                every=SPLIT_CATALOG_POLL_SECONDS, times=None)
+
+    async def check_split_catalog(self, path=RBY_SPLITS_FILE) -> None:
+        '''Reloads the split catalog if it changed since the last check
+
+        If the catalog can't be read or loaded, the next poll tries again.
+        '''
+
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError as e:
+            logger.info(f'Failed to check split catalog {path}, retrying: {str(e)}')
+            return
+        if mtime != self.split_catalog_mtime:
+            logger.info('Split catalog changed, reloading')
+            if await self.load_split_catalog():
+                self.split_catalog_mtime = mtime
+
+    @commands.command()
+    @commands.check(is_admin)
+    @commands.check(is_race_channel)
+    async def metrics(self, ctx) -> None:
+        '''Shows the race event counts and how far behind the event subscribers are'''
+
+        subscribers = ', '.join(f'{sub.name} {sub.queue.qsize()} queued/{sub.dropped} dropped'
+                                for sub in self.events.subscriptions.values())
+        await ctx.send(f'Events: {self.metrics}\nSubscribers: {subscribers}')
+
+    @commands.command()
+    @commands.check(is_admin)
+    @commands.check(is_race_channel)
+    async def jobs(self, ctx, race_id: str = None) -> None:
+        '''Lists the pending scheduled jobs, optionally for a single race'''
+
+        if pending := self.scheduler.pending(race_id):
+            lines = []
+            for job, due_in in pending:
+                runs = 'until cancelled' if job.runs_left is None else f'{job.runs_left} left'
+                lines.append(f'{job.owner} {job.name}: in {due_in:g}s ({runs})')
+            msg = 'Pending jobs:\n' + '\n'.join(lines)
+        else:
+            msg = 'No pending jobs'
+        await ctx.send(msg)
+
     @commands.command()
     @commands.check(is_admin)
     @commands.check(is_race_channel)
@@ -246,6 +414,8 @@ class DiscordBot(commands.Cog):
                 logger.info('\t\trace_db obj is finished')
                 continue
             race_db.delete_race(race_id)
+            # it can't be recovered without its database entry
+            race.discard_journal()
             if race.finished:
                 logger.info('\t\trace is finished')
                 continue
@@ -253,6 +423,7 @@ class DiscordBot(commands.Cog):
         for chat in {self.srl_irc, self.twitch_irc}:
             if chat and chat.alive:
                 await chat.disconnect('discord')
+        await srlapi.client.close()
         await ctx.send(f'Bot is shutting down after unwatching {count} races')
         await self.bot.close()
 
@@ -268,6 +439,7 @@ After all the racers in a watched race have finished or skipped a split, a messa
 For you to receive messages, you'll have to connect your twitch account to SRL.
 
 One feature of this bot is that if you type `!standings` in your twitch chat, it will post the current latest split of all the racers in order.
+`!gaps <user>` shows how far behind the leader and the runner ahead someone was at their latest split, and `!segments <user>` shows their split-to-split times.
 
 Another key feature of this bot is the ability to create a subset of racers to watch.
 It's not uncommon in a big race that one or two people might be very far behind the leaders, or someone's livesplit comparisons are not working, or they are not even joining through livesplit. In these cases, the bot can be very delayed, or even not work properly when posting splits to everyone's channel.
@@ -284,6 +456,8 @@ For example, `!finish_race uvlfr hwangbroxd 02:06:31.38`
 
 In these cases, it also might be useful to have the bot ignore this user instead of waiting for splits that are never coming.
 For this, use `!ignore <race_id> <user>`
+The bot also ignores runners on its own when they leave the livesplit room or stop splitting while far behind the rest of the race, and stops ignoring them once they split again.
+Big races can also use `!announce_policy <race_id> top <k>` or `!announce_policy <race_id> percent <x>` to announce a split once the first k runners, or x% of the runners, are done, with the rest posted as late arrivals.
 
 If you would like to skip seeing messages altogether, you can use `!blacklist <user>` to put yourself on the blacklist, or `!unblacklist <user>` to take yourself off.'''
 
@@ -291,12 +465,16 @@ If you would like to skip seeing messages altogether, you can use `!blacklist <u
     @commands.check(is_race_channel)
     async def blacklist(self, ctx, user: str) -> None:
         blacklist.add_user(user)
+        for race in self.races.values():
+            race.reset_entrants()
         await ctx.send(f'User {user} has been added to the blacklist. This twitch channel will no longer receive race updates.')
 
     @commands.command()
     @commands.check(is_race_channel)
     async def unblacklist(self, ctx, user: str) -> None:
         blacklist.remove_user(user)
+        for race in self.races.values():
+            race.reset_entrants()
         await ctx.send(f'User {user} has been removed from the blacklist.')
 
     @commands.command()
@@ -312,7 +490,7 @@ If you would like to skip seeing messages altogether, you can use `!blacklist <u
 
         msg = f'Could not find race {race_id}.'
         if race := self.races.get(race_id, None):
-            race.silenced = True
+            race.update_settings(silenced=True)
             msg = f'Race {race_id} has been silenced.'
 
         await ctx.send(msg)
@@ -322,11 +500,36 @@ If you would like to skip seeing messages altogether, you can use `!blacklist <u
     async def unsilence_race(self, ctx, race_id: str) -> None:
         msg = f'Could not find race {race_id}.'
         if race := self.races.get(race_id, None):
-            race.silenced = False
+            race.update_settings(silenced=False)
             msg = f'Race {race_id} has been unsilenced.'
 
         await ctx.send(msg)
 
+    @commands.command()
+    @commands.check(is_race_channel)
+    async def announce_policy(self, ctx, race_id: str, mode: str = 'all', value: int = 0) -> None:
+        '''Sets when a race's splits are announced
+
+        `all` waits for every runner, `top <k>` announces once k runners have
+        the split and `percent <x>` once x% of the runners have it. Runners
+        after that get late arrival updates.
+        '''
+
+        msg = f'Could not find race {race_id}.'
+        if race := self.races.get(race_id, None):
+            if mode == 'all':
+                race.update_settings(announce_policy=AnnouncePolicy())
+            elif mode == 'top' and value > 0:
+                race.update_settings(announce_policy=AnnouncePolicy(top=value))
+            elif mode == 'percent' and 0 < value <= 100:
+                race.update_settings(announce_policy=AnnouncePolicy(percent=value))
+            else:
+                await ctx.send('Usage is `!announce_policy <race_id> all|top <k>|percent <x>`')
+                return
+            msg = f'Race {race_id} announce policy set to {race.announce_policy}.'
+
+        await ctx.send(msg)
+
     @commands.command()
     @commands.check(is_race_channel)
     async def post_results(self, ctx, race_id: str) -> None:
@@ -334,8 +537,12 @@ If you would like to skip seeing messages altogether, you can use `!blacklist <u
 
         msg = f'Could not find race {race_id}.'
         if race := self.races.get(race_id, None):
+            race.srl_cache.invalidate()
             await race.update_race()
             msg = f'Race {race_id} results:\n\n' + '\n'.join(race.runners.overall_standings_list(True, True))
+        elif summary := self.finished_races.get(race_id):
+            self.finished_races.move_to_end(race_id)
+            msg = summary.results
 
         await ctx.send(msg)
 
@@ -350,6 +557,59 @@ If you would like to skip seeing messages altogether, you can use `!blacklist <u
 
         await msg.edit(content=text)
 
+    async def send_announcement(self, event: Announcement) -> None:
+        '''Sends a race's split announcement to the twitch chats'''
+        for chat, msg in event.sends:
+            await self.twitch_irc.send(msg, chat)
+
+    async def post_race_results(self, event: RaceFinished) -> None:
+        '''Posts a finished race's results to discord and schedules the comment refreshes
+
+        The race is scheduled for eviction first, so it's compacted even if
+        discord can't be reached.
+        '''
+
+        if race := self.races.get(event.race_id):
+            self.schedule_eviction(race)
+
+        try:
+            await self.send_message(event.results, cfg.RACE_BOT_CHANNEL_ID)
+            announcement_msg = await self.send_message(event.results, cfg.RED_RACE_CHANNEL_ID)
+        except Exception as e:
+            logger.info(f'Failed to send message: {str(e)}')
+            return
+
+        if race:
+            race.announcement_msg = announcement_msg
+            logger.info(f'Updating comments every {COMMENT_REFRESH_DELAY} seconds, {COMMENT_REFRESHES} times')
+            race.scheduler.schedule(race.race_id, 'comments', COMMENT_REFRESH_DELAY, race.update_race_comments,
+                                    every=COMMENT_REFRESH_DELAY, times=COMMENT_REFRESHES)
+
+    def schedule_eviction(self, race: Race) -> None:
+        '''Evicts a finished race once its retention period passed'''
+        race.scheduler.schedule(race.race_id, 'evict', FINISHED_RACE_RETENTION,
+                                lambda: self.evict_race(race.race_id))
+
+    def evict_race(self, race_id: str) -> bool:
+        '''Replaces a finished race with its result summary
+
+        The race and everything it references are dropped from the active
+        races, and the least recently used summaries are dropped once there
+        are more than RETAINED_SUMMARIES. Returns False if the race isn't
+        finished.
+        '''
+
+        if not (race := self.races.get(race_id)) or not race.finished:
+            return False
+        race.cancel_jobs()
+        del self.races[race_id]
+        self.finished_races[race_id] = race.summary()
+        self.finished_races.move_to_end(race_id)
+        while len(self.finished_races) > RETAINED_SUMMARIES:
+            self.finished_races.popitem(last=False)
+        logger.info(f'Evicted finished race {race_id}, keeping {len(self.finished_races)} summaries')
+        return True
+
     async def send_message(self, msg: str, channel: int) -> Message:
         '''Send a message in a given discord channel
 
@@ -376,6 +636,7 @@ If you would like to skip seeing messages altogether, you can use `!blacklist <u
 
 def run_discord_bot():
     bot = commands.Bot(command_prefix='!')
+    discord_bot = DiscordBot(bot)
 
     @bot.event
     async def on_ready():
@@ -384,6 +645,12 @@ def run_discord_bot():
         for guild in bot.guilds:
             logger.info(f'    {guild.name}')
 
+        if ('bot', 'split catalog') not in discord_bot.scheduler:
+            discord_bot.watch_split_catalog()
+
+        if count := await discord_bot.recover_races():
+            logger.info(f'Recovered {count} races')
+
     @bot.event
     async def on_message(message):
         if bot.user.mentioned_in(message):
@@ -403,7 +670,7 @@ def run_discord_bot():
 
         await bot.process_commands(message)
 
-    bot.add_cog(DiscordBot(bot))
+    bot.add_cog(discord_bot)
     bot.run(cfg.DISCORD_TOKEN)
 
 if __name__ == '__main__':
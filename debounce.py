@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('main')
+
+# seconds without a new signal before the callback runs
+DEBOUNCE_WINDOW = 2
+# seconds after the first signal that the callback runs at the latest
+DEBOUNCE_MAX_DELAY = 10
+
+class Debouncer:
+    '''Collapses bursts of signals into a single call of an async callback
+
+    Every signal pushes the call back until no signal came in for `window`
+    seconds, but the call never happens more than `max_delay` seconds after
+    the first signal of the burst. `saved` counts the signals that were
+    folded into an already pending call.
+    '''
+
+    def __init__(self, callback, window: float = DEBOUNCE_WINDOW,
+                 max_delay: float = DEBOUNCE_MAX_DELAY):
+        self.callback = callback
+        self.window = window
+        self.max_delay = max_delay
+        self.handle = None
+        self.first_signal = None
+        self.task = None
+        self.fired = 0
+        self.saved = 0
+
+    @property
+    def pending(self) -> bool:
+        return self.handle is not None
+
+    def signal(self) -> None:
+        '''Schedules the callback, or pushes back the pending call'''
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        if self.handle:
+            self.handle.cancel()
+            self.saved += 1
+        else:
+            self.first_signal = now
+        delay = min(self.window, self.first_signal + self.max_delay - now)
+        self.handle = loop.call_later(max(delay, 0), self._fire)
+
+    def _fire(self) -> None:
+        self.handle = None
+        self.fired += 1
+        self.task = asyncio.ensure_future(self.callback())
+
+    async def flush(self) -> None:
+        '''Runs the pending call now instead of waiting for the window'''
+        if self.handle:
+            self.handle.cancel()
+            self._fire()
+        # the call itself may be what's flushing, e.g. when it finishes the race
+        if self.task and self.task is not asyncio.current_task():
+            await self.task
+
+    def cancel(self) -> None:
+        '''Drops the pending call'''
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable
+
+logger = logging.getLogger('main')
+
+# events a subscriber can fall behind by before its oldest ones are dropped
+EVENT_QUEUE_SIZE = 256
+
+@dataclass(frozen=True)
+class RaceEvent:
+    race_id: str
+
+@dataclass(frozen=True)
+class SplitRecorded(RaceEvent):
+    runner: str
+    split: str
+    ms: int
+
+@dataclass(frozen=True)
+class SplitUndone(RaceEvent):
+    runner: str
+    split: str
+
+@dataclass(frozen=True)
+class SplitSkipped(RaceEvent):
+    runner: str
+    split: str
+
+@dataclass(frozen=True)
+class SplitCompleted(RaceEvent):
+    '''A split was announced to every watcher'''
+    split: str
+    standings: str
+
+@dataclass(frozen=True)
+class SplitAnnouncedEarly(RaceEvent):
+    '''A split was announced before every runner had it'''
+    split: str
+
+@dataclass(frozen=True)
+class Announcement(RaceEvent):
+    '''Messages for twitch chats, as (chat, message) pairs'''
+    split: str
+    sends: tuple
+
+@dataclass(frozen=True)
+class WatchedSplitAnnounced(RaceEvent):
+    '''A split was announced to watchers whose watched runners all had it'''
+    split: str
+    watchers: tuple
+
+@dataclass(frozen=True)
+class RunnerIgnored(RaceEvent):
+    runner: str
+    ignored: bool
+    auto: bool = False
+
+@dataclass(frozen=True)
+class WatchlistChanged(RaceEvent):
+    runner: str
+    watched: tuple # empty when the watchlist was reset
+
+@dataclass(frozen=True)
+class WatcherAdded(RaceEvent):
+    '''A twitch channel outside the race started getting its announcements'''
+    watcher: str
+
+@dataclass(frozen=True)
+class SettingsChanged(RaceEvent):
+    silenced: bool
+    spoiler: bool
+    top: int # the announce policy
+    percent: int
+
+@dataclass(frozen=True)
+class RunnerForfeited(RaceEvent):
+    runner: str
+
+@dataclass(frozen=True)
+class RunnerFinished(RaceEvent):
+    runner: str
+    ms: int
+
+@dataclass(frozen=True)
+class RaceFinished(RaceEvent):
+    results: str
+
+class Subscription:
+    def __init__(self, name: str, callback: Callable, types: tuple, maxsize: int):
+        self.name = name
+        self.callback = callback
+        self.types = types
+        self.queue = asyncio.Queue(maxsize)
+        self.task = None
+        self.delivered = 0
+        self.dropped = 0
+
+    def wants(self, event: RaceEvent) -> bool:
+        return not self.types or isinstance(event, self.types)
+
+class EventBus:
+    '''In-process pub/sub for race events
+
+    Every subscriber gets its own bounded queue and a consumer task that
+    runs only while the queue has events, so publishing never waits on a
+    subscriber. When a subscriber falls EVENT_QUEUE_SIZE events behind, its
+    oldest event is dropped to make room.
+    '''
+
+    def __init__(self, maxsize: int = EVENT_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.subscriptions = {} # key = subscriber name, value = Subscription
+
+    def subscribe(self, name: str, callback: Callable, *types: type, maxsize: int = None) -> Subscription:
+        '''Calls callback with every published event of the given types, or all of them
+
+        The callback can be a plain function or a coroutine function.
+        Subscribing again with the same name replaces the subscriber.
+        '''
+        self.unsubscribe(name)
+        subscription = self.subscriptions[name] = Subscription(name, callback, types, maxsize or self.maxsize)
+        return subscription
+
+    def unsubscribe(self, name: str) -> None:
+        if (subscription := self.subscriptions.pop(name, None)) and subscription.task:
+            subscription.task.cancel()
+
+    def publish(self, event: RaceEvent) -> None:
+        '''Queues an event for every interested subscriber'''
+        for subscription in self.subscriptions.values():
+            if not subscription.wants(event):
+                continue
+            if subscription.queue.full():
+                subscription.queue.get_nowait()
+                subscription.queue.task_done()
+                subscription.dropped += 1
+                logger.warning(f'Subscriber {subscription.name} is behind, dropped an event')
+            subscription.queue.put_nowait(event)
+            if subscription.task is None or subscription.task.done():
+                subscription.task = asyncio.ensure_future(self._consume(subscription))
+
+    async def _consume(self, subscription: Subscription) -> None:
+        while not subscription.queue.empty():
+            event = subscription.queue.get_nowait()
+            try:
+                if asyncio.iscoroutine(result := subscription.callback(event)):
+                    await result
+                subscription.delivered += 1
+            except Exception as e:
+                logger.warning(f'Subscriber {subscription.name} failed on {type(event).__name__}: {str(e)}')
+            finally:
+                subscription.queue.task_done()
+
+    async def drain(self, *names: str) -> None:
+        '''Waits until the named subscribers, or all of them, handled the events published so far'''
+        await asyncio.gather(*(subscription.queue.join() for name, subscription in list(self.subscriptions.items())
+                               if not names or name in names))
+
+class Metrics:
+    '''Subscriber counting the events of every race by type'''
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def __call__(self, event: RaceEvent) -> None:
+        self.counts[type(event).__name__] += 1
+
+    def __str__(self) -> str:
+        return ', '.join(f'{name} {count}' for name, count in sorted(self.counts.items())) or 'no events yet'
+
+# races publish here and the bot subscribes its twitch sender, journal writer,
+# Discord poster and metrics
+bus = EventBus()
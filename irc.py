@@ -23,6 +23,7 @@ class IRC:
         self.listener = listener
         self.bot = bot
         self.alive = False
+        self.drain_lock = None
 
     #     # debug
     #     self.listen_loop = asyncio.new_event_loop()
@@ -83,13 +84,26 @@ class IRC:
         '''Low level sending a message in IRC, with no channel attached'''
         logger.debug(f'BASIC_SEND: {msg}')
         self.writer.write(f'{msg}\r\n'.encode())
-        await self.writer.drain()
+        await self._drain()
 
     async def send(self, msg, channel) -> None:
         '''Sends a message to a given channel'''
         logger.debug(f'SEND: {msg}')
         self.writer.write(f'PRIVMSG #{channel} :{msg}\r\n'.encode())
-        await self.writer.drain()
+        await self._drain()
+
+    async def _drain(self) -> None:
+        '''Waits for the writer's buffer to flush, one task at a time
+
+        A StreamWriter can't be drained by several tasks at once before
+        Python 3.10, it raises AssertionError, so sends from different tasks
+        take turns.
+        '''
+
+        if self.drain_lock is None:
+            self.drain_lock = asyncio.Lock()
+        async with self.drain_lock:
+            await self.writer.drain()
 
     async def disconnect(self, killer='') -> None:
         '''Disconnect routine'''
@@ -122,7 +136,8 @@ class IRC:
                     cookie = raw_msg.split('PING :')[1]
                     await self.basic_send(f'PONG :{cookie}')
             elif 'PRIVMSG' in raw_msg or (not self.is_twitch
-                                          and ('JOIN :#srl' in raw_msg or 'PART #' in raw_msg)):
+                                          and ('JOIN :#srl' in raw_msg or 'PART #' in raw_msg
+                                               or ' QUIT ' in raw_msg or ' 353 ' in raw_msg)):
                 msg = Message(raw_msg)
                 cmd_handled = await self.handle_message(msg)
                 if cmd_handled:
@@ -137,6 +152,14 @@ class IRC:
         cmd = True
         # SRL commands
         if not self.is_twitch:
+            if msg.command == 'QUIT':
+                # a quit isn't tied to a channel, and a LiveSplit that drops
+                # its connection quits rather than parting the race room
+                for race in self.bot.races.values():
+                    if race.runners.get(msg.username):
+                        race.runner_presence(msg.username, False)
+                        race.roster_changed()
+                return cmd
             race_id = msg.channel.split('-')[1]
             if race := self.bot.races.get(race_id, {}):
                 if msg.command in {'time', 'done'}:
@@ -148,7 +171,12 @@ class IRC:
                         else:
                             await race.finish_race_for_user(msg.username, timestamp)
                 elif msg.command in {'JOIN', 'PART'}:
-                    await race.update_race()
+                    race.runner_presence(msg.username, msg.command == 'JOIN')
+                    race.roster_changed()
+                elif msg.command == 'NAMES':
+                    # runners already in the room when the bot joins it never send a JOIN
+                    for name in msg.names:
+                        race.runner_presence(name, True)
 
         # TW commands
         elif msg.command == 'kill' and msg.is_admin and msg.channel == 'xd_bot_xd':
@@ -157,23 +185,30 @@ class IRC:
             await self._join(msg.command_body)
         elif msg.command == 'part' and msg.is_admin:
             await self._part(msg.command_body)
-        elif msg.command in {'watch', 'reset_watchlist', 'watchlist', 'standings', 'info', 'multitwitch'}:
+        elif msg.command in {'watch', 'reset_watchlist', 'watchlist', 'standings', 'info', 'multitwitch', 'gaps', 'segments'}:
             if race := await self.bot.check_race_for_user(msg.channel):
                 ret = ''
                 if msg.command == 'standings':
                     if msg.channel in self.channels:
                         ret = ' '.join(race.runners.overall_standings_list())
+                elif msg.command in {'gaps', 'segments'}:
+                    if msg.channel in self.channels:
+                        name = msg.command_body or msg.channel
+                        if msg.command == 'gaps':
+                            ret = race.runners.gaps_str(name)
+                        else:
+                            ret = race.runners.segments_str(name)
                 elif msg.command == 'info':
                     ret = race.user_info
                 elif msg.command == 'multitwitch':
                     ret = race.multitwitch_link
                 elif msg.channel == msg.username:
                     if msg.command == 'watch':
-                        if watched := race.runners.set_watchlist(msg.username, msg.command_body):
+                        if watched := race.set_watchlist(msg.username, msg.command_body):
                             ret = f'Now watching {", ".join([name for name in watched])}'
                     elif msg.command == 'reset_watchlist':
                         ret = 'Reset subset watch list.'
-                        race.runners.reset_watchlist(msg.username)
+                        race.reset_watchlist(msg.username)
                     elif msg.command == 'watchlist':
                         ret = 'Currently not watching any users. You can use "!watch <user1>, <user2> (...)" to start watching one or more other users.'
                         if watchlist := race.runners.watchlist(msg.username):
@@ -0,0 +1,140 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+
+from events import (RaceEvent, RunnerFinished, RunnerIgnored, SettingsChanged, SplitAnnouncedEarly,
+                    SplitCompleted, SplitRecorded, SplitSkipped, SplitUndone, WatchedSplitAnnounced,
+                    WatcherAdded, WatchlistChanged)
+
+logger = logging.getLogger('main')
+
+JOURNAL_DIR = 'db/journal'
+# events are written and fsynced together, at most this many seconds after
+# the first one of a batch or once this many are pending
+JOURNAL_FLUSH_INTERVAL = 1
+JOURNAL_FLUSH_BATCH = 64
+# journal events a race can queue up before the writer drops the oldest
+JOURNAL_QUEUE_SIZE = 4096
+
+# the events a race is rebuilt from
+JOURNALED_EVENTS = (SplitRecorded, SplitUndone, SplitSkipped, RunnerFinished, RunnerIgnored,
+                    WatchlistChanged, WatcherAdded, SettingsChanged, SplitCompleted,
+                    SplitAnnouncedEarly, WatchedSplitAnnounced)
+
+def journal_path(race_id: str, directory: str = JOURNAL_DIR) -> str:
+    return os.path.join(directory, f'{race_id}.log')
+
+class Journal:
+    '''Append-only log of the events of a race
+
+    Every event is one compact JSON line. Events are buffered and written
+    with a single fsync per batch, so a split costs a list append on the IRC
+    path. The journal of an unfinished race is replayed with read_events
+    after a crash to rebuild the race.
+    '''
+
+    def __init__(self, race_id: str, directory: str = JOURNAL_DIR,
+                 flush_interval: float = JOURNAL_FLUSH_INTERVAL, batch: int = JOURNAL_FLUSH_BATCH):
+        self.path = journal_path(race_id, directory)
+        self.flush_interval = flush_interval
+        self.batch = batch
+        self.buffer = []
+        self.handle = None
+        self.file = None
+        self.flushes = 0
+
+    def record(self, event: str, **data) -> None:
+        '''Appends an event, flushing once the batch is full or the interval passed'''
+        self.buffer.append(json.dumps({'event': event, **data}, separators=(',', ':')) + '\n')
+        if len(self.buffer) >= self.batch:
+            self.flush()
+        elif self.handle is None:
+            self.handle = asyncio.get_event_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        '''Writes and fsyncs the pending events'''
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        if not self.buffer:
+            return
+        try:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(''.join(self.buffer))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.flushes += 1
+        except OSError as e:
+            logger.warning(f'Failed to write journal {self.path}: {str(e)}')
+            return
+        self.buffer.clear()
+
+    def close(self) -> None:
+        '''Flushes the pending events and closes the file'''
+        self.flush()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def discard(self) -> None:
+        '''Drops the pending events and deletes the journal'''
+        self.buffer.clear()
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class JournalWriter:
+    '''Bus subscriber writing each race's events to its journal
+
+    Events of races without a journal are ignored, which also drops the
+    ones still queued when a journal is discarded.
+    '''
+
+    def __init__(self):
+        self.journals = {} # key = race id, value = Journal
+
+    def attach(self, race_id: str, journal: Journal) -> None:
+        self.journals[race_id] = journal
+
+    def close(self, race_id: str) -> None:
+        '''Flushes and closes the race's journal, keeping the file'''
+        if journal := self.journals.pop(race_id, None):
+            journal.close()
+
+    def discard(self, race_id: str) -> None:
+        '''Deletes the race's journal'''
+        if journal := self.journals.pop(race_id, None):
+            journal.discard()
+
+    def __call__(self, event: RaceEvent) -> None:
+        if journal := self.journals.get(event.race_id):
+            data = dataclasses.asdict(event)
+            del data['race_id']
+            journal.record(type(event).__name__, **data)
+
+def read_events(race_id: str, directory: str = JOURNAL_DIR) -> list[dict]:
+    '''Returns the events journaled for a race, oldest first
+
+    A line torn by a crash mid-write ends the journal.
+    '''
+    events = []
+    try:
+        with open(journal_path(race_id, directory), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f'Journal for race {race_id} ends with a torn event, dropping it')
+                    break
+    except FileNotFoundError:
+        pass
+    return events
+
+# the bot subscribes this to the bus, races attach their journals to it
+writer = JournalWriter()
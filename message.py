@@ -1,5 +1,5 @@
 import cfg
-from pyparsing import Word, alphas, alphanums, restOfLine
+from pyparsing import Word, alphas, alphanums, oneOf, restOfLine
 
 # Parser to grab command keywords from chat messages.
 username = Word(alphanums+'_-').setResultsName('username')
@@ -12,9 +12,11 @@ parser = ':' + username + irc_garb + 'PRIVMSG' + '#' + channel + cmd + msg
 chat_parser = ':' + username + irc_garb + 'PRIVMSG' + '#' + channel + ':' + msg
 irc_join = ':' + username + irc_garb + 'JOIN :#' + channel
 irc_leave = ':' + username + irc_garb + 'PART #' + channel + ':Leaving'
-irc_quit = ':' + username + irc_garb + 'QUIT :Read error'
+irc_quit = ':' + username + irc_garb + 'QUIT' + msg
+irc_names = ':' + irc_garb + '353' + irc_garb + oneOf('= * @') + '#' + channel + ':' + restOfLine.setResultsName('names')
 
 # :psymar!psymar@SRL-5C0AA961.triad.res.rr.com QUIT :Read error
+# :irc.speedrunslive.com 353 xd_bot_xd = #srl-q7bsl-livesplit :xd_bot_xd @RaceBot Sidosh +Yujito
 
 class Message:
     '''Represents a chat message.
@@ -27,6 +29,7 @@ class Message:
         self.username = self.message = self.command = self.metacommand = self.command_body = self.points_user = self.channel = ''
         self.is_command = False
         self.is_admin = False
+        self.names = []
 
         self.admins = cfg.ADMIN
 
@@ -34,6 +37,8 @@ class Message:
         self.parse_cmd(text)
         self.parse_irc_join(text)
         self.parse_irc_leave(text)
+        self.parse_irc_quit(text)
+        self.parse_irc_names(text)
 
         self.is_admin = self.username in self.admins
 
@@ -75,5 +80,24 @@ class Message:
             self.is_command = True
             self.username = res.username.strip().lower()
 
+    def parse_irc_quit(self, text) -> None:
+        parsed = list(irc_quit.scanString(text))
+        if parsed:
+            res = parsed[0][0]
+            self.command = 'QUIT'
+            self.is_command = True
+            self.username = res.username.strip().lower()
+
+    def parse_irc_names(self, text) -> None:
+        '''Parses the list of users in a channel, sent when joining it'''
+        parsed = list(irc_names.scanString(text))
+        if parsed:
+            res = parsed[0][0]
+            self.channel = res.channel.strip().lower()
+            self.command = 'NAMES'
+            self.command_body = self.channel
+            self.is_command = True
+            self.names = [name.lstrip('~&@%+').lower() for name in res.names.split()]
+
     def __repr__(self):
         return f'({self.channel}) [{self.username}]: {self.message}'
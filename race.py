@@ -1,15 +1,70 @@
-from timestamp import Timestamp
+from timestamp import SkipTimestamp, Timestamp, from_ms
 import srlapi
-from trackedsplits import TrackedSplit, RBYSplits
-from runner import Runner, RunnerSet
-import cfg
+from trackedsplits import TrackedSplit, TrackedSplits, RBYSplits
+from runner import AnnouncePolicy, Runner, RunnerSet, remap_positions, render_cached
+from splitmatrix import MatrixRunnerSet, np
+from debounce import Debouncer
+import journal
+from journal import Journal
+import events
+from events import (Announcement, RaceFinished, RunnerFinished, RunnerForfeited, RunnerIgnored,
+                    SettingsChanged, SplitAnnouncedEarly, SplitCompleted, SplitRecorded, SplitSkipped,
+                    SplitUndone, WatchedSplitAnnounced, WatcherAdded, WatchlistChanged)
+import timerwheel
+import scheduler
 import blacklist
 import race_db
+from dataclasses import dataclass
+from typing import Tuple
 import logging
 import asyncio
+import statistics
 
 logger = logging.getLogger('main')
 
+# races with at least this many runners only announce the top runners, and
+# each runner's own chat also gets their position. Their split rankings are
+# also vectorized with a MatrixRunnerSet when numpy is installed. The matrix
+# switch is deliberately tied to this threshold so large races take a single
+# code path, it isn't picked from the benchmark, which has the matrix ahead
+# from about 8 runners.
+LARGE_RACE_SIZE = 30
+LARGE_RACE_TOP = 10
+
+# seconds after the first runner hits a split that it's announced anyway,
+# used for watched races
+SPLIT_DEADLINE = 600
+
+# runners are ignored automatically, for watched races, once they've been out
+# of the livesplit room for ABSENT_GRACE seconds, or once they haven't split
+# for STALE_SECONDS while STALE_SPLITS or more splits behind the median runner
+PRESENCE_CHECK_INTERVAL = 60
+ABSENT_GRACE = 180
+STALE_SECONDS = 900
+STALE_SPLITS = 3
+
+# seconds a runner's split events are held so split/undo fumbles cancel out,
+# used for watched races
+SETTLE_WINDOW = 1.5
+SETTLE_MAX_DELAY = 5
+
+# seconds late arrivals are collected so a split's stragglers share one line
+# per chat, used for watched races
+LATE_ARRIVAL_WINDOW = 10
+LATE_ARRIVAL_MAX_DELAY = 30
+
+# the result message is refreshed this many seconds apart after the race
+# finishes, to pick up runners' comments
+COMMENT_REFRESH_DELAY = 60
+COMMENT_REFRESHES = 2
+
+@dataclass(frozen=True)
+class RaceSummary:
+    '''What is kept of a finished race once it's evicted from the bot'''
+    race_id: str
+    results: str
+    runner_count: int
+
 class Race:
     '''Class representation of a race tracked by the bot
 
@@ -18,16 +73,43 @@ class Race:
     SRL livesplit irc for split information.
     '''
 
-    def __init__(self, race_id, bot=None):
+    def __init__(self, race_id, bot=None, tracked_splits=None):
         self.bot = bot
         self.race_id = race_id
         self.announced_splits = []
         self.srl = None
+        self.srl_cache = srlapi.SRLRaceCache(race_id)
+        self.roster_debouncer = Debouncer(self._refresh_roster)
         self.standings = ''
         self.srl_livesplit_ch_name = f'srl-{self.race_id}-livesplit'
-        self.tracked_splits = RBYSplits()
+        self.tracked_splits = tracked_splits or RBYSplits()
         self.finished = False
         self.silenced = False
+        self.large_race_size = LARGE_RACE_SIZE
+        self.large_race_top = LARGE_RACE_TOP
+        self.announce_policy = AnnouncePolicy()
+        self.early_splits = set() # positions announced before every runner had them
+        self.split_deadline = None # seconds, None to wait for every runner
+        self.timers = timerwheel.wheel
+        self.scheduler = scheduler.scheduler
+        self.events = events.bus
+
+        self.auto_ignore = False
+        self.absent_since = {} # key = casefolded livesplit nick, value = time they left, None while present
+        self.first_split_at = None
+        self.last_split_at = {} # key = runner, value = time of their last split
+        self.auto_ignored = set() # runners ignored by the presence check
+
+        self.settle_window = 0 # seconds, 0 to apply split events right away
+        self.held_splits = {} # key = casefolded user, value = {position: (split, [timestamps])}
+        self.settlers = {} # key = casefolded user, value = Debouncer
+        self.suppressed_flips = 0
+
+        self.late_arrival_window = 0 # seconds, 0 to announce late arrivals right away
+        self.late_arrivals = {} # key = split position, value = (split, [runners])
+        self.late_debouncer = None
+
+        self.journals = journal.writer
 
         self.spoiler = False
         self.watch_msg = None
@@ -35,9 +117,17 @@ class Race:
 
         self.runners = RunnerSet()
         self.twitch_irc_watchers = set()
+        self.entrants = {} # SRL entrants from the last update, key = name
+        self.reconcile_task = None
+        self.reconcile_pending = False
+        self.unreconciled = {} # key = split position, value = (split, announced standings)
+        self._rendered = {} # key = rendering, value = (runners version, str)
 
     @property
     def multitwitch_link(self) -> str:
+        return render_cached(self._rendered, 'multitwitch', self.runners.version, self._multitwitch_link)
+
+    def _multitwitch_link(self) -> str:
         base_url = 'https://multitwitch.tv/'
         runner_list = sorted(self.runners, key=lambda x: x.name.lower())
         for runner in runner_list:
@@ -48,82 +138,182 @@ class Race:
 
     @property
     def user_info(self) -> str:
+        return render_cached(self._rendered, 'user_info', self.runners.version, self._user_info)
+
+    def _user_info(self) -> str:
         runner_info = 'Runner info | '
         runner_list = sorted(self.runners, key=lambda x: x.name.lower())
         for runner in runner_list:
             runner_info += f'{runner.name} - twitch.tv/{runner.twitch_user} | '
         return runner_info
 
+    def set_tracked_splits(self, tracked_splits: TrackedSplits) -> None:
+        '''Swaps in a new split catalog
+
+        Runner splits, announced splits and everything else keyed by split
+        position are remapped to the new TrackedSplit objects by name before
+        the catalog is replaced, so a race in progress keeps all of its state
+        even when splits move.
+        '''
+
+        positions = remap_positions(self.tracked_splits.positions, tracked_splits)
+        self.runners.remap_splits(tracked_splits)
+        self.announced_splits = [new for split in self.announced_splits
+                                 if (new := positions.get(split.Position, split))]
+        self.early_splits = {new.Position for position in self.early_splits if (new := positions.get(position))}
+        self.unreconciled = {new.Position: (new, sent) for position, (_, sent) in self.unreconciled.items()
+                             if (new := positions.get(position))}
+        for user, held in self.held_splits.items():
+            self.held_splits[user] = {new.Position: (new, times) for position, (_, times) in held.items()
+                                      if (new := positions.get(position))}
+        self.late_arrivals = {new.Position: (new, runners) for position, (_, runners) in self.late_arrivals.items()
+                              if (new := positions.get(position))}
+
+        deadlines = {}
+        for position, new in positions.items():
+            if (remaining := self.timers.remaining((self.race_id, position))) is not None:
+                self.timers.cancel((self.race_id, position))
+                if new:
+                    deadlines[new] = remaining
+        for new, remaining in deadlines.items():
+            self.timers.schedule(self._deadline_key(new), remaining, lambda split=new: self._deadline_expired(split))
+        self.tracked_splits = tracked_splits
+        logger.info(f'[{self.race_id}] Reloaded tracked splits')
+
     async def update_race(self) -> None:
         '''Updates the internal runners data
 
         This function is called whenever a livesplit event happens. It calls
         the SRL api to add any new runners, then updates the state of these
-        runners, as well as refreshes the watcher status
+        runners, as well as refreshes the watcher status. The SRL data comes
+        from the race's short lived cache, call srl_cache.invalidate() first
+        to force a fresh fetch.
         '''
 
         # maybe add even if they aren't found in srl?
-        if new_race_data := srlapi.get_single_race(self.race_id):
+        if new_race_data := await self.srl_cache.get():
             logger.info('Updating race')
-            announce = await self._update_runners(new_race_data.entrants)
-            if announce and not self.finished:
+            forfeited = await self._update_runners(new_race_data.entrants)
+            if forfeited and not self.finished:
                 logger.info('Check for announcing splits from updating race')
                 await self._check_all_splits_announcement()
+                for runner in forfeited:
+                    self._check_watcher_subsets(runner)
         else:
             logger.warning('Unable to update race')
 
-    async def _update_runners(self, srl_data: dict) -> bool:
+    def roster_changed(self) -> None:
+        '''Schedules a roster refresh after runners joined or left the race
+
+        JOIN/PART lines come in waves when a race starts or LiveSplit clients
+        reconnect, so the refreshes are debounced into one.
+        '''
+        self.roster_debouncer.signal()
+
+    async def _refresh_roster(self) -> None:
+        logger.info(f'[{self.race_id}] Refreshing roster, {self.roster_debouncer.saved} refreshes saved so far')
+        self.srl_cache.invalidate()
+        await self.update_race()
+
+    async def _update_runners(self, srl_data: dict) -> set[Runner]:
         '''Updates the SRL data for runners.
 
-        Returns True if a runner's status changed to forfeited so the bot knows
+        The entrants are diffed against the ones from the previous update, and
+        only new entrants and the ones whose state, twitch or comment changed
+        are updated. The resulting twitch joins and parts are applied together.
+
+        Returns the runners whose status changed to forfeited so the bot knows
         whether or not it should try announcing splits.
         '''
+        parts = set()
         # handle people leaving the race before it starts
         for runner in list(self.runners):
             if runner.name not in srl_data:
                 self.runners.remove(runner)
                 logger.info(f'removing user from race before it began: {runner.name}')
                 if runner.twitch_user in self.twitch_irc_watchers:
-                    self.twitch_irc_watchers.discard(runner.twitch_user)
-                    await self.bot.twitch_irc._part(runner.twitch_user)
-                    logger.info(f'removing user from watcher: {runner.twitch_user}')
+                    parts.add(runner.twitch_user)
 
-        announce = False
+        forfeited = set()
+        changes = {} # key = twitch user, value = statetext
         for name, data in srl_data.items():
+            previous = self.entrants.get(name)
             if not (runner := self.runners.get(name)):
                 logger.info(f'Adding entrant {name} to race.')
                 runner = Runner(data)
                 self.runners.add(runner)
+                self._entrant_added(runner)
+            elif previous and (previous.statetext, previous.twitch, previous.message) == \
+                    (data.statetext, data.twitch, data.message):
+                continue
 
             # check if status changed to ff
             # if status goes from ff to non ff, add back to race?
             runner_ff = runner.forfeit
             runner.update_status(data.statetext)
             runner.message = data.message
+            if runner.twitch_user != data.twitch.lower():
+                logger.info(f'Updating twitch user for {name} to {data.twitch}')
+                runner.twitch_user = data.twitch.lower()
 
-            # Update blacklists and leaves/joins twitch channels
             if runner.twitch_user and not self.finished:
-                await self._update_irc_watchers(runner.twitch_user, data.statetext)
+                changes[runner.twitch_user] = data.statetext
             if not runner_ff and runner.forfeit:
                 # Check for announcing splits if someone forfeits
-                announce = True
+                forfeited.add(runner)
+                self.events.publish(RunnerForfeited(self.race_id, runner.name))
+
+        self.entrants = dict(srl_data)
+        self._size_runner_set()
+        # Update blacklists and leaves/joins twitch channels
+        await self._update_irc_watchers(changes, parts)
+        return forfeited
+
+    def _size_runner_set(self) -> None:
+        '''Moves the runners of a large race into a MatrixRunnerSet
+
+        Split rankings are then computed over a numpy matrix. The matrix is
+        faster from about 8 runners (`python benchmark.py matrix`), but only
+        large races switch, see LARGE_RACE_SIZE. Without numpy the race keeps
+        its RunnerSet.
+        '''
+        if np is not None and len(self.runners) >= self.large_race_size and \
+                not isinstance(self.runners, MatrixRunnerSet):
+            logger.info(f'[{self.race_id}] {len(self.runners)} runners, ranking splits with a matrix')
+            self.runners = self.runners.rebuilt_as(MatrixRunnerSet)
 
-        return announce
+    def reset_entrants(self) -> None:
+        '''Forgets the entrant snapshot so the next update checks everyone'''
+        self.entrants = {}
 
-    async def _update_irc_watchers(self, twitch_user: str,
-                                  statetext: str) -> None:
+    async def _update_irc_watchers(self, changes: dict[str, str], parts=()) -> None:
+        '''Joins and leaves twitch channels for entrants that changed
 
-        blacklisted = blacklist.check_user(twitch_user)
-        if blacklisted or statetext == 'Forfeit':
-            if twitch_user in self.twitch_irc_watchers:
-                logger.info(f'removing user from watcher: {twitch_user}')
-                await self.bot.twitch_irc._part(twitch_user)
-                self.twitch_irc_watchers.discard(twitch_user)
-        else:
-            if not blacklisted and twitch_user not in self.twitch_irc_watchers:
-                logger.info(f'adding user to watcher: {twitch_user}')
-                await self.bot.twitch_irc._join(twitch_user)
-                self.twitch_irc_watchers.add(twitch_user)
+        `changes` maps twitch users to their SRL statetext, and `parts` are
+        channels to leave regardless. The blacklist is checked with a single
+        query and the joins and parts are sent one after another.
+        '''
+
+        blacklisted = blacklist.check_users(changes)
+        joins = set()
+        parts = {twitch_user for twitch_user in parts if twitch_user in self.twitch_irc_watchers}
+        for twitch_user, statetext in changes.items():
+            if twitch_user in blacklisted or statetext == 'Forfeit':
+                if twitch_user in self.twitch_irc_watchers:
+                    parts.add(twitch_user)
+            elif twitch_user not in self.twitch_irc_watchers:
+                joins.add(twitch_user)
+
+        for twitch_user in parts:
+            logger.info(f'removing user from watcher: {twitch_user}')
+            self.twitch_irc_watchers.discard(twitch_user)
+        for twitch_user in joins:
+            logger.info(f'adding user to watcher: {twitch_user}')
+            self.twitch_irc_watchers.add(twitch_user)
+        for twitch_user in parts:
+            await self.bot.twitch_irc._part(twitch_user)
+        for twitch_user in joins:
+            await self.bot.twitch_irc._join(twitch_user)
 
     async def add_time(self, user: str, time_data: Timestamp) -> None:
         '''Core function to handle tracking split data.
@@ -131,6 +321,13 @@ class Race:
         This function handles parsing and storing split data from livesplit.
         It appropriately handles skipped/undone splits, as well as controlling
         when splits should be announced to everybody when finished.
+
+        Splits from known runners are applied and announced right away, and
+        the roster is reconciled with SRL in the background afterwards. Only
+        a split from a runner the race doesn't know yet waits on SRL.
+
+        With a settle window, a runner's split events are held until they
+        stop for settle_window seconds, and only the net result is applied.
         '''
 
         split_data = self.tracked_splits[time_data.split_name]
@@ -138,31 +335,330 @@ class Race:
             logger.info(f'Could not process split {time_data.split_name}')
             return
 
-        await self.update_race()
+        if not self.runners.get(user):
+            await self.update_race()
+
+        if self.settle_window:
+            self._hold_split(user, split_data, time_data)
+        else:
+            await self._commit_split(user, split_data, [time_data])
+
+    def _hold_split(self, user: str, split_data: TrackedSplit, time_data: Timestamp) -> None:
+        key = user.casefold()
+        held = self.held_splits.setdefault(key, {})
+        held.setdefault(split_data.Position, (split_data, []))[1].append(time_data)
+        if not (settler := self.settlers.get(key)):
+            settler = self.settlers[key] = Debouncer(lambda: self._settle(user), self.settle_window,
+                                                     max(self.settle_window, SETTLE_MAX_DELAY))
+        settler.signal()
+
+    async def _settle(self, user: str) -> None:
+        '''Commits the split events held for a runner'''
+        for split_data, times in self.held_splits.pop(user.casefold(), {}).values():
+            await self._commit_split(user, split_data, times)
+
+    @staticmethod
+    def _net_split_time(recorded: Timestamp, times: list[Timestamp]) -> Timestamp:
+        '''Returns what a split ends up as after a series of split events
+
+        A '-' undoes a recorded split and skips a missing one, like in
+        RunnerSet.add_split_time. None means the split is not recorded.
+        '''
+        for time_data in times:
+            if type(time_data) == Timestamp:
+                recorded = time_data
+            else:
+                recorded = None if recorded is not None else time_data
+        return recorded
 
-        self.runners.add_split_time(user, split_data, time_data)
-        await self._check_subset_announcement(split_data)
+    def _apply_split(self, user: str, split_data: TrackedSplit, times: list[Timestamp]) -> bool:
+        '''Records the net result of a runner's split events
+
+        Returns False if the events cancelled out.
+        '''
+        runner = self.runners.get(user)
+        recorded = runner.recorded_time(split_data) if runner else None
+        final = self._net_split_time(recorded, times)
+        if len(times) > 1:
+            flips = len(times) - (final != recorded)
+            self.suppressed_flips += flips
+            logger.info(f'[{self.race_id}] Suppressed {flips} split events of {user} for {split_data.Name}, '
+                        f'{self.suppressed_flips} in this race')
+            if final == recorded:
+                return False
+            times = [final or SkipTimestamp(split_data.Name)]
+            if isinstance(final, SkipTimestamp) and recorded is not None:
+                # undo the recorded time before skipping
+                times.insert(0, final)
+
+        if runner:
+            self._runner_split(runner, any(type(time_data) == Timestamp for time_data in times))
+        for time_data in times:
+            if runner:
+                self._split_event(runner, split_data, time_data)
+            self.runners.add_split_time(user, split_data, time_data)
+        return True
+
+    async def _commit_split(self, user: str, split_data: TrackedSplit, times: list[Timestamp]) -> None:
+        '''Applies the net result of a runner's split events and announces it'''
+        if not self._apply_split(user, split_data, times):
+            return
+        runner = self.runners.get(user)
+        late = split_data.Position in self.early_splits
+        self._check_subset_announcement(split_data, runner)
         await self._check_split_announcement(split_data)
+        self._start_deadline(split_data)
+        if late and runner:
+            await self._announce_late_arrival(split_data, runner)
+        self._schedule_reconcile()
+
+    def ignore_runner(self, user: str, ignore: bool) -> bool:
+        '''Manually ignores or unignores a runner, returns False if they weren't found'''
+        if not (runner := self.runners.get(user)):
+            return False
+        self.auto_ignored.discard(runner)
+        runner.ignored = ignore
+        self.events.publish(RunnerIgnored(self.race_id, runner.name, ignore))
+        if ignore:
+            self._check_watcher_subsets(runner)
+        return True
+
+    def _check_watcher_subsets(self, runner: Runner) -> None:
+        '''Checks the subsets watching a runner that forfeited or was ignored
+
+        The runner no longer holds up their watchers, so every split someone
+        has reached may now be complete for them.
+        '''
+        if not self.runners.watchers.get(runner):
+            return
+        for tracked_split in self.tracked_splits:
+            if self.runners.split_mask(tracked_split):
+                self._check_subset_announcement(tracked_split, runner)
+
+    def set_watchlist(self, watcher: str, runners: str) -> set[str]:
+        '''Sets a runner's watchlist from a comma separated list of names'''
+        watched = self.runners.set_watchlist(watcher, runners)
+        if watched and (runner := self.runners.get(watcher)):
+            self.events.publish(WatchlistChanged(self.race_id, runner.name, tuple(sorted(watched))))
+        return watched
+
+    def update_settings(self, silenced: bool = None, spoiler: bool = None,
+                        announce_policy: AnnouncePolicy = None) -> None:
+        '''Changes the given settings of the race, the rest are kept'''
+        if silenced is not None:
+            self.silenced = silenced
+        if spoiler is not None:
+            self.spoiler = spoiler
+        if announce_policy is not None:
+            self.announce_policy = announce_policy
+        self.events.publish(SettingsChanged(self.race_id, self.silenced, self.spoiler,
+                                            self.announce_policy.top, self.announce_policy.percent))
+
+    def reset_watchlist(self, watcher: str) -> None:
+        self.runners.reset_watchlist(watcher)
+        if runner := self.runners.get(watcher):
+            self.events.publish(WatchlistChanged(self.race_id, runner.name, ()))
+
+    def _entrant_added(self, runner: Runner) -> None:
+        '''Counts a new entrant as absent until they join the livesplit room or split
+
+        Otherwise runners who never join the room would never be auto ignored.
+        Runners already in the room when the bot joined it are marked present
+        from its NAMES reply, which can come before they're added.
+        '''
+        if self.auto_ignore:
+            self.absent_since.setdefault(runner.name.casefold(), self._now())
+            self._start_presence_checks()
+
+    def _now(self) -> float:
+        return asyncio.get_event_loop().time()
+
+    def _runner_split(self, runner: Runner, real_split: bool) -> None:
+        '''Records that a runner split, and unignores them if they were auto ignored'''
+        now = self._now()
+        self.first_split_at = self.first_split_at or now
+        self.last_split_at[runner] = now
+        # splits come through the livesplit room, so the runner is in it
+        self.absent_since[runner.name.casefold()] = None
+        if real_split and runner in self.auto_ignored:
+            logger.info(f'[{self.race_id}] {runner.name} is splitting again, no longer ignoring them')
+            self.auto_ignored.discard(runner)
+            runner.ignored = False
+            self.events.publish(RunnerIgnored(self.race_id, runner.name, False, True))
+        self._start_presence_checks()
+
+    def runner_presence(self, name: str, present: bool) -> None:
+        '''Tracks a runner joining or leaving the livesplit room'''
+        if present:
+            self.absent_since[name.casefold()] = None
+        else:
+            self.absent_since[name.casefold()] = self._now()
+        self._start_presence_checks()
+
+    def _start_presence_checks(self) -> None:
+        key = (self.race_id, 'presence')
+        if self.auto_ignore and not self.finished and key not in self.timers:
+            self.timers.schedule(key, PRESENCE_CHECK_INTERVAL, self._presence_check)
+
+    async def _presence_check(self) -> None:
+        if self.finished or not self.auto_ignore:
+            return
+        if ignored := self.update_auto_ignores(self._now()):
+            await self._check_all_splits_announcement()
+            for runner in ignored:
+                self._check_watcher_subsets(runner)
+        self._start_presence_checks()
+
+    def update_auto_ignores(self, now: float) -> set[Runner]:
+        '''Ignores runners that left the livesplit room or stopped splitting
+
+        Returns the runners that were newly ignored. They're unignored as
+        soon as they split again.
+        '''
+
+        active = [runner for runner in self.runners if not runner.forfeit and not runner.finished]
+        if not active:
+            return set()
+        median = statistics.median_low(runner.latest_split[0].Position for runner in active)
+
+        ignored = set()
+        for runner in active:
+            if runner.ignored:
+                continue
+            left = self.absent_since.get(runner.name.casefold())
+            # nobody splits before the race starts, so the absence clock starts with it
+            absent = left is not None and self.first_split_at is not None and \
+                now - max(left, self.first_split_at) >= ABSENT_GRACE
+            last = self.last_split_at.get(runner, self.first_split_at)
+            stale = last is not None and now - last >= STALE_SECONDS and \
+                median - runner.latest_split[0].Position >= STALE_SPLITS
+            if absent or stale:
+                reason = 'left the livesplit room' if absent else 'stopped splitting'
+                logger.info(f'[{self.race_id}] Ignoring {runner.name}, they {reason}')
+                runner.ignored = True
+                self.auto_ignored.add(runner)
+                self.events.publish(RunnerIgnored(self.race_id, runner.name, True, True))
+                ignored.add(runner)
+        return ignored
+
+    def _schedule_reconcile(self) -> None:
+        '''Starts a background roster reconcile if one isn't already queued'''
+        self.reconcile_pending = True
+        if self.reconcile_task is None or self.reconcile_task.done():
+            self.reconcile_task = asyncio.ensure_future(self._reconcile())
+
+    async def _reconcile(self) -> None:
+        '''Updates the roster from SRL and corrects outdated announcements
+
+        Splits announced before the update are announced again if the new
+        roster changes their standings, e.g. when a runner had forfeited.
+        Runs again if more splits came in while it was updating.
+        '''
+
+        try:
+            while self.reconcile_pending and not self.finished:
+                self.reconcile_pending = False
+                announced, self.unreconciled = self.unreconciled, {}
+                await self.update_race()
+                for split, sent in announced.values():
+                    times_str, large_race = self._split_announcement(split, self.runners, False)
+                    if times_str != sent:
+                        logger.info(f'[{self.race_id}] Correcting announcement of split {split.Name}')
+                        self._send_announcement(split, f'Correction: {times_str}',
+                                                self.twitch_irc_watchers, large_race)
+        except Exception as e:
+            logger.warning(f'[{self.race_id}] Failed to reconcile race: {str(e)}')
 
-    async def _check_subset_announcement(self, tracked_split) -> None:
+    def _check_subset_announcement(self, tracked_split, runner=None) -> None:
         '''Handles checking and announcing subset watchers.
 
-        This function iterates through all its runners and checks if the given
-        split should be announced for that runner
+        This function checks the watchers of the runner that split (or every
+        watcher if no runner is given) and announces the split to the ones
+        whose watched runners are all done. Watchers with the same watchlist
+        share one announcement.
         '''
 
-        runners = self.runners.check_subset_announce(tracked_split)
-        for runner in runners:
-            runner_set = {self.runners.get(name) for name in runner.watched_runners}
-            await self._announce_split(tracked_split, runner_set, {runner.twitch_user}, True)
+        groups = self.runners.subset_announce_groups(tracked_split, runner)
+        for watched, watchers in groups.items():
+            self.events.publish(WatchedSplitAnnounced(self.race_id, tracked_split.Name,
+                                                      tuple(sorted(watcher.name for watcher in watchers))))
+            self._announce_split(tracked_split, watched, {watcher.twitch_user for watcher in watchers}, True)
 
     async def _check_split_announcement(self, tracked_split) -> None:
-        '''Checks the given split and announce if ready.'''
-        announce, finish = self.runners.check_global_announce(tracked_split)
+        '''Checks the given split and announce if ready.
+
+        Depending on the announce policy, a split can be announced before
+        every runner has it. The rest then get late arrival updates.
+        '''
+        announce, finish = self.runners.check_global_announce(tracked_split, self.announce_policy)
         if finish:
             await self._handle_finish_race()
         elif announce:
-            await self._announce_split(tracked_split, self.runners, self.twitch_irc_watchers)
+            early = tracked_split not in self.announced_splits and \
+                not self.runners.split_is_complete(tracked_split)
+            self._announce_split(tracked_split, self.runners, self.twitch_irc_watchers)
+            if early:
+                logger.info(f'[{self.race_id}] Announced split {tracked_split.Name} early ({self.announce_policy})')
+                self._mark_early(tracked_split)
+
+    def _mark_early(self, tracked_split: TrackedSplit) -> None:
+        '''Marks a split as announced before every runner had it'''
+        self.early_splits.add(tracked_split.Position)
+        self.events.publish(SplitAnnouncedEarly(self.race_id, tracked_split.Name))
+        # later times are late arrivals, not corrections
+        self.unreconciled.pop(tracked_split.Position, None)
+
+    def _deadline_key(self, tracked_split: TrackedSplit) -> tuple:
+        return self.race_id, tracked_split.Position
+
+    def _start_deadline(self, tracked_split: TrackedSplit) -> None:
+        '''Starts the split's deadline when the first runner hits it'''
+        if self.split_deadline and not self.finished and tracked_split.Name != 'Done' and \
+                tracked_split not in self.announced_splits and \
+                (key := self._deadline_key(tracked_split)) not in self.timers:
+            self.timers.schedule(key, self.split_deadline, lambda: self._deadline_expired(tracked_split))
+
+    def _deadline_expired(self, tracked_split: TrackedSplit) -> None:
+        '''Announces a split for the runners that have it once its deadline passed'''
+        if self.finished or tracked_split in self.announced_splits:
+            return
+        logger.info(f'[{self.race_id}] Deadline passed for split {tracked_split.Name}, announcing it')
+        self._announce_split(tracked_split, self.runners, self.twitch_irc_watchers)
+        self._mark_early(tracked_split)
+
+    async def _announce_late_arrival(self, split: TrackedSplit, runner: Runner) -> None:
+        '''Queues a runner's time for a split that was announced early
+
+        Late arrivals are held for late_arrival_window seconds after the last
+        one, so the runners that trickle in on the same split are announced
+        together in one line per chat.
+        '''
+        _, runners = self.late_arrivals.setdefault(split.Position, (split, []))
+        if runner not in runners:
+            runners.append(runner)
+        if self.runners.split_is_complete(split):
+            self.early_splits.discard(split.Position)
+
+        if not self.late_arrival_window:
+            await self._send_late_arrivals()
+            return
+        if not self.late_debouncer:
+            self.late_debouncer = Debouncer(self._send_late_arrivals, self.late_arrival_window,
+                                            max(self.late_arrival_window, LATE_ARRIVAL_MAX_DELAY))
+        self.late_debouncer.signal()
+
+    async def _send_late_arrivals(self) -> None:
+        '''Announces the queued late arrivals, one line per split, in place order'''
+        late_arrivals, self.late_arrivals = self.late_arrivals, {}
+        for split, runners in late_arrivals.values():
+            placed = sorted(((position[0], runner) for runner in runners
+                             if (position := self.runners.split_position(runner, split))),
+                            key=lambda entry: entry[0])
+            if not placed:
+                continue
+            label = 'late arrival' if len(placed) == 1 else 'late arrivals'
+            standings = '. '.join(f'{place}. {runner.announcement_standing_str(split)}' for place, runner in placed)
+            self._send_announcement(split, f'{split.Name} {label}: {standings}', self.twitch_irc_watchers, False)
 
     async def _check_all_splits_announcement(self) -> None:
         '''Calls _check_split_announcement on all splits.'''
@@ -178,9 +674,15 @@ class Race:
         listen for inputs.
         '''
 
+        # splits held in the settle window come before the finish
+        if settler := self.settlers.get(user.casefold()):
+            await settler.flush()
+
         split_data = self.tracked_splits['Done']
+        if (runner := self.runners.get(user)) and not isinstance(time_data, SkipTimestamp):
+            self.events.publish(RunnerFinished(self.race_id, runner.name, time_data.total_ms))
         self.runners.finish_user(user, split_data, time_data)
-        await self._check_subset_announcement(split_data)
+        self._check_subset_announcement(split_data, self.runners.get(user))
 
         if self.runners.finished:
             await self._handle_finish_race()
@@ -188,31 +690,139 @@ class Race:
     async def _handle_finish_race(self) -> None:
         '''Finish race routine.
 
-        Handles announcing the final split, posting results to Discord,
-        cleaning up IRCs, and marking race as finished in the database.
+        Handles announcing the final split, cleaning up IRCs, and marking race
+        as finished in the database. The results are published as a
+        RaceFinished event for the bot to post to Discord.
         '''
 
-        tracked_split = self.tracked_splits['Done']
-        await self._announce_split(tracked_split, self.runners,
-                                  self.twitch_irc_watchers)
+        if self.finished:
+            return
+        # marked before the first await so an overlapping check can't finish it again
         self.finished = True
+        # announce what's still held in the settle window before the results
+        for settler in list(self.settlers.values()):
+            await settler.flush()
+        if self.late_debouncer:
+            await self.late_debouncer.flush()
+        tracked_split = self.tracked_splits['Done']
+        self._announce_split(tracked_split, self.runners, self.twitch_irc_watchers)
 
+        self.cancel_jobs()
+        self.discard_journal()
+        # the last announcements go out before the chats are left
+        await self.events.drain('twitch')
         await self.disconnect_ircs()
         race_db.update_race(self.race_id, True)
 
-        # Post results to discord
-        standings = f'Race {self.race_id} results:\n\n{self.runners.standings(self.spoiler)}'
-        try:
-            await self.bot.send_message(standings, cfg.RACE_BOT_CHANNEL_ID)
-            self.announcement_msg = await self.bot.send_message(standings, cfg.RED_RACE_CHANNEL_ID)
+        self.events.publish(RaceFinished(self.race_id, f'Race {self.race_id} results:\n\n{self.runners.standings(self.spoiler)}'))
+
+    def summary(self) -> RaceSummary:
+        '''Compacts the race into its final results'''
+        results = f'Race {self.race_id} results:\n\n{self.runners.standings(False)}'
+        return RaceSummary(self.race_id, results, len(self.runners))
+
+    def cancel_jobs(self) -> None:
+        '''Cancels every pending timer and scheduled job of the race'''
+        self.roster_debouncer.cancel()
+        self.timers.cancel((self.race_id, 'presence'))
+        for settler in self.settlers.values():
+            settler.cancel()
+        # held split events are recorded rather than dropped
+        for user, held in self.held_splits.items():
+            for split_data, times in held.values():
+                self._apply_split(user, split_data, times)
+        self.held_splits.clear()
+        if self.late_debouncer:
+            self.late_debouncer.cancel()
+        self.late_arrivals.clear()
+        for tracked_split in self.tracked_splits:
+            self.timers.cancel(self._deadline_key(tracked_split))
+        self.scheduler.cancel(self.race_id)
+
+    def _split_event(self, runner: Runner, split_data: TrackedSplit, time_data: Timestamp) -> None:
+        '''Publishes a runner's split event before it's applied'''
+        if type(time_data) == Timestamp:
+            self.events.publish(SplitRecorded(self.race_id, runner.name, split_data.Name, time_data.total_ms))
+        elif runner.completed_split(split_data):
+            self.events.publish(SplitUndone(self.race_id, runner.name, split_data.Name))
+        else:
+            self.events.publish(SplitSkipped(self.race_id, runner.name, split_data.Name))
 
-            for _ in range(2):
-                logger.info('Sleeping for 60 seconds before updating comments')
-                await asyncio.sleep(60)
-                await self.update_race_comments()
+    def start_journal(self, race_journal: Journal) -> None:
+        '''Journals the race's events from now on, so it can be recovered'''
+        self.journals.attach(self.race_id, race_journal)
 
-        except Exception as e:
-            logger.info(f'Failed to send message: {str(e)}')
+    def discard_journal(self) -> None:
+        '''Deletes the journal, the race doesn't need to be recovered anymore'''
+        self.journals.discard(self.race_id)
+
+    def replay(self, events: list[dict]) -> None:
+        '''Applies journaled events to the race without announcing anything
+
+        The runners have to be added from SRL first. Events of runners that
+        are no longer in the race are skipped.
+        '''
+
+        for event in events:
+            kind = event['event']
+            name = 'Done' if kind == 'RunnerFinished' else event.get('split')
+            split = self.tracked_splits[name] if name else None
+            if name and not split:
+                logger.info(f'[{self.race_id}] Skipping journaled {kind} of unknown split {name}')
+                continue
+            if kind in ('SplitRecorded', 'SplitUndone', 'SplitSkipped'):
+                time_data = from_ms(event['ms'], name) if kind == 'SplitRecorded' else SkipTimestamp(name)
+                self.runners.add_split_time(event['runner'], split, time_data)
+            elif kind == 'RunnerFinished':
+                self.runners.finish_user(event['runner'], split, from_ms(event['ms'], name))
+            elif kind == 'RunnerIgnored':
+                if runner := self.runners.get(event['runner']):
+                    runner.ignored = event['ignored']
+                    if event['auto'] and event['ignored']:
+                        self.auto_ignored.add(runner)
+                    else:
+                        self.auto_ignored.discard(runner)
+            elif kind == 'WatchlistChanged':
+                if event['watched']:
+                    self.runners.set_watchlist(event['runner'], ','.join(event['watched']))
+                else:
+                    self.runners.reset_watchlist(event['runner'])
+            elif kind == 'WatcherAdded':
+                self.twitch_irc_watchers.add(event['watcher'])
+            elif kind == 'SettingsChanged':
+                self.silenced = event['silenced']
+                self.spoiler = event['spoiler']
+                self.announce_policy = AnnouncePolicy(event['top'], event['percent'])
+            elif kind == 'WatchedSplitAnnounced':
+                for watcher in event['watchers']:
+                    if runner := self.runners.get(watcher):
+                        runner.announced_watched_splits.add(name)
+            elif kind == 'SplitCompleted':
+                if split not in self.announced_splits:
+                    self.announced_splits.append(split)
+            elif kind == 'SplitAnnouncedEarly':
+                self.early_splits.add(split.Position)
+
+    async def recover(self, events: list[dict]) -> bool:
+        '''Rebuilds an unfinished race after a restart
+
+        The runners are added from SRL, which also rejoins their twitch
+        channels, and the journal is replayed on top. External watchers'
+        channels are rejoined after the replay. Splits that completed while
+        the bot was down are announced afterwards. Returns False if the race
+        couldn't be found on SRL.
+        '''
+
+        if not (race_data := await self.srl_cache.get()):
+            return False
+        await self._update_runners(race_data.entrants)
+        runner_chats = set(self.twitch_irc_watchers)
+        self.replay(events)
+        for watcher in self.twitch_irc_watchers - runner_chats:
+            await self.bot.twitch_irc._join(watcher)
+        logger.info(f'[{self.race_id}] Recovered race from {len(events)} journaled events')
+        await self._check_all_splits_announcement()
+        return True
 
     async def disconnect_ircs(self) -> None:
         '''Disconnects from all current irc channels'''
@@ -223,15 +833,35 @@ class Race:
         logger.info(f'Leaving SRL channel: {self.srl_livesplit_ch_name}')
         await self.bot.srl_irc._part(self.srl_livesplit_ch_name)
 
-    async def _announce_split(self, split: TrackedSplit, runners: set[Runner],
+    def _announce_split(self, split: TrackedSplit, runners: set[Runner],
                              watchers: set[str], subset=False) -> None:
         '''Announces split to the subset of runners'''
         if split in self.announced_splits:
             logger.info(f'Split {split.Name} has already been announced.')
             return
 
-        times_str = self.runners.split_standings(split, runners)
-
+        times_str, large_race = self._split_announcement(split, runners, subset)
+        if not subset:
+            # only mark the split as announced if it's globally sent and not a
+            # subset, before sending so an overlapping check can't send it again
+            self.announced_splits.append(split)
+            self.events.publish(SplitCompleted(self.race_id, split.Name, times_str))
+            self.timers.cancel(self._deadline_key(split))
+            self.unreconciled[split.Position] = (split, times_str)
+
+        self._send_announcement(split, times_str, watchers, large_race)
+
+    def _split_announcement(self, split: TrackedSplit, runners: set[Runner],
+                            subset: bool) -> Tuple[str, bool]:
+        '''Returns the split standings to announce and if it's a large race'''
+        if not subset and len(self.runners) >= self.large_race_size:
+            return self.runners.top_split_standings(split, self.large_race_top), True
+        return self.runners.split_standings(split, runners), False
+
+    def _send_announcement(self, split: TrackedSplit, times_str: str,
+                           watchers: set[str], large_race: bool) -> None:
+        '''Publishes the split standings for every chat that should get them'''
+        sends = []
         for chat in watchers:
             if self.silenced:
                 logger.info(f'Skipping sending {times_str} to {chat} due to being silenced.')
@@ -239,11 +869,25 @@ class Race:
                 logger.info(f'Skipping sending {times_str} to {chat} due to being blacklisted.')
             else:
                 logger.info(f'[{self.race_id}] Announcing split {split.Name} in {chat}\'s chat')
-                await self.bot.twitch_irc.send(times_str, chat)
+                msg = times_str
+                if large_race and (position := self._position_str(split, chat)):
+                    msg = f'{times_str} | {position}'
+                sends.append((chat, msg))
+        if sends:
+            self.events.publish(Announcement(self.race_id, split.Name, tuple(sends)))
 
-        if not subset:
-            # only mark the split as announced if it's globally sent and not a subset
-            self.announced_splits.append(split)
+    def _position_str(self, split: TrackedSplit, chat: str) -> str:
+        '''Returns the position text for the runner whose chat this is
+
+        Runners that are already in the top standings don't get one.
+        '''
+
+        runner = self.runners.get(chat)
+        if runner and runner.twitch_user == chat and \
+                (position := self.runners.split_position(runner, split)) and \
+                position[0] > self.large_race_top:
+            return self.runners.position_str(runner, split)
+        return ''
 
     async def add_external_watcher(self, watcher) -> bool:
         '''Adds a twitch channel to the watcher list.
@@ -257,12 +901,14 @@ class Race:
             logger.info(f'adding external user to watcher: {watcher}')
             await self.bot.twitch_irc._join(watcher)
             self.twitch_irc_watchers.add(watcher)
+            self.events.publish(WatcherAdded(self.race_id, watcher))
             added = True
 
         return added
 
     async def update_race_comments(self) -> None:
         '''Updates the race result message with comments'''
+        self.srl_cache.invalidate()
         await self.update_race()
         standings = f'Race {self.race_id} results:\n\n{self.runners.standings(self.spoiler)}'
         if self.announcement_msg:
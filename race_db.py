@@ -45,6 +45,10 @@ def check_race(race) -> bool:
 
     return bool(RaceDB.get_or_none(RaceDB.race_id == race))
 
+def unfinished_races() -> list[str]:
+    '''Returns the ids of the races in the database that are not finished'''
+    return [r.race_id for r in RaceDB.select().where(RaceDB.finished == False)]
+
 def delete_all_active_races() -> int:
     '''Deletes all races if they are not finished'''
     rows = RaceDB.delete().where(RaceDB.finished == False).execute()
@@ -1,70 +1,346 @@
 from srlmodels import SRLEntrant
-from trackedsplits import TrackedSplit
-from timestamp import SkipTimestamp, Timestamp, BlankTimestamp, ForfeitTimestamp
+from trackedsplits import TrackedSplit, TrackedSplits
+from timestamp import SkipTimestamp, Timestamp, BlankTimestamp, ForfeitTimestamp, from_ms
+from array import array
+from dataclasses import dataclass
 from typing import Tuple
+import bisect
+import itertools
 import logging
+import math
+import sys
 
 logger = logging.getLogger('main')
 
+# shared by every runner and runner set, so a version is never reused
+# even when a race swaps out its RunnerSet
+versions = itertools.count(1)
+
+def render_cached(cache: dict, key, version: int, render) -> str:
+    '''Returns the cached rendering of key if it was made at this version
+
+    Otherwise render is called and its result is cached against the version.
+    '''
+    if (entry := cache.get(key)) is not None and entry[0] == version:
+        return entry[1]
+    rendered = render()
+    cache[key] = (version, rendered)
+    return rendered
+
+# runners store split times as ms, with these for splits without a time
+UNRECORDED_MS = -1
+SKIPPED_MS = -2
+# segments can be negative when a runner's splits are out of order
+NO_SEGMENT = -(1 << 63)
+
+def remap_positions(catalog: dict[int, TrackedSplit], tracked_splits: TrackedSplits) -> dict[int, TrackedSplit]:
+    '''Maps the positions of a catalog to the splits with the same name in a new one
+
+    A split missing from the new catalog keeps its position if no new split
+    took it, otherwise it maps to None.
+    '''
+    positions = {}
+    for position, split in catalog.items():
+        if not (new := tracked_splits[split.Name]) and tracked_splits.by_position(position) is None:
+            new = split
+        positions[position] = new
+    return positions
+
+FORFEIT_SPLIT = TrackedSplit(-1, 'Forfeit')
+NA_SPLIT = TrackedSplit(0, 'N/A')
+
+@dataclass(frozen=True)
+class AnnouncePolicy:
+    '''When a split is globally announced
+
+    By default a split is announced once every runner has it. With `top`
+    and/or `percent` set, it is announced once that many runners, or that
+    percent of the runners still in the race, have a time for it.
+    '''
+
+    top: int = 0
+    percent: int = 0
+
+    def quorum(self, field: int) -> int:
+        '''Returns how many runners of the field need a time for the split'''
+        needed = field
+        if self.top:
+            needed = min(needed, self.top)
+        if self.percent:
+            needed = min(needed, math.ceil(field * self.percent / 100))
+        return needed
+
+    def __str__(self) -> str:
+        rules = []
+        if self.top:
+            rules.append(f'top {self.top}')
+        if self.percent:
+            rules.append(f'{self.percent}%')
+        return ' or '.join(rules) or 'all'
+
 class Runner:
     '''Represents a runner in a race.
 
     This class holds data relevant to a runner in a given race. It tracks data
     such as their entrant info from SRL, as well as race specific data like
     split times and forfeit status.
+
+    Only the SRL fields the bot uses are kept, and split times are stored as
+    ms in an array indexed by split position. Timestamps are built when a
+    time is read, and the TrackedSplit of each position comes from a catalog
+    shared with the runner's RunnerSet. Big community races have a lot of
+    runners, so the class uses __slots__.
+
+    Every change bumps the runner's version, and rendered standing strings
+    are cached against it.
     '''
 
+    __slots__ = ('version', '_rendered', 'runner_set', 'slot', '_name', '_twitch_user', '_message',
+                 '_forfeit', '_finished', '_ignored', '_catalog', '_times',
+                 '_latest', 'watched', '_segments', 'ranked_ms', 'announced_watched_splits')
+
     def __init__(self, srl_data: SRLEntrant):
-        self.splits = {} # key = trackedSplit, value = timestamp
-        self.srl_data = srl_data
-        self.name = self.srl_data.displayname
-        self.twitch_user = self.srl_data.twitch.lower()
+        self.version = next(versions)
+        self._rendered = {} # key = rendering, value = (version, str)
+        self.runner_set = None # RunnerSet that indexes this runner
+        self.slot = None # stable slot number assigned by the RunnerSet
+        self._name = self._twitch_user = self._message = ''
+        self._forfeit = self._finished = self._ignored = False
+        self._catalog = None # key = split position, value = trackedSplit, shared with the RunnerSet
+        self._times = array('q') # index = split position, value = ms or a sentinel
+        self._latest = None # furthest non-skipped split position
+        self.name = sys.intern(srl_data.displayname)
+        self.twitch_user = sys.intern(srl_data.twitch.lower())
         self.forfeit = srl_data.statetext == 'Forfeit'
         self.message = srl_data.message
         self.finished = False
-        self.watched_runners = set() # str
+        self.watched = set() # runners this runner is watching
+        self._segments = array('q') # index = split position, value = ms since the previous split
+        self.ranked_ms = array('q') # index = split position, value = ms in the RunnerSet's split order
         self.ignored = False
         self.announced_watched_splits = set() # trackedsplit
 
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, name: str) -> None:
+        self._rename(name, self._twitch_user)
+
+    @property
+    def twitch_user(self) -> str:
+        return self._twitch_user
+
+    @twitch_user.setter
+    def twitch_user(self, twitch_user: str) -> None:
+        self._rename(self._name, twitch_user)
+
+    def _rename(self, name: str, twitch_user: str) -> None:
+        '''Updates the names and keeps the owning RunnerSet index in sync'''
+        if self.runner_set is not None:
+            self.runner_set.unindex(self)
+        self._name, self._twitch_user = name, twitch_user
+        if self.runner_set is not None:
+            self.runner_set.index(self)
+        self._changed()
+
+    @property
+    def forfeit(self) -> bool:
+        return self._forfeit
+
+    @forfeit.setter
+    def forfeit(self, forfeit: bool) -> None:
+        self._forfeit = forfeit
+        self._changed()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    @finished.setter
+    def finished(self, finished: bool) -> None:
+        self._finished = finished
+        self._changed()
+
+    @property
+    def ignored(self) -> bool:
+        return self._ignored
+
+    @ignored.setter
+    def ignored(self, ignored: bool) -> None:
+        self._ignored = ignored
+        self._changed()
+
+    @property
+    def watched_runners(self) -> set[str]:
+        '''Returns the twitch names of the runners this runner is watching'''
+        return {runner.twitch_user for runner in self.watched}
+
+    @watched_runners.setter
+    def watched_runners(self, names: set[str]) -> None:
+        if self.runner_set is not None:
+            self.runner_set.set_watched(self, {self.runner_set.get(name) for name in names} - {None})
+
+    @property
+    def bit(self) -> int:
+        '''Returns the bit of this runner in its RunnerSet's split masks'''
+        return 1 << self.slot
+
+    @property
+    def message(self) -> str:
+        return self._message
+
+    @message.setter
+    def message(self, message: str) -> None:
+        self._message = message
+        self._changed()
+
+    def _changed(self) -> None:
+        '''Tells the owning RunnerSet that this runner's standing changed'''
+        self.version = next(versions)
+        if self.runner_set is not None:
+            self.runner_set.runner_changed(self)
+
+    @property
+    def aliases(self) -> set[str]:
+        '''Returns the casefolded names this runner can be looked up by'''
+        return {alias.casefold() for alias in (self._name, self._twitch_user) if alias}
+
+    @property
+    def splits(self) -> dict[TrackedSplit, Timestamp]:
+        '''Returns a snapshot of the recorded splits, keyed by TrackedSplit'''
+        return dict(self.recorded_splits())
+
+    def recorded_splits(self):
+        '''Yields every recorded (TrackedSplit, Timestamp) in split order'''
+        for position, ms in enumerate(self._times):
+            if ms != UNRECORDED_MS:
+                split = self._catalog[position]
+                yield split, self._timestamp(split, ms)
+
+    def recorded_time(self, split: TrackedSplit) -> Timestamp:
+        '''Returns the raw recorded Timestamp for a split, or None'''
+        if 0 <= split.Position < len(self._times):
+            return self._timestamp(split, self._times[split.Position])
+
+    def recorded_ms(self, split: TrackedSplit) -> int:
+        '''Returns the real time recorded for a split in ms, or None if skipped or missing'''
+        if 0 <= split.Position < len(self._times) and (ms := self._times[split.Position]) >= 0:
+            return ms
+
+    @staticmethod
+    def _timestamp(split: TrackedSplit, ms: int) -> Timestamp:
+        if ms == UNRECORDED_MS:
+            return None
+        if ms == SKIPPED_MS:
+            return SkipTimestamp(split.Name)
+        return from_ms(ms, split.Name)
+
     def update_status(self, statetext: str) -> None:
         self.forfeit = statetext == 'Forfeit'
         if self.forfeit:
             self.finished = True
 
     def add_split(self, split: TrackedSplit, time: Timestamp) -> None:
-        self.splits[split] = time
+        position = split.Position
+        if self._catalog is None:
+            self._catalog = {}
+        self._catalog[position] = split
+        if position >= len(self._times):
+            # sized for the furthest split of the set, so most runners allocate once
+            size = max(self._catalog) + 1
+            self._times.extend(array('q', [UNRECORDED_MS]) * (size - len(self._times)))
+        self._times[position] = SKIPPED_MS if isinstance(time, SkipTimestamp) else time.total_ms
+        if self.runner_set is not None:
+            self.runner_set.mark_split(self, split, True)
+        if isinstance(time, SkipTimestamp):
+            if position == self._latest:
+                self._latest = self._find_latest()
+        elif self._latest is None or position >= self._latest:
+            self._latest = position
+        self._update_segments(position)
+        self._changed()
 
     def undo_split(self, split: TrackedSplit) -> None:
-        del self.splits[split]
+        if self.recorded_time(split) is None:
+            raise KeyError(split)
+        self._times[split.Position] = UNRECORDED_MS
+        if self.runner_set is not None:
+            self.runner_set.mark_split(self, split, False)
+        if split.Position == self._latest:
+            self._latest = self._find_latest()
+        self._update_segments(split.Position)
+        self._changed()
+
+    @property
+    def segments(self) -> list[Tuple[TrackedSplit, int]]:
+        '''Returns the (trackedSplit, ms since the previous split) pairs in split order'''
+        return [(self._catalog[position], ms) for position, ms in enumerate(self._segments)
+                if ms != NO_SEGMENT]
+
+    def _update_segments(self, position: int) -> None:
+        '''Updates the split-to-split times after the time at a position changed
+
+        Only the segment ending at the position and the one after it change.
+        '''
+        times = self._times
+        if len(self._segments) < len(times):
+            self._segments.extend(array('q', [NO_SEGMENT]) * (len(times) - len(self._segments)))
+        previous_ms = next((times[before] for before in range(position - 1, -1, -1) if times[before] >= 0), 0)
+        if (ms := times[position]) >= 0:
+            self._segments[position] = ms - previous_ms
+            previous_ms = ms
+        else:
+            self._segments[position] = NO_SEGMENT
+        if (after := next((after for after in range(position + 1, len(times)) if times[after] >= 0), None)) is not None:
+            self._segments[after] = times[after] - previous_ms
+
+    def _find_latest(self) -> int:
+        '''Finds the furthest non-skipped split position, used when it changes'''
+        for position in range(len(self._times) - 1, -1, -1):
+            if self._times[position] >= 0:
+                return position
+
+    def remap_splits(self, positions: dict[int, TrackedSplit]) -> None:
+        '''Moves the split times to the positions of a new catalog
+
+        positions comes from remap_positions, times of splits mapped to None
+        are dropped. A RunnerSet remaps the catalog it shares with its runners
+        itself, a runner outside of one remaps its own.
+        '''
+        if self.runner_set is None and self._catalog:
+            self._catalog = {new.Position: new for new in positions.values() if new}
+        size = max((new.Position + 1 for new in positions.values() if new), default=0)
+        times = array('q', [UNRECORDED_MS]) * size
+        for position, ms in enumerate(self._times):
+            if ms != UNRECORDED_MS and (new := positions.get(position)):
+                times[new.Position] = ms
+        self._times = times
+        self._segments = array('q')
+        for position in range(len(times)):
+            self._update_segments(position)
+        self._latest = self._find_latest()
+        self._changed()
 
     @property
     def latest_split(self) -> Tuple[TrackedSplit, Timestamp]:
         '''Returns the latest split that the user has completed.
 
-        Skipped splits count as completed, and the order is determined by the
-        position of the TrackedSplit in self.splits.
+        Skipped splits do not count as completed, and the order is determined
+        by the position of the TrackedSplit. The furthest split is tracked as
+        splits are added and undone, so this does not scan the splits.
 
         If the user is forfeit, return a "forfeit" split.
         '''
 
-        split = ts = None
         if self.forfeit:
-            split = TrackedSplit(-1, 'Forfeit')
-            ts = ForfeitTimestamp()
-            # ts = Timestamp('Forfeit', True)
-        else:
-            splits = [x for x in self.splits.keys() if not isinstance(self.get_split_time(x), SkipTimestamp)]
-
-            if highest_key := sorted(splits, key=lambda x: x.Position, reverse=True):
-                highest_key = highest_key[0]
-                split = highest_key
-                ts = self.splits[highest_key]
-            else:
-                # default to sending blank split if user has not FF but no split exists
-                split = TrackedSplit(0, 'N/A')
-                ts = BlankTimestamp()
-
-        return split, ts
+            return FORFEIT_SPLIT, ForfeitTimestamp()
+        if self._latest is None:
+            # default to sending blank split if user has not FF but no split exists
+            return NA_SPLIT, BlankTimestamp()
+        split = self._catalog[self._latest]
+        return split, self._timestamp(split, self._times[self._latest])
 
     @property
     def latest_split_order(self) -> Tuple[int, int, str]:
@@ -72,8 +348,10 @@ class Runner:
 
         Returns the Split Position, time in MS, and the runners name.
         '''
-        split, ts = self.latest_split
-        return split.Position * -1, ts.total_ms, self.name
+        if self.forfeit or self._latest is None:
+            split, ts = self.latest_split
+            return split.Position * -1, ts.total_ms, self.name
+        return self._latest * -1, self._times[self._latest], self.name
 
     def split_order(self, split: TrackedSplit) -> Tuple[int, str]:
         '''Ordering mechanism for sorting racers with a defined split
@@ -96,24 +374,27 @@ class Runner:
             return ForfeitTimestamp()
         if self.ignored:
             return BlankTimestamp()
-        if split in self.splits:
-            return self.splits[split]
+        return self.recorded_time(split)
 
     def completed_split(self, split: TrackedSplit) -> bool:
         '''Returns True if the runner has completed the split'''
-        return split in self.splits
+        return self.recorded_time(split) is not None
 
     def user_matches(self, name: str) -> bool:
         '''Returns true if a name matches this user's twitch or display name'''
-        return name.lower() in {self.name.lower(), self.twitch_user.lower()}
+        return name.casefold() in self.aliases
 
     def announcement_standing_str(self, split: TrackedSplit) -> str:
         '''Creates the announcement standing text'''
-        split_time = self.get_split_time(split).time_string
-        return f'{self.name} - {split_time}'
+        return render_cached(self._rendered, ('announcement', split.Position), self.version,
+                             lambda: f'{self.name} - {self.get_split_time(split).time_string}')
 
     def latest_standing_str(self, race_finished=False, comments=False) -> str:
         '''Creates the latest standing text'''
+        return render_cached(self._rendered, ('latest', race_finished, comments), self.version,
+                             lambda: self._latest_standing_str(race_finished, comments))
+
+    def _latest_standing_str(self, race_finished: bool, comments: bool) -> str:
         split, ts = self.latest_split
         split_details = f'{ts.time_string}'
 
@@ -129,18 +410,297 @@ class Runner:
 
         return f'{self.name}: {split_details}'
 
+    def segments_str(self) -> str:
+        '''Creates the segment times text'''
+        if not self.segments:
+            return f'{self.name} has no splits yet'
+        segments = ' | '.join(f'{split.Name} {"-" if ms < 0 else ""}{from_ms(abs(ms)).time_string}'
+                              for split, ms in self.segments)
+        return f'{self.name} segments: {segments}'
+
     def __repr__(self) -> str:
         return f'Runner: {self.twitch_user}, Status: {self.forfeit}'
 
 class RunnerSet(set):
+    '''Set of runners in a race
+
+    Runners are indexed by their casefolded display and twitch names, so
+    lookups by either name do not depend on the size of the race. The index
+    is kept in sync when runners are added, removed or renamed.
+
+    The overall standings order is also kept sorted as runners change. The
+    set's version is bumped whenever a runner changes, is added or removed,
+    and the rendered standings strings are cached against it.
+
+    Every runner gets a stable slot, and its bit is set in a mask per split
+    when it has the split, as well as in the forfeit, ignored and finished
+    masks. Completion checks are then mask comparisons instead of scans.
+    '''
+
+    def __init__(self, runners=()):
+        super().__init__()
+        self.aliases = {} # key = casefolded name, value = runner
+        self.next_slot = 0
+        self.order = [] # sorted list of (latest_split_order, slot)
+        self.order_keys = {} # key = runner, value = entry in self.order
+        self.slots = {} # key = slot, value = runner
+        self.version = next(versions)
+        self._rendered = {} # key = rendering, value = (version, str)
+        self.watchers = {} # key = watched runner, value = set of runners watching it
+        self.all_mask = 0
+        self.split_masks = {} # key = split position, value = mask of runners with the split
+        self.forfeit_mask = self.ignored_mask = self.finished_mask = 0
+        self.split_orders = {} # key = split position, value = sorted list of (ms, slot)
+        self.catalog = {} # key = split position, value = trackedSplit, shared by the runners
+        for runner in runners:
+            self.add(runner)
+
+    def add(self, runner: Runner) -> None:
+        if runner not in self:
+            super().add(runner)
+            runner.runner_set = self
+            runner.slot = self.next_slot
+            self.next_slot += 1
+            self.slots[runner.slot] = runner
+            self.all_mask |= runner.bit
+            if runner._catalog:
+                self.catalog.update(runner._catalog)
+            runner._catalog = self.catalog
+            for split, _ in runner.recorded_splits():
+                self.mark_split(runner, split, True)
+            self.index(runner)
+            self.runner_changed(runner)
+
+    def remove(self, runner: Runner) -> None:
+        super().remove(runner)
+        self.unindex(runner)
+        self._remove_order(runner)
+        self.version = next(versions)
+        del self.slots[runner.slot]
+        keep = ~runner.bit
+        self.all_mask &= keep
+        self.forfeit_mask &= keep
+        self.ignored_mask &= keep
+        self.finished_mask &= keep
+        for split, _ in runner.recorded_splits():
+            self.mark_split(runner, split, False)
+        self.set_watched(runner, set())
+        for watcher in self.watchers.pop(runner, ()):
+            watcher.watched.discard(runner)
+        runner._catalog = dict(self.catalog)
+        runner.runner_set = None
+
+    def discard(self, runner: Runner) -> None:
+        if runner in self:
+            self.remove(runner)
+
+    def rebuilt_as(self, cls: type) -> 'RunnerSet':
+        '''Moves the runners and their watchlists into a new set of the given class'''
+        watched = {runner: set(runner.watched) for runner in self}
+        runners = sorted(self, key=lambda runner: runner.slot)
+        for runner in runners:
+            self.remove(runner)
+        rebuilt = cls(runners)
+        for runner, watching in watched.items():
+            rebuilt.set_watched(runner, watching)
+        return rebuilt
+
+    def index(self, runner: Runner) -> None:
+        '''Adds the runner's names to the lookup index'''
+        for alias in runner.aliases:
+            self.aliases.setdefault(alias, runner)
+
+    def unindex(self, runner: Runner) -> None:
+        '''Removes the runner's names from the lookup index'''
+        for alias in runner.aliases:
+            if self.aliases.get(alias) is runner:
+                del self.aliases[alias]
+
+    def runner_changed(self, runner: Runner) -> None:
+        '''Repositions a runner in the standings after its state changed
+
+        Only the changed runner is moved and re-rendered, the rest of the
+        standings order is left alone.
+        '''
+
+        ranked = not (self.forfeit_mask | self.ignored_mask) & runner.bit
+        self.forfeit_mask = self._set_bit(self.forfeit_mask, runner.bit, runner.forfeit)
+        self.ignored_mask = self._set_bit(self.ignored_mask, runner.bit, runner.ignored)
+        if ranked != (not runner.forfeit and not runner.ignored):
+            for split, _ in runner.recorded_splits():
+                self._rank_split(runner, split, True)
+        self.finished_mask = self._set_bit(self.finished_mask, runner.bit, runner.finished)
+
+        entry = (runner.latest_split_order, runner.slot)
+        if self.order_keys.get(runner) != entry:
+            self._remove_order(runner)
+            bisect.insort(self.order, entry)
+            self.order_keys[runner] = entry
+        self.version = next(versions)
+
+    @staticmethod
+    def _set_bit(mask: int, bit: int, value: bool) -> int:
+        return mask | bit if value else mask & ~bit
+
+    def split_mask(self, split: TrackedSplit) -> int:
+        '''Returns the mask of runners that have the split'''
+        return self.split_masks.get(split.Position, 0)
+
+    def mark_split(self, runner: Runner, split: TrackedSplit, completed: bool) -> None:
+        '''Sets or clears the runner's bit in the split's mask
+
+        Real split times are also kept in a sorted order per split, which is
+        used to answer gap and position queries without sorting the race.
+        '''
+
+        self.split_masks[split.Position] = self._set_bit(self.split_mask(split), runner.bit, completed)
+        self._rank_split(runner, split, completed)
+
+    def _rank_split(self, runner: Runner, split: TrackedSplit, completed: bool) -> None:
+        '''Keeps the runner's real split time in the split's sorted order
+
+        Forfeited and ignored runners are left out, so the index of an entry
+        is the runner's place at the split.
+        '''
+
+        position = split.Position
+        order = self.split_orders.setdefault(position, [])
+        if (entry := self._ranked_entry(runner, position)) is not None:
+            del order[bisect.bisect_left(order, entry)]
+            runner.ranked_ms[position] = UNRECORDED_MS
+        if completed and not runner.forfeit and not runner.ignored and \
+                (ms := runner.recorded_ms(split)) is not None:
+            bisect.insort(order, (ms, runner.slot))
+            if position >= len(runner.ranked_ms):
+                size = max(position + 1, len(runner._times))
+                runner.ranked_ms.extend(array('q', [UNRECORDED_MS]) * (size - len(runner.ranked_ms)))
+            runner.ranked_ms[position] = ms
+
+    @staticmethod
+    def _ranked_entry(runner: Runner, position: int) -> Tuple[int, int]:
+        '''Returns the runner's entry in the split's sorted order, or None'''
+        if position < len(runner.ranked_ms) and (ms := runner.ranked_ms[position]) != UNRECORDED_MS:
+            return ms, runner.slot
+
+    def gaps_str(self, name: str) -> str:
+        '''Creates the gap text for a runner at their latest split
+
+        Shows their place at the split, and how far behind the leader and
+        the runner directly ahead of them they were.
+        '''
+
+        if not (runner := self.get(name)):
+            return ''
+        if runner.forfeit:
+            return f'{runner.name} has forfeited'
+        if runner.ignored:
+            # ignored runners are left out of the split orders, so they have no place
+            return f'{runner.name} is ignored'
+        split, ts = runner.latest_split
+        if type(ts) != Timestamp:
+            return f'{runner.name} has no splits yet'
+
+        order = self.split_orders[split.Position]
+        idx = bisect.bisect_left(order, (ts.total_ms, runner.slot))
+        gaps = f'{runner.name} at {split.Name}: place {idx + 1}'
+        if idx:
+            leader_ms, leader = order[0]
+            ahead_ms, ahead = order[idx - 1]
+            gaps += f', +{from_ms(ts.total_ms - leader_ms).time_string} to leader {self.slots[leader].name}'
+            if idx > 1:
+                gaps += f', +{from_ms(ts.total_ms - ahead_ms).time_string} to {self.slots[ahead].name}'
+        return gaps
+
+    def split_position(self, runner: Runner, split: TrackedSplit) -> Tuple[int, int, Runner, int]:
+        '''Finds a runner's place at a split with a binary search
+
+        Returns the place, the number of ranked runners at the split, the
+        runner directly ahead and the gap to them in ms. Returns None if the
+        runner has no ranked time for the split.
+        '''
+
+        if (entry := self._ranked_entry(runner, split.Position)) is None:
+            return None
+        order = self.split_orders[split.Position]
+        idx = bisect.bisect_left(order, entry)
+        if not idx:
+            return 1, len(order), None, 0
+        ahead_ms, ahead = order[idx - 1]
+        return idx + 1, len(order), self.slots[ahead], entry[0] - ahead_ms
+
+    def position_str(self, runner: Runner, split: TrackedSplit) -> str:
+        '''Creates the personal position text for a runner at a split'''
+        if not (position := self.split_position(runner, split)):
+            return ''
+        place, ranked, ahead, gap_ms = position
+        position = f'{runner.name} is place {place} of {ranked}'
+        if ahead:
+            position += f', +{from_ms(gap_ms).time_string} behind {ahead.name}'
+        return position
+
+    def top_split_standings(self, split: TrackedSplit, top: int) -> str:
+        '''Gets the split standings of the fastest runners at a split
+
+        The runners come straight from the split's sorted order, so nothing
+        is sorted here.
+        '''
+
+        def render():
+            times_str = f'{split.Name} top {top}: '
+            for idx, (_, slot) in enumerate(self.split_orders.get(split.Position, [])[:top]):
+                times_str += f'{idx + 1}. {self.slots[slot].announcement_standing_str(split)}. '
+            return times_str.strip()
+
+        return render_cached(self._rendered, ('top', split.Position, top), self.version, render)
+
+    def segments_str(self, name: str) -> str:
+        '''Creates the segment times text for a runner'''
+        if runner := self.get(name):
+            return runner.segments_str()
+        return ''
+
+    def subset_mask(self, runner_subset) -> int:
+        '''Returns the mask for a subset of the runners in this set'''
+        if runner_subset is self:
+            return self.all_mask
+        mask = 0
+        for runner in runner_subset:
+            mask |= runner.bit
+        return mask
+
+    def _remove_order(self, runner: Runner) -> None:
+        if (entry := self.order_keys.pop(runner, None)) is not None:
+            del self.order[bisect.bisect_left(self.order, entry)]
+
+    def ordered(self) -> list[Runner]:
+        '''Returns the runners in latest split order'''
+        return [self.slots[slot] for _, slot in self.order]
+
     @property
     def finished(self) -> bool:
         '''Returns True if all the runners are finished'''
-        return all(runner.forfeit or runner.finished for runner in self)
+        return (self.forfeit_mask | self.finished_mask) & self.all_mask == self.all_mask
 
     def get(self, name) -> Runner:
         '''Returns a runner if it matches the given alias'''
-        return next((runner for runner in self if runner.user_matches(name)), None)
+        return self.aliases.get(name.casefold())
+
+    def remap_splits(self, tracked_splits: TrackedSplits) -> None:
+        '''Remaps every runner's splits to a new split catalog by name
+
+        The runners are taken out of the position keyed split masks and
+        orders, moved to the new positions, and marked again.
+        '''
+        positions = remap_positions(self.catalog, tracked_splits)
+        for runner in self:
+            for split, _ in runner.recorded_splits():
+                self.mark_split(runner, split, False)
+        self.catalog.clear()
+        self.catalog.update({new.Position: new for new in positions.values() if new})
+        for runner in self:
+            runner.remap_splits(positions)
+            for split, _ in runner.recorded_splits():
+                self.mark_split(runner, split, True)
 
     def user_ignore(self, user: str, ignore: bool) -> bool:
         '''Returns True if user was found'''
@@ -158,9 +718,9 @@ class RunnerSet(set):
         forfeited, or if they are ignored.
         '''
 
-        if not runner_subset:
-            runner_subset = self
-        return all([x.completed_split(tracked_split) or x.forfeit or x.ignored for x in runner_subset])
+        mask = self.subset_mask(runner_subset) if runner_subset else self.all_mask
+        done = self.split_mask(tracked_split) | self.forfeit_mask | self.ignored_mask
+        return done & mask == mask
 
     def add_split_time(self, user: str, split_data: TrackedSplit,
                        time_data: Timestamp) -> None:
@@ -175,7 +735,7 @@ class RunnerSet(set):
                 runner.add_split(split_data, time_data)
                 logger.info(f'Adding split {split_data.Name} - {time_data} for runner {runner.name}')
             else:
-                if split_data in runner.splits:
+                if runner.completed_split(split_data):
                     runner.undo_split(split_data)
                     logger.info(f'Runner {runner.name} undid split {split_data.Name}')
                 else:
@@ -194,32 +754,81 @@ class RunnerSet(set):
             runner.ignored = False
             logger.info(f'Finish race for runner {runner.name} - {time_data}')
 
-    def check_subset_announce(self, tracked_split: TrackedSplit) -> set[Runner]:
-        '''Returns set of runners to announce subsets'''
-        announce = set()
-        for runner in self:
-            if runner.watched_runners and not runner.forfeit:
-                if tracked_split.Name not in runner.announced_watched_splits:
-                    subset_runners = {self.get(name) for name in runner.watched_runners}
-                    if self.split_is_complete(tracked_split, subset_runners):
-                        runner.announced_watched_splits.add(tracked_split.Name)
-                        announce.add(runner)
+    def check_subset_announce(self, tracked_split: TrackedSplit,
+                              runner: Runner=None) -> set[Runner]:
+        '''Returns set of runners to announce subsets
+
+        If a runner is given, only the runners watching it are checked, since
+        nobody else's subset could have changed.
+        '''
+
+        return set().union(*self.subset_announce_groups(tracked_split, runner).values())
+
+    def subset_announce_groups(self, tracked_split: TrackedSplit,
+                               runner: Runner=None) -> dict[frozenset, set[Runner]]:
+        '''Returns the watchers to announce subsets to, grouped by watchlist
+
+        Watchers with the same watched runners are checked together, so the
+        completion check runs once per distinct watchlist.
+        '''
+
+        if runner:
+            watchers = self.watchers.get(runner, ())
+        else:
+            watchers = {watcher for watchers in self.watchers.values() for watcher in watchers}
+
+        groups = {}
+        for watcher in watchers:
+            if watcher.watched and not watcher.forfeit:
+                if tracked_split.Name not in watcher.announced_watched_splits:
+                    groups.setdefault(frozenset(watcher.watched), set()).add(watcher)
+
+        announce = {}
+        for watched, group in groups.items():
+            if self.split_is_complete(tracked_split, watched):
+                for watcher in group:
+                    watcher.announced_watched_splits.add(tracked_split.Name)
+                announce[watched] = group
 
         return announce
 
-    def check_global_announce(self, tracked_split: TrackedSplit) -> Tuple[bool, bool]:
+    def set_watched(self, watcher: Runner, watched: set[Runner]) -> None:
+        '''Replaces a watcher's watched runners and the reverse index'''
+        for runner in watcher.watched - watched:
+            self.watchers[runner].discard(watcher)
+            if not self.watchers[runner]:
+                del self.watchers[runner]
+        for runner in watched - watcher.watched:
+            self.watchers.setdefault(runner, set()).add(watcher)
+        watcher.watched = watched
+
+    def check_global_announce(self, tracked_split: TrackedSplit,
+                              policy: AnnouncePolicy=None) -> Tuple[bool, bool]:
         '''Checks if you should globally announce a split
 
         Returns a pair of bools in a tuple, one if you should announce the
-        split, another if the race is finished
+        split, another if the race is finished. A policy can allow announcing
+        a split before every runner has it, except for Done.
         '''
         announce, finish = False, False
         if announce := self.split_is_complete(tracked_split):
             if tracked_split.Name == 'Done' and self.finished:
                 finish = True
+        elif policy and tracked_split.Name != 'Done':
+            announce = self.quorum_reached(tracked_split, policy)
 
         return announce, finish
 
+    def quorum_reached(self, tracked_split: TrackedSplit, policy: AnnouncePolicy) -> bool:
+        '''Returns True if enough runners have a time for the split
+
+        The field is counted from the masks and the runners with a time from
+        the split's sorted order, so nothing is scanned.
+        '''
+        field = bin(self.all_mask & ~(self.forfeit_mask | self.ignored_mask)).count('1')
+        done = len(self.split_orders.get(tracked_split.Position, ()))
+        return done >= policy.quorum(field)
+
     def watchlist(self, watcher: str) -> set[str]:
         '''Returns the watchlist for a given watcher'''
         if runner := self.get(watcher):
@@ -228,7 +837,7 @@ class RunnerSet(set):
     def reset_watchlist(self, watcher: str) -> None:
         '''Resets the watchlist for a given watcher'''
         if runner := self.get(watcher):
-            runner.watched_runners = set()
+            self.set_watched(runner, set())
 
     def set_watchlist(self, watcher: str, runners: str) -> set[str]:
         '''Sets the watchlist for a given watcher
@@ -236,20 +845,22 @@ class RunnerSet(set):
         Input is a comma separated list of names
         '''
         if target := self.get(watcher):
-            watched_runners = set()
+            watched = set()
             for runner_name in runners.split(','):
                 runner_name = runner_name.strip()
                 if runner := self.get(runner_name):
                     if runner.twitch_user:
-                        watched_runners.add(runner.twitch_user)
+                        watched.add(runner)
 
+            self.set_watched(target, watched)
+            watched_runners = target.watched_runners
             logger.info(f'Updating watcher list for {target.name} to {watched_runners}')
-            target.watched_runners = watched_runners
             return watched_runners
 
     def standings(self, spoiler: bool) -> str:
         '''Returns the current race standing string'''
-        placements = '\n'.join(self.overall_standings_list(True, True))
+        placements = render_cached(self._rendered, 'standings', self.version,
+                                   lambda: '\n'.join(self.overall_standings_list(True, True)))
         if spoiler:
             placements = '||' + placements + '||'
         return placements
@@ -258,13 +869,16 @@ class RunnerSet(set):
         '''Calculates the current standings
 
         Returns a list of placements strings in order to be consumed by
-        different functions and formatted independently
+        different functions and formatted independently. The list is cached
+        against the set's version, and only changed runners are re-rendered.
         '''
-        sorted_runners = list(self)
-        sorted_runners.sort(key=lambda x: x.latest_split_order)
 
+        return list(render_cached(self._rendered, ('overall', finished, comments), self.version,
+                                  lambda: self._overall_standings_list(finished, comments)))
+
+    def _overall_standings_list(self, finished: bool, comments: bool) -> list[str]:
         standings = []
-        for idx, runner in enumerate(sorted_runners):
+        for idx, runner in enumerate(self.ordered()):
             place = idx + 1
             split_details = runner.latest_standing_str(finished, comments)
             if runner.forfeit or (finished and not runner.finished):
@@ -274,13 +888,19 @@ class RunnerSet(set):
 
         return standings
 
+    def split_ranking(self, split: TrackedSplit, runners: set[Runner]) -> list[Runner]:
+        '''Returns the runners with a time for the split, ordered by time'''
+        return sorted([r for r in runners if r.get_split_time(split)],
+                      key=lambda x: x.split_order(split))
+
     def split_standings(self, split: TrackedSplit, runners: set[Runner]) -> str:
         '''Gets the split standings for a given split and a subset of runners'''
-        runner_list = sorted([r for r in runners if r.get_split_time(split)],
-                             key=lambda x: x.split_order(split))
+        return render_cached(self._rendered, ('split', split.Position, self.subset_mask(runners)),
+                             self.version, lambda: self._split_standings(split, runners))
 
+    def _split_standings(self, split: TrackedSplit, runners: set[Runner]) -> str:
         times_str = f'{split.Name} split standings: '
-        for idx, runner in enumerate(runner_list):
+        for idx, runner in enumerate(self.split_ranking(split, runners)):
             place = 'N/A' if runner.forfeit else idx + 1
             times_str += f'{place}. {runner.announcement_standing_str(split)}. '
 
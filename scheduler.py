@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import timerwheel
+
+logger = logging.getLogger('main')
+
+@dataclass
+class Job:
+    owner: str
+    name: str
+    callback: Callable
+    every: Optional[float] = None # seconds between runs, None to run once
+    runs_left: Optional[int] = 1 # None to repeat until cancelled
+
+class Scheduler:
+    '''Delayed and recurring jobs, keyed by owner and job name
+
+    Jobs ride on a TimerWheel, so nothing sleeps inline waiting for them.
+    The owner is usually a race id, which lets every job of a race be
+    cancelled at once when the race finishes or is unwatched. A recurring
+    job is rescheduled before it runs, so a slow run doesn't drift the
+    next one.
+    '''
+
+    def __init__(self, wheel: timerwheel.TimerWheel):
+        self.wheel = wheel
+        self.jobs = {} # key = (owner, name), value = Job
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def __contains__(self, key) -> bool:
+        return key in self.jobs
+
+    @staticmethod
+    def _timer_key(key: tuple) -> tuple:
+        return ('job',) + key
+
+    def schedule(self, owner: str, name: str, delay: float, callback: Callable,
+                 every: float = None, times: int = 1) -> None:
+        '''Runs callback after delay seconds, replacing the owner's job with the name
+
+        With `every`, the job runs again every `every` seconds until it ran
+        `times` times, or until cancelled if times is None. The callback can
+        be a plain function or a coroutine function.
+        '''
+        key = (owner, name)
+        self.jobs[key] = Job(owner, name, callback, every, times)
+        self.wheel.schedule(self._timer_key(key), delay, lambda: self._run(key))
+
+    def cancel(self, owner: str, name: str = None) -> int:
+        '''Cancels the owner's job with the name, or all its jobs without one
+
+        Returns the number of jobs cancelled.
+        '''
+        keys = [(owner, name)] if name else [key for key in self.jobs if key[0] == owner]
+        cancelled = 0
+        for key in keys:
+            if self.jobs.pop(key, None):
+                self.wheel.cancel(self._timer_key(key))
+                cancelled += 1
+        return cancelled
+
+    def pending(self, owner: str = None) -> list[Tuple[Job, float]]:
+        '''Returns the pending jobs, and the seconds until they run, soonest first'''
+        jobs = []
+        for key, job in self.jobs.items():
+            if owner is None or job.owner == owner:
+                expiry = self.wheel.timers.get(self._timer_key(key), self.wheel.current)
+                jobs.append((job, (expiry - self.wheel.current) * self.wheel.tick))
+        return sorted(jobs, key=lambda pending: pending[1])
+
+    async def _run(self, key: tuple) -> None:
+        if not (job := self.jobs.get(key)):
+            return
+        if job.runs_left is not None:
+            job.runs_left -= 1
+        if job.every and job.runs_left != 0:
+            self.wheel.schedule(self._timer_key(key), job.every, lambda: self._run(key))
+        else:
+            del self.jobs[key]
+
+        try:
+            if asyncio.iscoroutine(result := job.callback()):
+                await result
+        except Exception as e:
+            logger.warning(f'Job {job.name} for {job.owner} failed: {str(e)}')
+
+# rides on the deadline wheel, so one call_later handle drives both
+scheduler = Scheduler(timerwheel.wheel)
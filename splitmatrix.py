@@ -0,0 +1,103 @@
+from runner import Runner, RunnerSet
+from trackedsplits import TrackedSplit
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Sentinels match the total_ms of the special timestamps, so real, skipped,
+# blank and forfeit times sort the same way as the pure python path.
+MISSING_MS = -1
+BLANK_MS = sys.maxsize - 1
+FORFEIT_MS = sys.maxsize
+
+class MatrixRunnerSet(RunnerSet):
+    '''RunnerSet backed by a runners x splits matrix of split times
+
+    Every runner slot is a row and every split position a column, holding the
+    split time in milliseconds as int64 (MISSING_MS when there is no split).
+    Split rankings are computed with vectorized numpy operations over the
+    matrix instead of python sorts. Everything else is inherited from
+    RunnerSet, so it can be used as a drop-in. Races move their runners into
+    one once they reach LARGE_RACE_SIZE.
+
+    Requires numpy, which is an optional dependency.
+    '''
+
+    def __init__(self, runners=()):
+        if np is None:
+            raise ImportError('MatrixRunnerSet requires numpy')
+        self.columns = {} # key = split position, value = column
+        self.times = np.full((8, 8), MISSING_MS, dtype=np.int64)
+        self.live = np.zeros(8, dtype=bool)
+        self.forfeits = np.zeros(8, dtype=bool)
+        self.ignores = np.zeros(8, dtype=bool)
+        self.names = np.full(8, '', dtype=object)
+        super().__init__(runners)
+
+    def _grow(self, rows: int, cols: int) -> None:
+        '''Grows the matrix and row arrays to hold the given shape'''
+        old_rows, old_cols = self.times.shape
+        if rows <= old_rows and cols <= old_cols:
+            return
+        new_rows, new_cols = max(rows, old_rows * 2), max(cols, old_cols * 2)
+
+        times = np.full((new_rows, new_cols), MISSING_MS, dtype=np.int64)
+        times[:old_rows, :old_cols] = self.times
+        self.times = times
+        for name in ('live', 'forfeits', 'ignores'):
+            arr = np.zeros(new_rows, dtype=bool)
+            arr[:old_rows] = getattr(self, name)
+            setattr(self, name, arr)
+        names = np.full(new_rows, '', dtype=object)
+        names[:old_rows] = self.names
+        self.names = names
+
+    def _column(self, split: TrackedSplit) -> int:
+        if (col := self.columns.get(split.Position)) is None:
+            col = self.columns[split.Position] = len(self.columns)
+            self._grow(self.times.shape[0], col + 1)
+        return col
+
+    def add(self, runner: Runner) -> None:
+        if runner not in self:
+            self._grow(self.next_slot + 1, self.times.shape[1])
+            super().add(runner)
+
+    def remove(self, runner: Runner) -> None:
+        super().remove(runner)
+        self.live[runner.slot] = False
+
+    def runner_changed(self, runner: Runner) -> None:
+        super().runner_changed(runner)
+        self.live[runner.slot] = True
+        self.forfeits[runner.slot] = runner.forfeit
+        self.ignores[runner.slot] = runner.ignored
+        self.names[runner.slot] = runner.name
+
+    def mark_split(self, runner: Runner, split: TrackedSplit, completed: bool) -> None:
+        super().mark_split(runner, split, completed)
+        col = self._column(split)
+        self.times[runner.slot, col] = runner.recorded_time(split).total_ms if completed else MISSING_MS
+
+    def _rows(self, runners) -> 'np.ndarray':
+        if runners is self:
+            return np.flatnonzero(self.live)
+        return np.fromiter((r.slot for r in runners), dtype=np.int64)
+
+    def split_ranking(self, split: TrackedSplit, runners: set[Runner]) -> list[Runner]:
+        '''Returns the runners with a time for the split, ordered by time'''
+        rows = self._rows(runners)
+        if (col := self.columns.get(split.Position)) is None:
+            times = np.full(len(rows), MISSING_MS, dtype=np.int64)
+        else:
+            times = self.times[rows, col]
+        times = np.where(self.ignores[rows], BLANK_MS, times)
+        times = np.where(self.forfeits[rows], FORFEIT_MS, times)
+
+        has_time = times != MISSING_MS
+        rows, times = rows[has_time], times[has_time]
+        order = np.lexsort((self.names[rows].astype(str), times))
+        return [self.slots[slot] for slot in rows[order].tolist()]
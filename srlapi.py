@@ -1,43 +1,103 @@
-import requests
-import json
+import aiohttp
 from srlmodels import SRLEntrant, SRLRace, RaceState
+import asyncio
 import logging
+import time
 logger = logging.getLogger('main')
 
-all_races_url = 'http://api.speedrunslive.com:81/races'
-single_race_url = 'http://api.speedrunslive.com:81/races/'
+SRL_API_URL = 'http://api.speedrunslive.com:81'
+all_races_url = f'{SRL_API_URL}/races'
+single_race_url = f'{SRL_API_URL}/races/'
 
-def get_all_races() -> list[SRLRace]:
-    '''Returns all races in srl's API'''
+# seconds a fetched race is reused before SRL is asked again
+RACE_CACHE_TTL = 5
 
-    r = requests.get(all_races_url)
-    races = []
-    if r.status_code == 200:
-        races = json.loads(r.text)['races']
-        return [SRLRace(**race) for race in races]
+# seconds before an SRL request is given up on, requests SRL gets at once,
+# and connections kept open to it
+SRL_TIMEOUT = 10
+SRL_CONNECT_TIMEOUT = 5
+SRL_MAX_CONCURRENCY = 4
+SRL_CONNECTIONS = 8
 
-def find_race_with_user(user) -> SRLRace:
-    '''Returns the most recent race with a given user'''
-    races = get_all_races()
-    if not races:
-        return
+class SRLClient:
+    '''Async client for SRL's API
 
-    result = [x for x in races if not racestate_is_finished(x.state)
-            and contains_user(x.entrants.values(), user)]
+    Requests share one aiohttp session, so connections to SRL are pooled and
+    kept alive between calls. Every request has a timeout and at most
+    `max_concurrency` are sent at once. A failed or timed out request is
+    logged and treated like a missing race.
+    '''
 
-    if result:
-        # logger.info(result)
-        # return the newest race
-        result.sort(key=lambda x: x.time, reverse=True)
-        return result[0]
+    def __init__(self, base_url: str = SRL_API_URL, timeout: float = SRL_TIMEOUT,
+                 max_concurrency: int = SRL_MAX_CONCURRENCY, connections: int = SRL_CONNECTIONS):
+        self.base_url = base_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=min(timeout, SRL_CONNECT_TIMEOUT))
+        self.connections = connections
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session = None
 
-def get_single_race(race_id) -> SRLRace:
-    '''Returns a race given an srl race_id'''
-    r = requests.get(f'{single_race_url}{race_id}')
-    if r.status_code == 200:
-        if race := json.loads(r.text):
+    def _session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connections)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def _get_json(self, url: str):
+        '''Returns the decoded response of a GET request, None if it failed'''
+        async with self.semaphore:
+            try:
+                async with self._session().get(url) as r:
+                    if r.status == 200:
+                        # SRL doesn't always send a json content type
+                        return await r.json(content_type=None)
+                    logger.warning(f'SRL request {url} failed with status {r.status}')
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f'SRL request {url} failed: {e!r}')
+
+    async def get_all_races(self) -> list[SRLRace]:
+        '''Returns all races in srl's API'''
+        if data := await self._get_json(f'{self.base_url}/races'):
+            return [SRLRace(**race) for race in data['races']]
+
+    async def get_single_race(self, race_id: str) -> SRLRace:
+        '''Returns a race given an srl race_id'''
+        if race := await self._get_json(f'{self.base_url}/races/{race_id}'):
             return SRLRace(**race)
 
+    async def find_race_with_user(self, user: str) -> SRLRace:
+        '''Returns the most recent race with a given user'''
+        races = await self.get_all_races()
+        if not races:
+            return
+
+        result = [x for x in races if not racestate_is_finished(x.state)
+                and contains_user(x.entrants.values(), user)]
+
+        if result:
+            # return the newest race
+            result.sort(key=lambda x: x.time, reverse=True)
+            return result[0]
+
+    async def close(self) -> None:
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+# one pooled session for !watch lookups and every race's SRLRaceCache
+client = SRLClient()
+
+async def get_all_races() -> list[SRLRace]:
+    '''Returns all races in srl's API'''
+    return await client.get_all_races()
+
+async def find_race_with_user(user) -> SRLRace:
+    '''Returns the most recent race with a given user'''
+    return await client.find_race_with_user(user)
+
+async def get_single_race(race_id) -> SRLRace:
+    '''Returns a race given an srl race_id'''
+    return await client.get_single_race(race_id)
+
 def racestate_is_finished(state: RaceState) -> bool:
     return state in {RaceState.COMPLETE, RaceState.TERMINATED}
 
@@ -49,3 +109,52 @@ def contains_user(entrants: set[SRLEntrant], user: str) -> bool:
                 return True
 
     return False
+
+class SRLRaceCache:
+    '''Short lived cache of a single race's SRL data
+
+    A burst of splits asks for the race once per split, so a fetched race is
+    reused for `ttl` seconds. Callers that ask while a fetch is in flight
+    wait on that fetch instead of starting their own. invalidate() forces the
+    next call to fetch again, e.g. when the entrants are known to have
+    changed.
+    '''
+
+    def __init__(self, race_id: str, ttl: float = RACE_CACHE_TTL, clock=time.monotonic):
+        self.race_id = race_id
+        self.ttl = ttl
+        self.clock = clock
+        self.race = None
+        self.fetched_at = None
+        self.generation = 0 # bumped by invalidate() so in-flight results aren't cached
+        self.inflight = None
+
+    @property
+    def fresh(self) -> bool:
+        return self.fetched_at is not None and self.clock() - self.fetched_at < self.ttl
+
+    async def get(self) -> SRLRace:
+        '''Returns the race, fetching it if the cached copy is too old'''
+        if self.fresh:
+            return self.race
+        if self.inflight is None:
+            self.inflight = asyncio.ensure_future(self._fetch())
+        # shielded so a cancelled caller doesn't cancel the fetch for the others
+        return await asyncio.shield(self.inflight)
+
+    def invalidate(self) -> None:
+        '''Drops the cached race so the next get() fetches it again'''
+        self.fetched_at = None
+        self.generation += 1
+        self.inflight = None
+
+    async def _fetch(self) -> SRLRace:
+        generation = self.generation
+        try:
+            race = await get_single_race(self.race_id)
+        finally:
+            if self.generation == generation:
+                self.inflight = None
+        if race and self.generation == generation:
+            self.race, self.fetched_at = race, self.clock()
+        return race
@@ -15,5 +15,11 @@ class TestBlacklist(unittest.TestCase):
         blacklist.remove_user(self.fake_user)
         self.assertFalse(blacklist.check_user(self.fake_user), 'Removing blacklist failed')
 
+    def test_check_users(self):
+        self.assertEqual(blacklist.check_users([]), set())
+        blacklist.add_user(self.fake_user)
+        self.assertEqual(blacklist.check_users([self.fake_user, 'another_fake_user']), {self.fake_user})
+
+
 if __name__ == '__main__':
     unittest.main()
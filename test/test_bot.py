@@ -1,5 +1,7 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 import asyncio
 
 import bot
@@ -9,6 +11,7 @@ from srlmodels import SRLRace
 import blacklist
 import srlapi
 import race_db
+from journal import Journal
 
 import discord.ext.commands
 
@@ -43,7 +46,7 @@ class TestBot(unittest.TestCase):
     async def _check_all_splits_announcement_mock(self):
         pass
 
-    async def _check_subset_announcement_mock(self, *args):
+    def _check_subset_announcement_mock(self, *args):
         pass
 
     async def _handle_finish_race_mock(self):
@@ -93,7 +96,7 @@ class TestBot(unittest.TestCase):
         bot.DiscordBot.init_ircs = Mock(auto_spec=True, side_effect=self.init_ircs_mock)
 
         self._find_race = srlapi.find_race_with_user
-        srlapi.find_race_with_user = Mock(auto_spec=True)
+        srlapi.find_race_with_user = AsyncMock(auto_spec=True)
 
         self._sleep_mock = asyncio.sleep
         asyncio.sleep = Mock(auto_spec=True, side_effect=self.sleep_mock)
@@ -155,7 +158,7 @@ class TestBot(unittest.TestCase):
         asyncio.sleep.mock_reset()
         asyncio.sleep = self._sleep_mock
 
-        srlapi.find_race_with_user.mock_reset()
+        srlapi.find_race_with_user.reset_mock()
         srlapi.find_race_with_user = self._find_race
 
     def test_init(self):
@@ -248,8 +251,30 @@ class TestBot(unittest.TestCase):
 
         race.Race._handle_finish_race.assert_called_once()
 
+    def test_reload_splits(self):
+        old_splits = self.race.tracked_splits
+        self.loop.run_until_complete(self.discord_bot.reload_splits(self.discord_bot, self.context))
+        self.context.send.assert_called_once_with('Reloaded 24 splits into 1 races')
+        self.assertIsNot(self.race.tracked_splits, old_splits)
+        self.assertIs(self.race.tracked_splits, self.discord_bot.tracked_splits)
+
     def test_kill(self):
-        pass
+        self.discord_bot.bot = Mock(close=AsyncMock())
+        client_close = srlapi.client.close
+        srlapi.client.close = AsyncMock()
+        race_db.add_race(self.race_id)
+        with tempfile.TemporaryDirectory() as directory:
+            race_journal = Journal(self.race_id, directory)
+            race_journal.record('SettingsChanged', silenced=True, spoiler=False, top=0, percent=0)
+            race_journal.flush()
+            self.race.start_journal(race_journal)
+            try:
+                self.loop.run_until_complete(self.discord_bot.kill(self.discord_bot, self.context))
+            finally:
+                srlapi.client.close = client_close
+            self.assertFalse(os.path.exists(race_journal.path))
+        self.assertFalse(race_db.check_race(self.race_id))
+        self.context.send.assert_called_once_with('Bot is shutting down after unwatching 1 races')
 
     def test_racebot_info(self):
         pass
@@ -275,6 +300,14 @@ class TestBot(unittest.TestCase):
         self.loop.run_until_complete(self.discord_bot.unsilence_race(self.discord_bot, self.context, race_id=self.race_id))
         self.assertFalse(self.race.silenced)
 
+    def test_announce_policy(self):
+        self.loop.run_until_complete(self.discord_bot.announce_policy(self.discord_bot, self.context, self.race_id, 'top', 3))
+        self.assertEqual(self.race.announce_policy.top, 3)
+        self.context.send.assert_called_once_with(f'Race {self.race_id} announce policy set to top 3.')
+
+        self.loop.run_until_complete(self.discord_bot.announce_policy(self.discord_bot, self.context, self.race_id, 'percent', 0))
+        self.assertEqual(self.race.announce_policy.top, 3)
+
     def test_post_results(self):
         self.loop.run_until_complete(self.discord_bot.post_results(self.discord_bot, self.context, race_id=self.race_id))
         exp_standings = f'Race {self.race_id} results:\n\nN/A. Abdalain: (N/A)\nN/A. Yujito: (N/A)\nN/A. vidgmaddiict: (N/A)\nN/A. Sidosh: (Forfeit) (PC fucking restarted by itself, so I desperately tried to die cause I was so pissed that I became personal. Sry for any insults)'
@@ -290,6 +323,45 @@ class TestBot(unittest.TestCase):
         exp_standings = f'Race {self.race_id} results:\n\n1. Yujito: (01:51:00.00)\n2. Abdalain: (01:52:00.00)\n3. vidgmaddiict: (01:53:00.00)\nN/A. Sidosh: (Forfeit) (PC fucking restarted by itself, so I desperately tried to die cause I was so pissed that I became personal. Sry for any insults)'
         self.context.send.assert_called_with(exp_standings)
 
+    def test_split_catalog_retries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'splits.json')
+            self.discord_bot.watch_split_catalog(path)
+            self.assertIn(('bot', 'split catalog'), self.discord_bot.scheduler)
+            self.discord_bot.scheduler.cancel('bot')
+            self.assertIsNone(self.discord_bot.split_catalog_mtime)
+
+            self.discord_bot.load_split_catalog = AsyncMock(return_value=False)
+            self.loop.run_until_complete(self.discord_bot.check_split_catalog(path))
+            self.discord_bot.load_split_catalog.assert_not_called()
+
+            with open(path, 'w') as f:
+                f.write('[]')
+            self.loop.run_until_complete(self.discord_bot.check_split_catalog(path))
+            self.assertIsNone(self.discord_bot.split_catalog_mtime)
+
+            self.discord_bot.load_split_catalog.return_value = True
+            self.loop.run_until_complete(self.discord_bot.check_split_catalog(path))
+            self.assertEqual(self.discord_bot.split_catalog_mtime, os.path.getmtime(path))
+            self.assertEqual(self.discord_bot.load_split_catalog.call_count, 2)
+
+    def test_evict_race(self):
+        self.assertFalse(self.discord_bot.evict_race(self.race_id))
+        self.race.finished = True
+        self.assertTrue(self.discord_bot.evict_race(self.race_id))
+        self.assertNotIn(self.race_id, self.discord_bot.races)
+
+        self.loop.run_until_complete(self.discord_bot.post_results(self.discord_bot, self.context, race_id=self.race_id))
+        exp_standings = f'Race {self.race_id} results:\n\nN/A. Abdalain: (N/A)\nN/A. Yujito: (N/A)\nN/A. vidgmaddiict: (N/A)\nN/A. Sidosh: (Forfeit) (PC fucking restarted by itself, so I desperately tried to die cause I was so pissed that I became personal. Sry for any insults)'
+        self.context.send.assert_called_once_with(exp_standings)
+
+        # only the most recently used summaries are kept
+        for race_id in range(bot.RETAINED_SUMMARIES):
+            self.discord_bot.races[str(race_id)] = self.race
+            self.discord_bot.evict_race(str(race_id))
+        self.assertEqual(len(self.discord_bot.finished_races), bot.RETAINED_SUMMARIES)
+        self.assertNotIn(self.race_id, self.discord_bot.finished_races)
+
     def test_check_race_for_user(self):
         self.assertIsNone(self.loop.run_until_complete(self.discord_bot.check_race_for_user('hwangbroxd')))
         self.assertIsNotNone(self.loop.run_until_complete(self.discord_bot.check_race_for_user('yujito')))
@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+
+from events import EventBus, Metrics, RaceFinished, SplitRecorded, SplitUndone
+
+class TestEventBus(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.bus = EventBus()
+        self.received = []
+
+    def publish(self, *events):
+        async def publish():
+            for event in events:
+                self.bus.publish(event)
+        self.loop.run_until_complete(publish())
+        self.loop.run_until_complete(self.bus.drain())
+
+    def test_typed_subscribers(self):
+        metrics = Metrics()
+        self.bus.subscribe('finished', self.received.append, RaceFinished)
+        self.bus.subscribe('metrics', metrics)
+        self.publish(SplitRecorded('q7bsl', 'Sidosh', 'Nido', 423240), SplitUndone('q7bsl', 'Sidosh', 'Nido'),
+                     RaceFinished('q7bsl', 'results'))
+        self.assertEqual(self.received, [RaceFinished('q7bsl', 'results')])
+        self.assertEqual(str(metrics), 'RaceFinished 1, SplitRecorded 1, SplitUndone 1')
+
+    def test_slow_subscriber_drops_oldest(self):
+        release = asyncio.Event()
+        async def slow(event):
+            await release.wait()
+            self.received.append(event.ms)
+        subscription = self.bus.subscribe('slow', slow, maxsize=2)
+
+        async def publish():
+            for ms in range(5):
+                self.bus.publish(SplitRecorded('q7bsl', 'Sidosh', 'Nido', ms))
+                await asyncio.sleep(0)
+            release.set()
+        self.loop.run_until_complete(publish())
+        self.loop.run_until_complete(self.bus.drain())
+        # the first event was already being handled, the next two were dropped
+        self.assertEqual(self.received, [0, 3, 4])
+        self.assertEqual(subscription.dropped, 2)
+
+    def test_failing_subscriber(self):
+        def fail(event):
+            raise ValueError('broken')
+        failing = self.bus.subscribe('failing', fail)
+        self.bus.subscribe('ok', self.received.append)
+        self.publish(RaceFinished('q7bsl', 'results'), RaceFinished('abc123', 'results'))
+        self.assertEqual(len(self.received), 2)
+        self.assertEqual(failing.delivered, 0)
+        self.assertTrue(failing.queue.empty())
+
+if __name__ == '__main__':
+    unittest.main()
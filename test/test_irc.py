@@ -146,6 +146,15 @@ class TestHandleMessage(unittest.TestCase):
         self.loop.run_until_complete(self.tw_irc.handle_message(msg))
         RunnerSet.overall_standings_list.assert_called_once()
 
+    def test_twitch_gaps_command(self):
+        self.tw_irc.channels.add('hwangbroxd')
+        self._gaps_str = RunnerSet.gaps_str
+        RunnerSet.gaps_str = Mock(auto_spec=True, return_value='')
+        msg = message.Message(self.irc_start2 + ':!gaps arayalol')
+        self.loop.run_until_complete(self.tw_irc.handle_message(msg))
+        RunnerSet.gaps_str.assert_called_once_with('arayalol')
+        RunnerSet.gaps_str = self._gaps_str
+
     def test_srl_time_command(self):
         irc_raw_string = ':xd_bot_xd2!xd_bot_xd2@SRL-67B2A0C8.oc.oc.cox.net PRIVMSG #srl-q7bsl-livesplit :!time RealTime "Lance" 1:57:22.20'
         msg = message.Message(irc_raw_string)
@@ -162,7 +171,33 @@ class TestHandleMessage(unittest.TestCase):
         irc_raw_string = ':xd_bot_xd2!xd_bot_xd2@SRL-67B2A0C8.oc.oc.cox.net JOIN :#srl-q7bsl-livesplit'
         msg = message.Message(irc_raw_string)
         self.loop.run_until_complete(self.srl_irc.handle_message(msg))
+        race.Race.update_race.assert_not_called()
+        self.loop.run_until_complete(self.race.roster_debouncer.flush())
+        race.Race.update_race.assert_called_once()
+
+    def test_srl_join_part_burst(self):
+        join = ':xd_bot_xd2!xd_bot_xd2@SRL-67B2A0C8.oc.oc.cox.net JOIN :#srl-q7bsl-livesplit'
+        part = ':xd_bot_xd2!xd_bot_xd2@SRL-67B2A0C8.oc.oc.cox.net PART #srl-q7bsl-livesplit :Leaving'
+        for irc_raw_string in (join, part, join):
+            self.loop.run_until_complete(self.srl_irc.handle_message(message.Message(irc_raw_string)))
+        self.loop.run_until_complete(self.race.roster_debouncer.flush())
         race.Race.update_race.assert_called_once()
+        self.assertEqual(self.race.roster_debouncer.saved, 2)
+
+    def test_concurrent_sends_drain_one_at_a_time(self):
+        draining = []
+
+        async def drain():
+            # StreamWriter.drain asserts it has no other waiter before python 3.10
+            assert not draining
+            draining.append(True)
+            await asyncio.sleep(0)
+            draining.pop()
+
+        self.tw_irc.writer = Mock(drain=drain)
+        sends = [self._send(self.tw_irc, f'msg {i}', 'hwangbroxd') for i in range(3)]
+        self.loop.run_until_complete(asyncio.gather(*sends, self._basic_send(self.tw_irc, 'JOIN #yujitoo')))
+        self.assertEqual(self.tw_irc.writer.write.call_count, 4)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from events import SplitCompleted, SplitRecorded
+from journal import Journal, JournalWriter, journal_path, read_events
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = Journal('abc123', self.tmp.name, flush_interval=1, batch=3)
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmp.cleanup()
+
+    def test_batched_flush(self):
+        self.journal.record('split', user='Sidosh', split='Nido', ms=423240)
+        self.journal.record('announce', split='Nido')
+        self.assertEqual(read_events('abc123', self.tmp.name), [])
+        self.assertIsNotNone(self.journal.handle)
+
+        self.journal.record('ignore', user='Yujito', ignored=True)
+        self.assertEqual(self.journal.flushes, 1)
+        self.assertIsNone(self.journal.handle)
+        self.assertEqual(read_events('abc123', self.tmp.name), [
+            {'event': 'split', 'user': 'Sidosh', 'split': 'Nido', 'ms': 423240},
+            {'event': 'announce', 'split': 'Nido'},
+            {'event': 'ignore', 'user': 'Yujito', 'ignored': True},
+        ])
+
+    def test_flush_after_interval(self):
+        async def record():
+            self.journal.record('announce', split='Nido')
+            await asyncio.sleep(1.1)
+        self.loop.run_until_complete(record())
+        self.assertEqual(read_events('abc123', self.tmp.name), [{'event': 'announce', 'split': 'Nido'}])
+
+    def test_torn_event(self):
+        self.journal.record('announce', split='Nido')
+        self.journal.flush()
+        with open(journal_path('abc123', self.tmp.name), 'a') as f:
+            f.write('{"event":"spl')
+        self.assertEqual(read_events('abc123', self.tmp.name), [{'event': 'announce', 'split': 'Nido'}])
+
+    def test_discard(self):
+        self.journal.record('announce', split='Nido')
+        self.journal.flush()
+        self.journal.discard()
+        self.assertFalse(os.path.exists(journal_path('abc123', self.tmp.name)))
+        self.assertEqual(read_events('abc123', self.tmp.name), [])
+
+    def test_writer(self):
+        writer = JournalWriter()
+        writer.attach('abc123', self.journal)
+        writer(SplitRecorded('abc123', 'Sidosh', 'Nido', 423240))
+        writer(SplitRecorded('xyz789', 'Yujito', 'Nido', 430300))
+        writer(SplitCompleted('abc123', 'Nido', 'standings'))
+        writer.close('abc123')
+        writer(SplitCompleted('abc123', 'Done', 'standings'))
+        self.assertEqual(read_events('abc123', self.tmp.name), [
+            {'event': 'SplitRecorded', 'runner': 'Sidosh', 'split': 'Nido', 'ms': 423240},
+            {'event': 'SplitCompleted', 'split': 'Nido', 'standings': 'standings'},
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -41,6 +41,20 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(msg.command, 'PART')
         self.assertEqual(msg.channel, 'srl-uzb7n-livesplit')
 
+    def test_srl_quit(self):
+        irc_raw_string = ':psymar!psymar@SRL-5C0AA961.triad.res.rr.com QUIT :Ping timeout: 240 seconds'
+        msg = Message(irc_raw_string)
+        self.assertEqual(msg.username, 'psymar')
+        self.assertEqual(msg.command, 'QUIT')
+        self.assertEqual(msg.channel, '')
+
+    def test_srl_names(self):
+        irc_raw_string = ':irc.speedrunslive.com 353 xd_bot_xd = #srl-q7bsl-livesplit :xd_bot_xd @RaceBot Sidosh +Yujito'
+        msg = Message(irc_raw_string)
+        self.assertEqual(msg.command, 'NAMES')
+        self.assertEqual(msg.channel, 'srl-q7bsl-livesplit')
+        self.assertEqual(msg.names, ['xd_bot_xd', 'racebot', 'sidosh', 'yujito'])
+
     def test_twitch_message_command(self):
         tw_raw_string = ':hwangbroxd!hwangbroxd@hwangbroxd.tmi.twitch.tv PRIVMSG #xd_bot_xd :!standings'
         msg = Message(tw_raw_string)
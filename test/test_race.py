@@ -1,11 +1,23 @@
+import dataclasses
+import tempfile
 import unittest
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 import asyncio
 
 import irc
+from message import Message
 from srlmodels import SRLRace
 from timestamp import SkipTimestamp, parse_timestamp
+import race
 from race import Race
+import splitmatrix
+from timerwheel import TimerWheel
+from scheduler import Scheduler
+from journal import Journal, read_events
+import events
+from events import RaceFinished
+from runner import AnnouncePolicy
+from trackedsplits import TrackedSplit, TrackedSplits
 import race_db
 import blacklist
 
@@ -13,6 +25,12 @@ from discord.ext import commands
 import bot
 import cfg
 
+def run(loop, coro):
+    '''Runs the coroutine and waits until the bus delivered what it published'''
+    result = loop.run_until_complete(coro)
+    loop.run_until_complete(events.bus.drain())
+    return result
+
 class TestRace(unittest.TestCase):
     async def update_mock(self):
         pass
@@ -52,7 +70,7 @@ class TestRace(unittest.TestCase):
 
         self.loop = asyncio.get_event_loop()
 
-        self.loop.run_until_complete(self.race_obj._update_runners(race_data.entrants))
+        run(self.loop, self.race_obj._update_runners(race_data.entrants))
 
         self.race_obj.runners.get('sidosh').update_status('Ready')
         self.race_obj.runners.get('yujito').update_status('Ready')
@@ -89,10 +107,10 @@ class TestRace(unittest.TestCase):
         self.assertEqual(len(self.race_obj.runners), 4)
 
         nido_split = self.race_obj.tracked_splits['Nido']
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         self.assertTrue(nido_split in self.race_obj.announced_splits)
 
@@ -109,8 +127,8 @@ class TestRace(unittest.TestCase):
         nido_split_ts = parse_timestamp('RealTime "Nido" 7:03.24')
         brock_split_ts = parse_timestamp('RealTime "Brock" -')
 
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', nido_split_ts))
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', brock_split_ts))
+        run(self.loop, self.race_obj.add_time('sidosh', nido_split_ts))
+        run(self.loop, self.race_obj.add_time('sidosh', brock_split_ts))
 
         self.assertTrue(self.race_obj.runners.get('sidosh').completed_split(brock_split))
 
@@ -121,15 +139,15 @@ class TestRace(unittest.TestCase):
         nido_split_ts = parse_timestamp('RealTime "Nido" 7:03.24')
         brock_split_ts = parse_timestamp('RealTime "Brock" -')
 
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', nido_split_ts))
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', brock_split_ts))
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', brock_split_ts))
+        run(self.loop, self.race_obj.add_time('sidosh', nido_split_ts))
+        run(self.loop, self.race_obj.add_time('sidosh', brock_split_ts))
+        run(self.loop, self.race_obj.add_time('sidosh', brock_split_ts))
 
         self.assertFalse(self.race_obj.runners.get('sidosh').completed_split(brock_split), 'Failed to undo skipped split')
 
     def test_standings(self):
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
 
         exp_standings = [
             '1. Sidosh: (Nidoran 07:03.24)',
@@ -138,8 +156,8 @@ class TestRace(unittest.TestCase):
             '4. vidgmaddiict: (N/A)',
         ]
         self.assertEqual(self.race_obj.runners.overall_standings_list(), exp_standings)
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         exp_standings = [
             '1. Sidosh: (Nidoran 07:03.24)',
@@ -153,9 +171,9 @@ class TestRace(unittest.TestCase):
         self.race_obj.runners.get('sidosh').update_status('Forfeit')
         split, ts = self.race_obj.runners.get('sidosh').latest_split
         self.assertEqual(str(split), 'Forfeit - Position: -1')
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         exp_standings = [
             '1. Yujito: (Nidoran 07:10.30)',
@@ -175,7 +193,7 @@ class TestRace(unittest.TestCase):
             'N/A. Sidosh: (Forfeit)'
         ]
         self.assertEqual(self.race_obj.runners.overall_standings_list(), exp_standings)
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', parse_timestamp('RealTime "Brock" 11:58.29')))
+        run(self.loop, self.race_obj.add_time('yujito', parse_timestamp('RealTime "Brock" 11:58.29')))
 
         exp_standings = [
             '1. Yujito: (Brock 11:58.29)',
@@ -189,9 +207,9 @@ class TestRace(unittest.TestCase):
         self.race_obj.runners.get('sidosh').update_status('Forfeit')
         split, ts = self.race_obj.runners.get('sidosh').latest_split
         self.assertEqual(str(split), 'Forfeit - Position: -1')
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
         self.assertTrue(isinstance(self.nido_split_skip, SkipTimestamp))
         split, ts = self.race_obj.runners.get('vidgmaddiict').latest_split
 
@@ -209,9 +227,9 @@ class TestRace(unittest.TestCase):
         self.race_obj.runners.get('sidosh').ignored = True
         split, ts = self.race_obj.runners.get('sidosh').latest_split
         self.assertEqual(str(split), 'N/A - Position: 0')
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         exp_standings = [
             '1. Yujito: (Nidoran 07:10.30)',
@@ -226,10 +244,10 @@ class TestRace(unittest.TestCase):
     def test_standings_with_ignored_and_skipped(self):
         self.race_obj.runners.get('sidosh').ignored = True
 
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', parse_timestamp('RealTime "Rival 1" 3:03.24')))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', parse_timestamp('RealTime "Rival 1" 3:03.24')))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
 
         exp_standings = [
             '1. Yujito: (Nidoran 07:10.30)',
@@ -246,8 +264,8 @@ class TestRace(unittest.TestCase):
         self.race_obj.runners.get('sidosh').update_status('Forfeit')
         split, ts = self.race_obj.runners.get('sidosh').latest_split
         self.assertEqual(str(split), 'Forfeit - Position: -1')
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
 
         exp_standings = [
             '1. Yujito: (Nidoran 07:10.30)',
@@ -264,8 +282,8 @@ class TestRace(unittest.TestCase):
         self.race_obj.runners.get('sidosh').update_status('Forfeit')
         split, ts = self.race_obj.runners.get('sidosh').latest_split
         self.assertEqual(str(split), 'Forfeit - Position: -1')
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_skip))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_skip))
 
         exp_standings = [
             '1. Yujito: (Nidoran 07:10.30)',
@@ -278,10 +296,10 @@ class TestRace(unittest.TestCase):
         self.assertTrue(self.race_obj.tracked_splits['Nido'] in self.race_obj.announced_splits)
 
     def test_standings_finished(self):
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('yujito', self.done_split_2))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('abdalain', self.done_split_3))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('vidgmaddiict', self.done_split_4))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', self.done_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('abdalain', self.done_split_3))
+        run(self.loop, self.race_obj.finish_race_for_user('vidgmaddiict', self.done_split_4))
 
         exp_standings = [
             '1. Sidosh: (01:52:51.24)',
@@ -292,10 +310,10 @@ class TestRace(unittest.TestCase):
         self.assertEqual(self.race_obj.runners.overall_standings_list(True), exp_standings)
 
     def test_standings_finished_with_unfinished_racer(self):
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('yujito', self.done_split_2))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('abdalain', self.done_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', self.done_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('abdalain', self.done_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         exp_standings = [
             '1. Sidosh: (01:52:51.24)',
@@ -307,9 +325,9 @@ class TestRace(unittest.TestCase):
         self.assertEqual(self.race_obj.runners.overall_standings_list(True), exp_standings)
 
     def test_standings_finished_with_forfeit(self):
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('yujito', self.done_split_2))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('abdalain', self.done_split_3))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', self.done_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('abdalain', self.done_split_3))
         self.race_obj.runners.get('vidgmaddiict').update_status('Forfeit')
 
         exp_standings = [
@@ -334,16 +352,35 @@ class TestRace(unittest.TestCase):
     def test_subset_announce(self):
         self.race_obj.runners.set_watchlist('sidosh', 'abdalain')
 
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
 
         self.assertEqual(irc.IRC.send.call_count, 1)
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         self.assertTrue(self.nido_split in self.race_obj.announced_splits)
         self.assertEqual(irc.IRC.send.call_count, 5)
 
+    def test_subset_announce_watched_runner_forfeits_last(self):
+        self.race_obj.runners.set_watchlist('sidosh', 'yujito, abdalain')
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        irc.IRC.send.assert_not_called()
+
+        entrants = dict(self.race_obj.entrants)
+        entrants['Abdalain'] = dataclasses.replace(entrants['Abdalain'], statetext='Forfeit')
+        self.race_obj.srl_cache.get = AsyncMock(return_value=Mock(entrants=entrants))
+        run(self.loop, self._update_race(self.race_obj))
+        irc.IRC.send.assert_called_once_with('Nidoran split standings: 1. Yujito - 07:10.30. N/A. Abdalain - Forfeit.', 'sidosh')
+
+    def test_subset_announce_watched_runner_ignored(self):
+        self.race_obj.runners.set_watchlist('sidosh', 'yujito, abdalain')
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        self.race_obj.ignore_runner('abdalain', True)
+        run(self.loop, events.bus.drain())
+        self.assertEqual(irc.IRC.send.call_count, 1)
+        self.assertEqual(irc.IRC.send.call_args.args[1], 'sidosh')
+
     def test_subset_announce_2(self):
         self.race_obj.runners.set_watchlist('sidosh', 'abdalain')
         self.race_obj.runners.set_watchlist('abdalain', 'yujitoo, vidgmaddiict')
@@ -351,35 +388,294 @@ class TestRace(unittest.TestCase):
         self.assertEqual(self.race_obj.runners.get('sidosh').watched_runners, {'abdalain'})
         self.assertEqual(self.race_obj.runners.get('abdalain').watched_runners, {'yujitoo', 'vidgmaddiict'})
 
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
 
         self.assertEqual(irc.IRC.send.call_count, 1)
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         self.assertTrue(self.nido_split in self.race_obj.announced_splits)
         self.assertEqual(irc.IRC.send.call_count, 6)
 
+    def test_subset_announce_shared_watchlist(self):
+        self.race_obj.runners.set_watchlist('sidosh', 'abdalain, yujito')
+        self.race_obj.runners.set_watchlist('vidgmaddiict', 'yujito, abdalain')
+
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+
+        sent = {call.args[1]: call.args[0] for call in irc.IRC.send.call_args_list}
+        exp = 'Nidoran split standings: 1. Yujito - 07:10.30. 2. Abdalain - 07:15.38.'
+        self.assertEqual(sent, {'sidosh': exp, 'vidgmaddiict': exp})
+
+    def test_reconcile_corrects_announcement(self):
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+
+        async def forfeit_mock():
+            self.race_obj.runners.get('yujito').update_status('Forfeit')
+        Race.update_race.side_effect = forfeit_mock
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.reconcile_task)
+        self.assertEqual(irc.IRC.send.call_count, 8)
+        self.assertEqual(irc.IRC.send.call_args.args[0], 'Correction: Nidoran split standings: 1. Sidosh - 07:03.24. '
+                         '2. Abdalain - 07:15.38. 3. vidgmaddiict - 07:20.01. N/A. Yujito - Forfeit.')
+
+    def test_set_tracked_splits(self):
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+
+        new_nido = TrackedSplit(2, 'Nidoran', ('Nido', 'NidoranM', 'Nidoking'))
+        catalog = TrackedSplits([TrackedSplit(0, 'N/A'), new_nido, TrackedSplit(100, 'Done')])
+        self.race_obj.set_tracked_splits(catalog)
+
+        self.assertEqual(self.race_obj.tracked_splits['Nidoking'], new_nido)
+        self.assertTrue(new_nido in self.race_obj.announced_splits)
+        runner = self.race_obj.runners.get('sidosh')
+        self.assertEqual(runner.get_split_time(new_nido).total_ms, 423240)
+        self.assertEqual(runner.latest_split[0], new_nido)
+
+    def test_set_tracked_splits_moved(self):
+        for user, time_data in (('sidosh', self.nido_split_1), ('yujito', self.nido_split_2),
+                                ('abdalain', self.nido_split_3)):
+            run(self.loop, self.race_obj.add_time(user, time_data))
+        self.race_obj.early_splits.add(self.nido_split.Position)
+
+        moved_nido = TrackedSplit(5, 'Nidoran', ('Nido',))
+        catalog = TrackedSplits([TrackedSplit(0, 'N/A'), TrackedSplit(2, 'Rival 1'), moved_nido,
+                                 TrackedSplit(100, 'Done')])
+        self.race_obj.set_tracked_splits(catalog)
+
+        runners = self.race_obj.runners
+        sidosh = runners.get('sidosh')
+        self.assertEqual(sidosh.get_split_time(moved_nido).total_ms, 423240)
+        self.assertIsNone(sidosh.recorded_time(catalog['Rival 1']))
+        self.assertEqual(sidosh.latest_split[0], moved_nido)
+        self.assertEqual(runners.split_mask(catalog['Rival 1']), 0)
+        self.assertEqual(runners.split_position(runners.get('abdalain'), moved_nido)[0], 3)
+        self.assertEqual(self.race_obj.early_splits, {5})
+
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', parse_timestamp('RealTime "Nidoran" 7:20.01')))
+        self.assertTrue(runners.split_is_complete(moved_nido))
+        self.assertEqual(irc.IRC.send.call_args.args[0], 'Nidoran late arrival: 4. vidgmaddiict - 07:20.01')
+
     def test_get_split_standings(self):
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_2))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
 
         announcement = self.race_obj.runners.split_standings(self.nido_split, self.race_obj.runners)
-        # announcement2 = self.loop.run_until_complete(self.race_obj.get_split_standings2(self.nido_split, self.race_obj.runners))
+        # announcement2 = run(self.loop, self.race_obj.get_split_standings2(self.nido_split, self.race_obj.runners))
         self.assertEqual(announcement, 'Nidoran split standings: 1. Sidosh - 07:03.24. 2. Yujito - 07:10.30. 3. Abdalain - 07:15.38. 4. vidgmaddiict - 07:20.01.')
 
         # self.assertEqual(announcement, announcement2)
 
+    def test_large_race_announcement(self):
+        self.race_obj.large_race_size = 4
+        self.race_obj.large_race_top = 2
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+
+        top = 'Nidoran top 2: 1. Sidosh - 07:03.24. 2. Yujito - 07:10.30.'
+        sent = {call.args[1]: call.args[0] for call in irc.IRC.send.call_args_list}
+        self.assertEqual(sent['sidosh'], top)
+        self.assertEqual(sent['yujitoo'], top)
+        self.assertEqual(sent['abdalain'], f'{top} | Abdalain is place 3 of 4, +00:05.08 behind Yujito')
+        self.assertEqual(sent['vidgmaddiict'], f'{top} | vidgmaddiict is place 4 of 4, +00:04.63 behind Abdalain')
+
+    def test_announce_policy_late_arrivals(self):
+        self.race_obj.announce_policy = AnnouncePolicy(top=2)
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        irc.IRC.send.assert_not_called()
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        self.assertEqual(irc.IRC.send.call_count, 4)
+        self.assertEqual(irc.IRC.send.call_args.args[0], 'Nidoran split standings: 1. Sidosh - 07:03.24. 2. Yujito - 07:10.30.')
+
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        self.assertEqual(irc.IRC.send.call_count, 8)
+        self.assertEqual(irc.IRC.send.call_args.args[0], 'Nidoran late arrival: 3. Abdalain - 07:15.38')
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        self.assertEqual(irc.IRC.send.call_count, 12)
+        self.assertEqual(self.race_obj.early_splits, set())
+
+    def test_late_arrivals_batched(self):
+        self.race_obj.announce_policy = AnnouncePolicy(top=2)
+        self.race_obj.late_arrival_window = 10
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        self.assertEqual(irc.IRC.send.call_count, 4)
+        self.assertTrue(self.race_obj.late_debouncer.pending)
+
+        run(self.loop, self.race_obj.late_debouncer.flush())
+        self.assertEqual(irc.IRC.send.call_count, 8)
+        self.assertEqual(irc.IRC.send.call_args.args[0],
+                         'Nidoran late arrivals: 3. Abdalain - 07:15.38. 4. vidgmaddiict - 07:20.01')
+        self.assertEqual(self.race_obj.late_arrivals, {})
+        self.assertEqual(self.race_obj.early_splits, set())
+
+    def test_split_deadline(self):
+        self.race_obj.split_deadline = 60
+        self.race_obj.timers = TimerWheel(tick=30)
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        self.assertEqual(len(self.race_obj.timers), 1)
+
+        self.race_obj.timers.advance()
+        run(self.loop, asyncio.gather(*self.race_obj.timers.advance()))
+        self.assertTrue(self.nido_split in self.race_obj.announced_splits)
+        self.assertEqual(irc.IRC.send.call_args.args[0], 'Nidoran split standings: 1. Sidosh - 07:03.24. 2. Yujito - 07:10.30.')
+
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        self.assertEqual(irc.IRC.send.call_args.args[0], 'Nidoran late arrival: 3. Abdalain - 07:15.38')
+        self.assertEqual(len(self.race_obj.timers), 0)
+
+    def test_auto_ignore_absent_runner(self):
+        self.race_obj._now = Mock(return_value=1000)
+        self.race_obj.runner_presence('Abdalain', False)
+        self.assertFalse(self.race_obj.update_auto_ignores(1000 + race.ABSENT_GRACE))
+        # the absence clock starts with the race
+        self.race_obj._now.return_value = 2000
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        self.assertFalse(self.race_obj.update_auto_ignores(2000 + race.ABSENT_GRACE - 1))
+        self.assertTrue(self.race_obj.update_auto_ignores(2000 + race.ABSENT_GRACE))
+        abdalain = self.race_obj.runners.get('abdalain')
+        self.assertTrue(abdalain.ignored)
+
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        self.assertFalse(abdalain.ignored)
+        self.assertEqual(self.race_obj.auto_ignored, set())
+
+    def test_auto_ignore_runners_in_room(self):
+        tracked = Race('q7bsl', self.bot)
+        tracked.auto_ignore = True
+        tracked._now = Mock(return_value=1000)
+        tracked._update_irc_watchers = AsyncMock()
+        self.bot.races['q7bsl'] = tracked
+        names = ':irc.speedrunslive.com 353 xd_bot_xd = #srl-q7bsl-livesplit :xd_bot_xd @Sidosh +Yujito Abdalain'
+        run(self.loop, self.bot.srl_irc.handle_message(Message(names)))
+        run(self.loop, tracked._update_runners(self.race_obj.entrants))
+        for runner in tracked.runners:
+            runner.update_status('Ready')
+        self.assertFalse(tracked.update_auto_ignores(1000 + race.ABSENT_GRACE))
+
+        tracked._now.return_value = 2000
+        run(self.loop, tracked.add_time('yujito', self.nido_split_2))
+        tracked.cancel_jobs()
+        self.assertFalse(tracked.update_auto_ignores(2000 + race.ABSENT_GRACE - 1))
+        self.assertEqual(tracked.update_auto_ignores(2000 + race.ABSENT_GRACE), {tracked.runners.get('vidgmaddiict')})
+
+        # a LiveSplit that drops its connection quits instead of parting
+        quit = ':Abdalain!Abdalain@SRL-5C0AA961.triad.res.rr.com QUIT :Read error'
+        run(self.loop, self.bot.srl_irc.handle_message(Message(quit)))
+        tracked.cancel_jobs()
+        self.assertEqual(tracked.update_auto_ignores(2000 + 2 * race.ABSENT_GRACE), {tracked.runners.get('abdalain')})
+
+    def test_auto_ignore_stale_runner(self):
+        self.race_obj._now = Mock(return_value=0)
+        splits = [parse_timestamp(f'RealTime "{name}" {minutes}:00.00')
+                  for name, minutes in (('Nido', 7), ('Brock', 12), ('Misty', 30))]
+        for user in ('sidosh', 'yujito', 'vidgmaddiict'):
+            for split in splits:
+                run(self.loop, self.race_obj.add_time(user, split))
+
+        self.assertFalse(self.race_obj.update_auto_ignores(race.STALE_SECONDS - 1))
+        self.assertTrue(self.race_obj.update_auto_ignores(race.STALE_SECONDS))
+        self.assertEqual(self.race_obj.auto_ignored, {self.race_obj.runners.get('abdalain')})
+
+        self.race_obj.runners.get('abdalain').ignored = False
+        self.race_obj._now.return_value = race.STALE_SECONDS
+        self.race_obj._runner_split(self.race_obj.runners.get('abdalain'), False)
+        self.assertFalse(self.race_obj.update_auto_ignores(race.STALE_SECONDS))
+
+    def test_settle_window(self):
+        self.race_obj.settle_window = 1
+        undo = parse_timestamp('RealTime "Nido" -')
+        for time_data in (self.nido_split_1, undo, self.nido_split_2):
+            run(self.loop, self.race_obj.add_time('sidosh', time_data))
+        for time_data in (self.nido_split_2, undo):
+            run(self.loop, self.race_obj.add_time('yujito', time_data))
+        self.assertFalse(self.race_obj.runners.get('sidosh').completed_split(self.nido_split))
+
+        run(self.loop, self.race_obj.settlers['sidosh'].flush())
+        run(self.loop, self.race_obj.settlers['yujito'].flush())
+        self.assertEqual(self.race_obj.runners.get('sidosh').get_split_time(self.nido_split), self.nido_split_2)
+        self.assertFalse(self.race_obj.runners.get('yujito').completed_split(self.nido_split))
+        self.assertEqual(self.race_obj.suppressed_flips, 4)
+        irc.IRC.send.assert_not_called()
+
+    def test_overlapping_split_checks(self):
+        for user, time_data in (('sidosh', self.nido_split_1), ('yujito', self.nido_split_2),
+                                ('abdalain', self.nido_split_3), ('vidgmaddiict', self.nido_split_4)):
+            self.race_obj.runners.add_split_time(user, self.nido_split, time_data)
+        run(self.loop, asyncio.gather(self.race_obj._check_split_announcement(self.nido_split),
+                                                    self.race_obj._check_split_announcement(self.nido_split)))
+        self.assertEqual(irc.IRC.send.call_count, len(self.race_obj.twitch_irc_watchers))
+        self.assertEqual(self.race_obj.announced_splits, [self.nido_split])
+
+    @unittest.skipIf(splitmatrix.np is None, 'numpy is not installed')
+    def test_large_race_uses_matrix(self):
+        large = Race('q7bsl', self.bot)
+        large.large_race_size = len(self.race_obj.runners)
+        large._update_irc_watchers = AsyncMock()
+        run(self.loop, large._update_runners(self.race_obj.entrants))
+        self.assertIsInstance(large.runners, splitmatrix.MatrixRunnerSet)
+        self.assertEqual(len(large.runners), len(self.race_obj.runners))
+
+    def test_journal_replay(self):
+        undo = parse_timestamp('RealTime "Nido" -')
+        self.bot.twitch_irc._join = AsyncMock()
+        with tempfile.TemporaryDirectory() as directory:
+            self.race_obj.start_journal(Journal('q7bsl', directory))
+            self.race_obj.set_watchlist('vidgmaddiict', 'sidosh')
+            for user, time_data in (('sidosh', self.nido_split_1), ('yujito', self.nido_split_2),
+                                    ('abdalain', self.nido_split_3), ('vidgmaddiict', self.nido_split_4),
+                                    ('abdalain', undo)):
+                run(self.loop, self.race_obj.add_time(user, time_data))
+            self.race_obj.set_watchlist('sidosh', 'abdalain')
+            self.race_obj.ignore_runner('yujito', True)
+            run(self.loop, self.race_obj.add_external_watcher('hwangbro'))
+            self.race_obj.update_settings(silenced=True, spoiler=True, announce_policy=AnnouncePolicy(top=3))
+            run(self.loop, events.bus.drain())
+            self.race_obj.journals.close('q7bsl')
+            journaled = read_events('q7bsl', directory)
+
+        self.assertEqual([event['event'] for event in journaled],
+                         ['WatchlistChanged', 'SplitRecorded', 'WatchedSplitAnnounced', 'SplitRecorded',
+                          'SplitRecorded', 'SplitRecorded', 'SplitCompleted', 'SplitUndone', 'WatchlistChanged',
+                          'RunnerIgnored', 'WatcherAdded', 'SettingsChanged'])
+
+        recovered = Race('q7bsl', self.bot)
+        run(self.loop, recovered._update_runners(self.race_obj.entrants))
+        for runner in recovered.runners:
+            runner.update_status('Ready')
+        recovered.replay(journaled)
+        self.assertEqual(recovered.runners.overall_standings_list(), self.race_obj.runners.overall_standings_list())
+        self.assertFalse(recovered.runners.get('abdalain').completed_split(self.nido_split))
+        self.assertEqual(recovered.announced_splits, [self.nido_split])
+        self.assertTrue(recovered.runners.get('yujito').ignored)
+        self.assertEqual(recovered.runners.watchlist('sidosh'), self.race_obj.runners.watchlist('sidosh'))
+        self.assertEqual(recovered.runners.get('vidgmaddiict').announced_watched_splits, {'Nidoran'})
+        self.assertIn('hwangbro', recovered.twitch_irc_watchers)
+        self.assertTrue(recovered.silenced)
+        self.assertTrue(recovered.spoiler)
+        self.assertEqual(recovered.announce_policy, AnnouncePolicy(top=3))
+
     def test_get_split_standings_with_ff(self):
         self.race_obj.runners.get('yujito').update_status('Forfeit')
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
 
@@ -388,10 +684,10 @@ class TestRace(unittest.TestCase):
 
 
     def test_get_split_standings_with_skips(self):
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
-        self.loop.run_until_complete(self.race_obj.add_time('yujito', self.nido_split_skip))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_skip))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
 
@@ -401,9 +697,9 @@ class TestRace(unittest.TestCase):
 
     def test_get_split_standings_with_skips_and_ff(self):
         self.race_obj.runners.get('yujito').update_status('Forfeit')
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
         announcement = self.race_obj.runners.split_standings(self.nido_split, self.race_obj.runners)
@@ -412,9 +708,9 @@ class TestRace(unittest.TestCase):
 
     def test_get_split_standings_with_ignored(self):
         self.race_obj.runners.get('yujito').ignored = True
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_4))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
 
@@ -424,9 +720,9 @@ class TestRace(unittest.TestCase):
 
     def test_get_split_standings_with_ignored_and_skip(self):
         self.race_obj.runners.get('yujito').ignored = True
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('abdalain', self.nido_split_3))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('abdalain', self.nido_split_3))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
 
@@ -437,7 +733,7 @@ class TestRace(unittest.TestCase):
         self.race_obj.runners.get('yujito').ignored = True
         self.race_obj.runners.get('vidgmaddiict').update_status('Forfeit')
         self.race_obj.runners.get('abdalain').update_status('Forfeit')
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
 
@@ -447,8 +743,8 @@ class TestRace(unittest.TestCase):
     def test_get_split_standings_with_ignored_and_skip_and_ff(self):
         self.race_obj.runners.get('yujito').ignored = True
         self.race_obj.runners.get('abdalain').update_status('Forfeit')
-        self.loop.run_until_complete(self.race_obj.add_time('sidosh', self.nido_split_1))
-        self.loop.run_until_complete(self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('vidgmaddiict', self.nido_split_skip))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
 
@@ -519,13 +815,15 @@ class TestFinishingRace(unittest.TestCase):
         }
         race_data = SRLRace(**race_dict)
         self.race_obj = Race(race_data.id, self.discord_bot)
+        self.race_obj.scheduler = Scheduler(TimerWheel(tick=race.COMMENT_REFRESH_DELAY))
+        self.discord_bot.races[self.race_obj.race_id] = self.race_obj
 
         self._sleep = asyncio.sleep
         asyncio.sleep = Mock(auto_spec=True, side_effect=self.sleep_mock)
 
         self.loop = asyncio.get_event_loop()
 
-        self.loop.run_until_complete(self.race_obj._update_runners(race_data.entrants))
+        run(self.loop, self.race_obj._update_runners(race_data.entrants))
 
         self.race_obj.runners.get('sidosh').update_status('Ready')
         self.race_obj.runners.get('yujito').update_status('Ready')
@@ -541,6 +839,8 @@ class TestFinishingRace(unittest.TestCase):
         self.done_split = self.race_obj.tracked_splits['Done']
 
     def tearDown(self):
+        self.race_obj.cancel_jobs()
+
         irc.IRC.send.reset_mock()
         irc.IRC.send = self._send
 
@@ -570,21 +870,38 @@ class TestFinishingRace(unittest.TestCase):
 
         self.assertFalse(self.race_obj.runners.split_is_complete(self.done_split))
 
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('abdalain', self.done_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
+        run(self.loop, self.race_obj.finish_race_for_user('abdalain', self.done_split_2))
 
         self.assertFalse(self.race_obj.runners.split_is_complete(self.done_split))
 
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('yujito', self.done_split_3))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('vidgmaddiict', self.done_split_4))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', self.done_split_3))
+        run(self.loop, self.race_obj.finish_race_for_user('vidgmaddiict', self.done_split_4))
 
         self.assertTrue(self.race_obj.runners.split_is_complete(self.done_split))
 
         self.assertEqual(irc.IRC.send.call_count, 4)
         race_db.update_race.assert_called_once_with('q7bsl', True)
         self.assertEqual(irc.IRC._part.call_count, 5)
+        # the results are posted by the bot's RaceFinished subscriber
+        run(self.loop, self.race_obj.events.drain())
         self.assertEqual(bot.DiscordBot.send_message.call_count, 2)
-        self.assertEqual(asyncio.sleep.call_count, 2)
+        asyncio.sleep.assert_not_called()
+
+        # comments are refreshed by the scheduler instead of sleeping inline
+        (job, due_in), (evict, _) = self.race_obj.scheduler.pending('q7bsl')
+        self.assertEqual((job.name, job.runs_left, due_in), ('comments', 2, race.COMMENT_REFRESH_DELAY))
+        self.assertEqual(evict.name, 'evict')
+        wheel = self.race_obj.scheduler.wheel
+        for _ in range(race.COMMENT_REFRESHES):
+            run(self.loop, asyncio.gather(*wheel.advance()))
+        self.assertEqual(Race.update_race_comments.call_count, race.COMMENT_REFRESHES)
+
+        # the finished race is compacted once its retention period passed
+        while ('q7bsl', 'evict') in self.race_obj.scheduler:
+            run(self.loop, asyncio.gather(*wheel.advance()))
+        self.assertNotIn('q7bsl', self.discord_bot.races)
+        self.assertTrue(self.discord_bot.finished_races['q7bsl'].results.startswith('Race q7bsl results:'))
 
         exp_standings = [
             '1. Sidosh: (01:50:03.24)',
@@ -594,6 +911,50 @@ class TestFinishingRace(unittest.TestCase):
         ]
         self.assertEqual(exp_standings, self.race_obj.runners.overall_standings_list(True))
 
+    def test_evicted_when_discord_fails(self):
+        bot.DiscordBot.send_message.side_effect = ConnectionError('discord is down')
+        run(self.loop, self.discord_bot.post_race_results(RaceFinished('q7bsl', 'results')))
+        self.assertIn(('q7bsl', 'evict'), self.race_obj.scheduler)
+        self.assertNotIn(('q7bsl', 'comments'), self.race_obj.scheduler)
+        self.assertIsNone(self.race_obj.announcement_msg)
+
+    def test_split_held_then_done(self):
+        self.race_obj._schedule_reconcile = Mock()
+        self.race_obj.settle_window = 1
+        self.race_obj.runners.get('abdalain').update_status('Forfeit')
+        self.race_obj.runners.get('vidgmaddiict').update_status('Forfeit')
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        run(self.loop, self.race_obj.add_time('yujito', self.nido_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', parse_timestamp('RealTime 01:50:03.24')))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', parse_timestamp('RealTime 01:51:10.30')))
+
+        nido = self.race_obj.tracked_splits['Nido']
+        self.assertTrue(self.race_obj.finished)
+        self.assertEqual(self.race_obj.runners.get('yujito').recorded_time(nido), self.nido_split_2)
+        self.assertEqual(self.race_obj.announced_splits, [nido, self.done_split])
+        self.assertFalse(self.race_obj.held_splits)
+
+    def test_held_split_recorded_on_cancel(self):
+        self.race_obj.settle_window = 1
+        run(self.loop, self.race_obj.add_time('sidosh', self.nido_split_1))
+        self.race_obj.cancel_jobs()
+        nido = self.race_obj.tracked_splits['Nido']
+        self.assertEqual(self.race_obj.runners.get('sidosh').recorded_time(nido), self.nido_split_1)
+        irc.IRC.send.assert_not_called()
+
+    def test_overlapping_finish(self):
+        finished = []
+        self.race_obj.events.subscribe('test finished', finished.append, RaceFinished)
+        try:
+            run(self.loop, asyncio.gather(self.race_obj._handle_finish_race(),
+                                                        self.race_obj._handle_finish_race()))
+            run(self.loop, self.race_obj.events.drain())
+        finally:
+            self.race_obj.events.unsubscribe('test finished')
+        self.assertEqual(len(finished), 1)
+        self.assertEqual(irc.IRC.send.call_count, 4)
+        race_db.update_race.assert_called_once_with('q7bsl', True)
+
     def test_finishing_race_with_ff(self):
         self.done_split_1 = parse_timestamp('RealTime 01:50:03.24')
         self.done_split_2 = parse_timestamp('RealTime 01:51:10.30')
@@ -602,8 +963,8 @@ class TestFinishingRace(unittest.TestCase):
 
         self.assertFalse(self.race_obj.runners.split_is_complete(self.done_split))
 
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('yujito', self.done_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', self.done_split_2))
 
         self.assertTrue(self.race_obj.runners.split_is_complete(self.done_split))
 
@@ -611,6 +972,7 @@ class TestFinishingRace(unittest.TestCase):
         race_db.update_race.assert_called_once_with('q7bsl', True)
 
         self.assertEqual(irc.IRC._part.call_count, 5)
+        run(self.loop, self.race_obj.events.drain())
         self.assertEqual(bot.DiscordBot.send_message.call_count, 2)
 
         exp_standings = [
@@ -624,14 +986,14 @@ class TestFinishingRace(unittest.TestCase):
     def test_finishing_race_with_last_ff(self):
         self.done_split_1 = parse_timestamp('RealTime 01:50:03.24')
         self.done_split_2 = parse_timestamp('RealTime 01:51:10.30')
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('yujito', self.done_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', self.done_split_2))
         irc.IRC.send.assert_not_called()
         self.assertFalse(self.race_obj.runners.split_is_complete(self.done_split))
         race_data = SRLRace(**self.race_dict_ff)
-        announce = self.loop.run_until_complete(self.race_obj._update_runners(race_data.entrants))
+        announce = run(self.loop, self.race_obj._update_runners(race_data.entrants))
         self.assertTrue(announce)
-        self.loop.run_until_complete(self.race_obj._check_all_splits_announcement())
+        run(self.loop, self.race_obj._check_all_splits_announcement())
         self.assertTrue(self.race_obj.runners.split_is_complete(self.done_split))
         self.assertEqual(irc.IRC.send.call_count, 2)
 
@@ -643,8 +1005,8 @@ class TestFinishingRace(unittest.TestCase):
 
         self.assertFalse(self.race_obj.runners.split_is_complete(self.done_split))
 
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
-        self.loop.run_until_complete(self.race_obj.finish_race_for_user('yujito', self.done_split_2))
+        run(self.loop, self.race_obj.finish_race_for_user('sidosh', self.done_split_1))
+        run(self.loop, self.race_obj.finish_race_for_user('yujito', self.done_split_2))
 
         self.assertTrue(self.race_obj.runners.split_is_complete(self.done_split))
 
@@ -652,6 +1014,7 @@ class TestFinishingRace(unittest.TestCase):
         race_db.update_race.assert_called_once_with('q7bsl', True)
 
         self.assertEqual(irc.IRC._part.call_count, 5)
+        run(self.loop, self.race_obj.events.drain())
         self.assertEqual(bot.DiscordBot.send_message.call_count, 2)
 
         exp_str = '||1. Sidosh: (01:50:03.24)\n2. Yujito: (01:51:10.30)\nN/A. Abdalain: (Forfeit)\nN/A. vidgmaddiict: (Forfeit)||'
@@ -695,18 +1058,34 @@ class TestAddRunners(unittest.TestCase):
         irc.IRC._part = self._part
 
     def test_adding_one_runner(self):
-        self.loop.run_until_complete(self.race_obj._update_runners(self.race_data.entrants))
+        run(self.loop, self.race_obj._update_runners(self.race_data.entrants))
         self.assertEqual(len(self.race_obj.runners), 4)
         self.assertEqual(len(self.race_obj.twitch_irc_watchers), 3)
 
     def test_adding_blacklisted_runners(self):
         blacklist.add_user('yujitoo')
         self.assertTrue(blacklist.check_user('yujitoo'))
-        self.loop.run_until_complete(self.race_obj._update_runners(self.race_data.entrants))
+        run(self.loop, self.race_obj._update_runners(self.race_data.entrants))
         self.assertEqual(len(self.race_obj.runners), 4)
         self.assertEqual(len(self.race_obj.twitch_irc_watchers), 2)
         blacklist.remove_user('yujitoo')
 
+    def test_update_runners_only_changed(self):
+        run(self.loop, self.race_obj._update_runners(self.race_data.entrants))
+        self.assertEqual(irc.IRC._join.call_count, 3)
+
+        run(self.loop, self.race_obj._update_runners(self.race_data.entrants))
+        self.assertEqual(irc.IRC._join.call_count, 3)
+        irc.IRC._part.assert_not_called()
+
+        entrants = dict(self.race_data.entrants)
+        entrants['Abdalain'] = dataclasses.replace(entrants['Abdalain'], statetext='Forfeit')
+        announce = run(self.loop, self.race_obj._update_runners(entrants))
+        self.assertTrue(announce)
+        self.assertTrue(self.race_obj.runners.get('abdalain').forfeit)
+        irc.IRC._part.assert_called_once_with('abdalain')
+        self.assertEqual(self.race_obj.twitch_irc_watchers, {'vidgmaddiict', 'yujitoo'})
+
     def test_removing_user_before_race_starts(self):
         race_dict = {'id': 'q7bsl', 'game': {'id': 6, 'name': 'Pokémon Red/Blue', 'abbrev': 'pkmnredblue', 'popularity': 382.0, 'popularityrank': 5
             }, 'goal': 'any% glitchless no it', 'time': 1624728151, 'state': 3, 'statetext': 'In Progress', 'filename': '', 'numentrants': 4, 'entrants':
@@ -717,10 +1096,10 @@ class TestAddRunners(unittest.TestCase):
             }
         }
         race_data = SRLRace(**race_dict)
-        self.loop.run_until_complete(self.race_obj._update_runners(self.race_data.entrants))
+        run(self.loop, self.race_obj._update_runners(self.race_data.entrants))
         self.assertEqual(len(self.race_obj.runners), 4)
         self.assertIsNotNone(self.race_obj.runners.get('yujito'))
-        self.loop.run_until_complete(self.race_obj._update_runners(race_data.entrants))
+        run(self.loop, self.race_obj._update_runners(race_data.entrants))
         self.assertEqual(len(self.race_obj.runners), 3)
         self.assertIsNone(self.race_obj.runners.get('yujito'))
 
@@ -748,7 +1127,7 @@ class TestStringReturns(unittest.TestCase):
         race_data = SRLRace(**race_dict)
         self.race_obj = Race(race_data.id, self.bot)
         self.loop = asyncio.get_event_loop()
-        self.loop.run_until_complete(self.race_obj._update_runners(race_data.entrants))
+        run(self.loop, self.race_obj._update_runners(race_data.entrants))
 
     def tearDown(self) -> None:
         Race._update_irc_watchers.reset_mock()
@@ -759,6 +1138,11 @@ class TestStringReturns(unittest.TestCase):
         exp_url = 'https://multitwitch.tv/abdalain/vidgmaddiict/yujitoo/'
         self.assertEqual(url, exp_url, 'Bad multitwitch link')
 
+    def test_multitwitch_link_after_forfeit(self):
+        self.assertEqual(self.race_obj.multitwitch_link, 'https://multitwitch.tv/abdalain/vidgmaddiict/yujitoo/')
+        self.race_obj.runners.get('yujito').forfeit = True
+        self.assertEqual(self.race_obj.multitwitch_link, 'https://multitwitch.tv/abdalain/vidgmaddiict/')
+
     def test_generate_user_info(self):
         info = self.race_obj.user_info
         exp_info = 'Runner info | Abdalain - twitch.tv/abdalain | Sidosh - twitch.tv/sidosh | vidgmaddiict - twitch.tv/vidgmaddiict | Yujito - twitch.tv/yujitoo | '
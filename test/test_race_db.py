@@ -30,5 +30,12 @@ class TestRaceDB(unittest.TestCase):
         self.assertFalse(race_db.check_race_is_finished('abc456'))
         self.assertEqual(race_db.delete_all_active_races(), 2)
 
+    def test_unfinished_races(self):
+        race_db.add_race('abc123')
+        race_db.add_race('abc456')
+        race_db.update_race('abc456', True)
+        self.assertIn('abc123', race_db.unfinished_races())
+        self.assertNotIn('abc456', race_db.unfinished_races())
+
 if __name__ == '__main__':
     unittest.main()
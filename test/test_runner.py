@@ -1,7 +1,7 @@
 import sys
 
 import unittest
-from runner import Runner, RunnerSet
+from runner import AnnouncePolicy, Runner, RunnerSet
 from trackedsplits import RBYSplits
 from timestamp import Timestamp, parse_timestamp, ForfeitTimestamp, BlankTimestamp, SkipTimestamp
 from srlmodels import SRLEntrant
@@ -63,6 +63,35 @@ class TestRunner(unittest.TestCase):
         self.runner.add_split(brock, brock_ts)
         self.assertEqual(self.runner.latest_split[1], brock_ts)
 
+    def test_latest_split_undo_fallback(self):
+        nido = self.splits['Nido']
+        brock = self.splits['Brock']
+        misty = self.splits['Misty']
+        self.runner.add_split(nido, parse_timestamp('RealTime "Nido" 7:20.80'))
+        self.runner.add_split(brock, parse_timestamp('RealTime "Brock" 11:58.70'))
+        self.runner.add_split(misty, parse_timestamp('RealTime "Misty" -'))
+        self.assertEqual(self.runner.latest_split[0], brock)
+
+        self.runner.undo_split(brock)
+        self.assertEqual(self.runner.latest_split[0], nido)
+
+        self.runner.add_split(nido, parse_timestamp('RealTime "Nido" -'))
+        self.assertEqual(self.runner.latest_split[0].Name, 'N/A')
+
+    def test_splits_by_position(self):
+        nido = self.splits['Nido']
+        misty = self.splits['Misty']
+        nido_ts = parse_timestamp('RealTime "Nido" 7:20.80')
+        misty_ts = parse_timestamp('RealTime "Misty" 20:01.00')
+        self.runner.add_split(misty, misty_ts)
+        self.runner.add_split(nido, nido_ts)
+
+        self.assertFalse(hasattr(self.runner, '__dict__'))
+        self.assertEqual(list(self.runner.recorded_splits()), [(nido, nido_ts), (misty, misty_ts)])
+        self.assertEqual(self.runner.recorded_time(misty), misty_ts)
+        self.assertIsNone(self.runner.recorded_time(self.splits['Brock']))
+        self.assertEqual(self.runner.splits, {nido: nido_ts, misty: misty_ts})
+
     def test_get_split_time(self):
         nido = self.splits['Nido']
         nido_ts = parse_timestamp('RealTime "Nido" 7:20.80')
@@ -212,6 +241,19 @@ class TestRunnerSet(unittest.TestCase):
         self.assertIsNotNone(self.runner_set.get('hwangbroXD'))
         self.assertIsNone(self.runner_set.get('hwang'))
 
+    def test_get_after_remove(self):
+        self.runner_set.remove(self.runner)
+        self.assertIsNone(self.runner_set.get('hwangbro'))
+        self.assertIsNone(self.runner_set.get('hwangbroxd'))
+        self.runner_set.add(self.runner)
+        self.assertEqual(self.runner_set.get('HWANGBROXD'), self.runner)
+
+    def test_get_after_rename(self):
+        self.runner2.twitch_user = 'araya_'
+        self.assertIsNone(self.runner_set.get('arayalol'))
+        self.assertEqual(self.runner_set.get('araya_'), self.runner2)
+        self.assertEqual(self.runner_set.get('araya'), self.runner2)
+
     def test_user_ignore(self):
         self.assertTrue(self.runner_set.user_ignore('hwangbro', True))
         self.assertTrue(self.runner.ignored)
@@ -250,6 +292,15 @@ class TestRunnerSet(unittest.TestCase):
         self.runner2.add_split(self.nido_split, self.nido_ts)
         self.assertTrue(self.runner_set.split_is_complete(self.nido_split, subset))
 
+    def test_split_is_complete_after_remove(self):
+        self.runner.add_split(self.nido_split, self.nido_ts)
+        self.runner2.add_split(self.nido_split, self.nido_ts)
+        self.assertFalse(self.runner_set.split_is_complete(self.nido_split))
+        self.runner_set.remove(self.runner3)
+        self.assertTrue(self.runner_set.split_is_complete(self.nido_split))
+        self.runner.undo_split(self.nido_split)
+        self.assertFalse(self.runner_set.split_is_complete(self.nido_split))
+
     def test_add_split_time_normal(self):
         self.runner_set.add_split_time('hwangbro', self.nido_split, self.nido_ts)
         self.assertTrue(self.nido_split in self.runner.splits)
@@ -301,6 +352,45 @@ class TestRunnerSet(unittest.TestCase):
         ret = self.runner_set.check_subset_announce(self.nido_split)
         self.assertEqual(ret, {self.runner3})
 
+    def test_check_global_announce_policy(self):
+        self.assertEqual(AnnouncePolicy().quorum(10), 10)
+        self.assertEqual(AnnouncePolicy(top=3).quorum(10), 3)
+        self.assertEqual(AnnouncePolicy(percent=25).quorum(10), 3)
+        self.assertEqual(AnnouncePolicy(top=2, percent=50).quorum(10), 2)
+
+        policy = AnnouncePolicy(percent=50)
+        self.runner.add_split(self.nido_split, self.nido_ts)
+        self.assertEqual(self.runner_set.check_global_announce(self.nido_split), (False, False))
+        self.assertEqual(self.runner_set.check_global_announce(self.nido_split, policy), (False, False))
+        self.runner3.update_status('Forfeit')
+        self.assertEqual(self.runner_set.check_global_announce(self.nido_split, policy), (True, False))
+
+        self.runner.add_split(self.done_split, self.nido_ts)
+        self.assertEqual(self.runner_set.check_global_announce(self.done_split, policy), (False, False))
+
+    def test_subset_announce_groups(self):
+        self.runner.watched_runners = {'arayalol'}
+        self.runner3.watched_runners = {'arayalol'}
+        self.runner2.watched_runners = {'hwangbroxd'}
+        self.runner2.add_split(self.nido_split, self.nido_ts)
+        groups = self.runner_set.subset_announce_groups(self.nido_split)
+        self.assertEqual(groups, {frozenset({self.runner2}): {self.runner, self.runner3}})
+        self.assertEqual(self.runner_set.subset_announce_groups(self.nido_split), {})
+
+    def test_check_subset_announce_for_runner(self):
+        self.runner_set.set_watchlist('hwangbroxd', 'araya')
+        self.runner_set.set_watchlist('franchewbacca', 'hwangbro')
+        self.runner2.add_split(self.nido_split, self.nido_ts)
+        self.runner.add_split(self.nido_split, self.nido_ts)
+        self.assertEqual(self.runner_set.check_subset_announce(self.nido_split, self.runner), {self.runner3})
+        self.assertEqual(self.runner_set.check_subset_announce(self.nido_split, self.runner2), {self.runner})
+
+    def test_watchlist_runner_removed(self):
+        self.runner_set.set_watchlist('hwangbroxd', 'araya, franchewbacca')
+        self.runner_set.remove(self.runner2)
+        self.assertEqual(self.runner_set.watchlist('hwangbroxd'), {'franchewbacca'})
+        self.assertEqual(self.runner_set.watchers, {self.runner3: {self.runner}})
+
     def test_check_global_announce(self):
         self.assertEqual(self.runner_set.check_global_announce(self.nido_split), (False, False))
         self.runner.add_split(self.nido_split, self.nido_ts)
@@ -405,6 +495,32 @@ class TestRunnerSet(unittest.TestCase):
 
         self.assertEqual(self.runner_set.overall_standings_list(), exp_standings)
 
+    def test_overall_standings_list_reorders_on_undo(self):
+        self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 6, 50, 0))
+        self.runner2.add_split(self.splits['Brock'], Timestamp('Brock', 0, 11, 50, 0))
+        self.assertEqual(self.runner_set.overall_standings_list()[0], '1. araya: (Brock 11:50.00)')
+
+        self.runner2.undo_split(self.splits['Brock'])
+        exp_standings = [
+            '1. hwangbro: (Nidoran 06:50.00)',
+            '2. araya: (N/A)',
+            '3. franchewbacca: (N/A)'
+        ]
+        self.assertEqual(self.runner_set.overall_standings_list(), exp_standings)
+        self.assertEqual(self.runner_set.ordered(), [self.runner, self.runner2, self.runner3])
+
+    def test_standings_cached_until_change(self):
+        self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 6, 50, 0))
+        standings = self.runner_set.standings(False)
+        version = self.runner_set.version
+        self.assertIs(self.runner_set.standings(False), standings)
+        self.assertEqual(self.runner_set.version, version)
+
+        self.runner2.add_split(self.nido_split, Timestamp('Nido', 0, 6, 40, 0))
+        self.assertGreater(self.runner_set.version, version)
+        self.assertNotEqual(self.runner_set.standings(False), standings)
+        self.assertEqual(self.runner_set.overall_standings_list()[0], '1. araya: (Nidoran 06:40.00)')
+
     def test_overall_standings_list_all_finished(self):
         self.runner.add_split(self.done_split, Timestamp('Done', 1, 52, 0, 0))
         self.runner2.add_split(self.done_split, Timestamp('Done', 1, 50, 0, 0))
@@ -455,6 +571,71 @@ class TestRunnerSet(unittest.TestCase):
 
         self.assertEqual(self.runner_set.overall_standings_list(True, True), exp_standings)
 
+    def test_gaps_str(self):
+        self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 6, 50, 0))
+        self.runner2.add_split(self.nido_split, Timestamp('Nido', 0, 7, 0, 0))
+        self.runner3.add_split(self.nido_split, Timestamp('Nido', 0, 7, 30, 0))
+        self.assertEqual(self.runner_set.gaps_str('hwangbro'), 'hwangbro at Nidoran: place 1')
+        self.assertEqual(self.runner_set.gaps_str('arayalol'), 'araya at Nidoran: place 2, +00:10.00 to leader hwangbro')
+        self.assertEqual(self.runner_set.gaps_str('franchewbacca'),
+                         'franchewbacca at Nidoran: place 3, +00:40.00 to leader hwangbro, +00:30.00 to araya')
+
+        self.runner.undo_split(self.nido_split)
+        self.assertEqual(self.runner_set.gaps_str('franchewbacca'),
+                         'franchewbacca at Nidoran: place 2, +00:30.00 to leader araya')
+        self.assertEqual(self.runner_set.gaps_str('hwangbro'), 'hwangbro has no splits yet')
+        self.assertEqual(self.runner_set.gaps_str('nobody'), '')
+
+    def test_gaps_str_ignored(self):
+        self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 6, 50, 0))
+        self.runner2.add_split(self.nido_split, Timestamp('Nido', 0, 7, 0, 0))
+        self.runner.ignored = True
+        self.assertEqual(self.runner_set.gaps_str('hwangbro'), 'hwangbro is ignored')
+        self.assertEqual(self.runner_set.gaps_str('araya'), 'araya at Nidoran: place 1')
+        self.runner.update_status('Forfeit')
+        self.assertEqual(self.runner_set.gaps_str('hwangbro'), 'hwangbro has forfeited')
+
+    def test_split_position(self):
+        self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 7, 20, 0))
+        self.runner2.add_split(self.nido_split, Timestamp('Nido', 0, 6, 50, 0))
+        self.runner3.add_split(self.nido_split, Timestamp('Nido', 0, 7, 30, 0))
+
+        self.assertEqual(self.runner_set.split_position(self.runner2, self.nido_split), (1, 3, None, 0))
+        self.assertEqual(self.runner_set.split_position(self.runner3, self.nido_split), (3, 3, self.runner, 10000))
+        self.assertEqual(self.runner_set.position_str(self.runner, self.nido_split),
+                         'hwangbro is place 2 of 3, +00:30.00 behind araya')
+        self.assertEqual(self.runner_set.top_split_standings(self.nido_split, 2),
+                         'Nidoran top 2: 1. araya - 06:50.00. 2. hwangbro - 07:20.00.')
+
+        self.runner2.update_status('Forfeit')
+        self.assertIsNone(self.runner_set.split_position(self.runner2, self.nido_split))
+        self.assertEqual(self.runner_set.split_position(self.runner, self.nido_split), (1, 2, None, 0))
+        self.runner2.update_status('Ready')
+        self.assertEqual(self.runner_set.split_position(self.runner, self.nido_split), (2, 3, self.runner2, 30000))
+
+    def test_segments_str(self):
+        self.runner.add_split(self.splits['Rival 1'], Timestamp('Rival 1', 0, 3, 0, 0))
+        self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 6, 50, 0))
+        self.runner.add_split(self.splits['Brock'], SkipTimestamp('Brock'))
+        self.runner.add_split(self.splits['Route 3'], Timestamp('Route 3', 0, 15, 0, 0))
+        self.assertEqual(self.runner_set.segments_str('hwangbro'),
+                         'hwangbro segments: Rival 1 03:00.00 | Nidoran 03:50.00 | Route 3 08:10.00')
+        self.assertEqual(self.runner_set.segments_str('araya'), 'araya has no splits yet')
+
+        # only the segments around a changed split are updated
+        self.runner.undo_split(self.nido_split)
+        self.assertEqual(self.runner_set.segments_str('hwangbro'),
+                         'hwangbro segments: Rival 1 03:00.00 | Route 3 12:00.00')
+        self.runner.add_split(self.splits['Brock'], Timestamp('Brock', 0, 10, 0, 0))
+        self.assertEqual(self.runner_set.segments_str('hwangbro'),
+                         'hwangbro segments: Rival 1 03:00.00 | Brock 07:00.00 | Route 3 05:00.00')
+
+        # splits recorded out of order make a negative segment
+        self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 7, 0, 0))
+        self.runner.add_split(self.splits['Brock'], Timestamp('Brock', 0, 6, 55, 0))
+        self.assertEqual(self.runner_set.segments_str('hwangbro'),
+                         'hwangbro segments: Rival 1 03:00.00 | Nidoran 04:00.00 | Brock -00:05.00 | Route 3 08:05.00')
+
     def test_split_standings_normal(self):
         self.runner.add_split(self.nido_split, Timestamp('Nido', 0, 6, 50, 0))
         self.runner2.add_split(self.nido_split, Timestamp('Nido', 0, 7, 0, 0))
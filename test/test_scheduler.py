@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+from scheduler import Scheduler
+from timerwheel import TimerWheel
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.scheduler = Scheduler(TimerWheel(tick=1, slots=4))
+        self.ran = []
+
+    def tearDown(self):
+        for owner, _ in list(self.scheduler.jobs):
+            self.scheduler.cancel(owner)
+
+    def schedule(self, owner, name, delay, **kwargs):
+        async def job():
+            self.ran.append((owner, name))
+        async def schedule():
+            self.scheduler.schedule(owner, name, delay, job, **kwargs)
+        self.loop.run_until_complete(schedule())
+
+    def advance(self, ticks=1):
+        for _ in range(ticks):
+            self.loop.run_until_complete(asyncio.gather(*self.scheduler.wheel.advance()))
+
+    def test_runs_once(self):
+        self.schedule('race', 'comments', 2)
+        self.advance()
+        self.assertEqual(self.ran, [])
+        self.advance()
+        self.assertEqual(self.ran, [('race', 'comments')])
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertEqual(len(self.scheduler.wheel), 0)
+
+    def test_recurring(self):
+        self.schedule('race', 'comments', 1, every=2, times=3)
+        self.advance()
+        self.assertEqual(len(self.ran), 1)
+        [(job, due_in)] = self.scheduler.pending()
+        self.assertEqual((job.runs_left, due_in), (2, 2))
+        self.advance(4)
+        self.assertEqual(len(self.ran), 3)
+        self.assertEqual(len(self.scheduler), 0)
+
+        self.schedule('bot', 'poll', 1, every=1, times=None)
+        self.advance(5)
+        self.assertEqual(self.ran.count(('bot', 'poll')), 5)
+        self.assertIn(('bot', 'poll'), self.scheduler)
+
+    def test_cancel_owner(self):
+        self.schedule('a', 'comments', 1)
+        self.schedule('a', 'evict', 3)
+        self.schedule('b', 'comments', 2)
+        self.assertEqual([job.name for job, _ in self.scheduler.pending('a')], ['comments', 'evict'])
+        self.assertEqual(self.scheduler.cancel('a'), 2)
+        self.assertEqual(self.scheduler.cancel('b', 'evict'), 0)
+        self.advance(3)
+        self.assertEqual(self.ran, [('b', 'comments')])
+        self.assertIsNone(self.scheduler.wheel.handle)
+
+if __name__ == '__main__':
+    unittest.main()
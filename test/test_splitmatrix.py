@@ -0,0 +1,85 @@
+import unittest
+from runner import Runner, RunnerSet
+from splitmatrix import MatrixRunnerSet, np
+from srlmodels import SRLEntrant
+from timestamp import Timestamp, SkipTimestamp
+from trackedsplits import RBYSplits
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestMatrixRunnerSet(unittest.TestCase):
+    def setUp(self):
+        self.splits = RBYSplits()
+        self.nido = self.splits['Nido']
+        self.brock = self.splits['Brock']
+
+        self.python_set = self.build(RunnerSet)
+        self.matrix_set = self.build(MatrixRunnerSet)
+
+    def build(self, cls):
+        runners = cls([
+            Runner(SRLEntrant('hwangbro', '9994', -3, '', 'Ready', 'hwangbroxd', '100')),
+            Runner(SRLEntrant('araya', 9993, -2, '', 'Ready', 'arayalol', '999')),
+            Runner(SRLEntrant('franchewbacca', 9992, -1, '', 'Ready', 'franchewbacca', '100')),
+            Runner(SRLEntrant('abdalain', 9992, -1, '', 'Ready', 'abdalain', '100')),
+        ])
+        runners.get('hwangbro').add_split(self.nido, Timestamp('Nido', 0, 7, 0, 0))
+        runners.get('araya').add_split(self.nido, Timestamp('Nido', 0, 6, 50, 0))
+        runners.get('araya').add_split(self.brock, Timestamp('Brock', 0, 11, 50, 0))
+        runners.get('franchewbacca').add_split(self.nido, SkipTimestamp('Nido'))
+        return runners
+
+    def assertSame(self):
+        self.assertEqual(self.python_set.overall_standings_list(), self.matrix_set.overall_standings_list())
+        self.assertEqual([r.name for r in self.python_set.ordered()],
+                         [r.name for r in self.matrix_set.ordered()])
+        for split in (self.nido, self.brock):
+            self.assertEqual(self.python_set.split_standings(split, self.python_set),
+                             self.matrix_set.split_standings(split, self.matrix_set))
+            self.assertEqual(self.python_set.split_is_complete(split),
+                             self.matrix_set.split_is_complete(split))
+
+    def test_same_as_runner_set(self):
+        self.assertSame()
+
+    def test_same_after_forfeit_and_ignore(self):
+        for runners in (self.python_set, self.matrix_set):
+            runners.get('abdalain').update_status('Forfeit')
+            runners.get('hwangbro').ignored = True
+        self.assertSame()
+
+    def test_same_after_undo(self):
+        for runners in (self.python_set, self.matrix_set):
+            runners.get('araya').undo_split(self.brock)
+        self.assertSame()
+
+    def test_subset_ranking(self):
+        subset = {self.matrix_set.get('hwangbro'), self.matrix_set.get('araya')}
+        ranking = self.matrix_set.split_ranking(self.nido, subset)
+        self.assertEqual([r.name for r in ranking], ['araya', 'hwangbro'])
+
+    def test_remove_runner(self):
+        for runners in (self.python_set, self.matrix_set):
+            runners.remove(runners.get('araya'))
+        self.assertSame()
+
+    def test_grows(self):
+        for i in range(20):
+            runner = Runner(SRLEntrant(f'runner{i}', 9994, -3, '', 'Ready', f'twitch{i}', '0'))
+            self.matrix_set.add(runner)
+            runner.add_split(self.splits['Done'], Timestamp('Done', 1, 50, i, 0))
+        ranking = self.matrix_set.split_ranking(self.splits['Done'], self.matrix_set)
+        self.assertEqual(ranking[0].name, 'runner0')
+        self.assertEqual(len(ranking), 20)
+
+    def test_rebuilt_as(self):
+        self.python_set.set_watchlist('hwangbro', 'araya')
+        standings = self.python_set.split_standings(self.nido, self.python_set)
+        rebuilt = self.python_set.rebuilt_as(MatrixRunnerSet)
+        self.assertEqual(len(self.python_set), 0)
+        self.assertEqual(rebuilt.split_standings(self.nido, rebuilt), standings)
+        self.assertEqual(rebuilt.watchlist('hwangbro'), {'arayalol'})
+        self.assertIn(rebuilt.get('hwangbro'), rebuilt.watchers[rebuilt.get('araya')])
+        self.assertEqual(rebuilt.split_position(rebuilt.get('hwangbro'), self.nido)[0], 2)
+
+if __name__ == '__main__':
+    unittest.main()
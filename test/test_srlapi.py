@@ -1,5 +1,11 @@
+import asyncio
+import json
 import unittest
 from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
 import srlapi
 
 def mocked_request_get(*args, **kwargs):
@@ -18,34 +24,92 @@ def mocked_request_get(*args, **kwargs):
 
     return MockResponse(None, 404)
 
+async def mocked_get_json(url):
+    response = mocked_request_get(url)
+    if response.status_code == 200:
+        return json.loads(response.text)
+
 class TestSRLAPI(unittest.TestCase):
-    @mock.patch('requests.get', side_effect=mocked_request_get)
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    @mock.patch('srlapi.SRLClient._get_json', side_effect=mocked_get_json)
     def test_get_all_races(self, mock_get):
-        races = srlapi.get_all_races()
+        races = self.loop.run_until_complete(srlapi.get_all_races())
         self.assertTrue(len(races) == 2)
         self.assertTrue('Araya' in races[0].entrants)
         self.assertTrue('ravspect' in races[1].entrants)
 
-    @mock.patch('requests.get', side_effect=mocked_request_get)
+    @mock.patch('srlapi.SRLClient._get_json', side_effect=mocked_get_json)
     def test_get_single_race(self, mock_get):
-        race = srlapi.get_single_race('k5ilw')
+        race = self.loop.run_until_complete(srlapi.get_single_race('k5ilw'))
         self.assertIsNotNone(race)
         self.assertTrue(race.id, 'k5ilw')
 
-    @mock.patch('requests.get', side_effect=mocked_request_get)
+    @mock.patch('srlapi.SRLClient._get_json', side_effect=mocked_get_json)
     def test_find_race_with_user(self, mock_get):
-        race = srlapi.find_race_with_user('arayalol')
+        race = self.loop.run_until_complete(srlapi.find_race_with_user('arayalol'))
         self.assertIsNotNone(race)
 
-        race_tw = srlapi.find_race_with_user('arayalol')
+        race_tw = self.loop.run_until_complete(srlapi.find_race_with_user('arayalol'))
         self.assertIsNotNone(race_tw)
 
-        race_none = srlapi.find_race_with_user('arayayayaya')
+        race_none = self.loop.run_until_complete(srlapi.find_race_with_user('arayayayaya'))
         self.assertIsNone(race_none)
 
-        race_ff = srlapi.find_race_with_user('ravspect')
+        race_ff = self.loop.run_until_complete(srlapi.find_race_with_user('ravspect'))
         self.assertIsNone(race_ff)
 
 
+    @mock.patch('srlapi.SRLClient._get_json', side_effect=mocked_get_json)
+    def test_race_cache(self, mock_get):
+        now = [0]
+        cache = srlapi.SRLRaceCache('k5ilw', ttl=5, clock=lambda: now[0])
+        loop = self.loop
+
+        races = loop.run_until_complete(asyncio.gather(*(cache.get() for _ in range(10))))
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(all(race is races[0] for race in races))
+        self.assertEqual(races[0].id, 'k5ilw')
+
+        now[0] = 4
+        loop.run_until_complete(cache.get())
+        self.assertEqual(mock_get.call_count, 1)
+
+        now[0] = 5
+        loop.run_until_complete(cache.get())
+        self.assertEqual(mock_get.call_count, 2)
+
+        cache.invalidate()
+        loop.run_until_complete(cache.get())
+        self.assertEqual(mock_get.call_count, 3)
+
+    def test_client(self):
+        async def race(request):
+            # SRL serves its json as text/html
+            return web.Response(text=mocked_request_get(srlapi.single_race_url + 'k5ilw').text, content_type='text/html')
+
+        async def slow(request):
+            await asyncio.sleep(1)
+            return web.Response(text='{}')
+
+        app = web.Application()
+        app.router.add_get('/races/k5ilw', race)
+        app.router.add_get('/races/slow', slow)
+
+        async def fetch():
+            async with TestServer(app) as server:
+                client = srlapi.SRLClient(str(server.make_url('')), timeout=0.2)
+                try:
+                    return await asyncio.gather(client.get_single_race('k5ilw'), client.get_single_race('slow'),
+                                                client.get_single_race('missing'))
+                finally:
+                    await client.close()
+
+        found, timed_out, missing = self.loop.run_until_complete(fetch())
+        self.assertEqual(found.id, 'k5ilw')
+        self.assertIsNone(timed_out)
+        self.assertIsNone(missing)
+
 if __name__ == '__main__':
     unittest.main()
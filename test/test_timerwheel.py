@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+
+from timerwheel import TimerWheel
+
+class TestTimerWheel(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.wheel = TimerWheel(tick=1, slots=4)
+        self.fired = []
+
+    def tearDown(self):
+        for key in list(self.wheel.timers):
+            self.wheel.cancel(key)
+
+    def schedule(self, key, delay):
+        async def schedule():
+            self.wheel.schedule(key, delay, lambda: self.fired.append(key))
+        self.loop.run_until_complete(schedule())
+
+    def test_fires_after_delay(self):
+        self.schedule('a', 2)
+        self.schedule('b', 6)
+        self.wheel.advance()
+        self.assertEqual(self.fired, [])
+        self.wheel.advance()
+        self.assertEqual(self.fired, ['a'])
+
+        # 'b' shares a bucket with tick 2 but is a full turn later
+        for _ in range(3):
+            self.wheel.advance()
+        self.assertEqual(self.fired, ['a'])
+        self.wheel.advance()
+        self.assertEqual(self.fired, ['a', 'b'])
+        self.assertEqual(len(self.wheel), 0)
+        self.assertIsNone(self.wheel.handle)
+
+    def test_cancel(self):
+        self.schedule('a', 1)
+        self.assertIn('a', self.wheel)
+        self.assertTrue(self.wheel.cancel('a'))
+        self.assertFalse(self.wheel.cancel('a'))
+        self.wheel.advance()
+        self.assertEqual(self.fired, [])
+        self.assertIsNone(self.wheel.handle)
+
+    def test_reschedule(self):
+        self.schedule('a', 1)
+        self.schedule('a', 3)
+        self.assertEqual(len(self.wheel), 1)
+        self.wheel.advance()
+        self.assertEqual(self.fired, [])
+        self.wheel.advance()
+        self.wheel.advance()
+        self.assertEqual(self.fired, ['a'])
+
+if __name__ == '__main__':
+    unittest.main()
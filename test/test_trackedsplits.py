@@ -1,5 +1,8 @@
 import unittest
-from trackedsplits import RBYSplits
+import json
+import os
+import tempfile
+from trackedsplits import RBYSplits, TrackedSplit
 
 class TestTrackedSplits(unittest.TestCase):
     def test_basic_success(self):
@@ -19,5 +22,24 @@ class TestTrackedSplits(unittest.TestCase):
         nido = splits['Nidorino']
         self.assertIsNone(nido)
 
+    def test_by_position(self):
+        splits = RBYSplits()
+        self.assertEqual(splits.by_position(3).Name, 'Brock')
+        self.assertIsNone(splits.by_position(50))
+
+    def test_load_from_file(self):
+        catalog = [
+            {'position': 2, 'name': 'Nidoran', 'aliases': ['Nido', 'Nidoking']},
+            {'position': 100, 'name': 'Done'},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'splits.json')
+            with open(path, 'w') as f:
+                json.dump(catalog, f)
+            splits = RBYSplits(path)
+
+        self.assertEqual(splits['nidoking'], TrackedSplit(2, 'Nidoran', ('Nido', 'Nidoking')))
+        self.assertIsNone(splits['Brock'])
+
 if __name__ == '__main__':
     unittest.main()
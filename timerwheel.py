@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger('main')
+
+class TimerWheel:
+    '''Hashed timer wheel for race deadlines
+
+    Timers are kept in `slots` buckets by the tick they expire on, and a
+    single loop.call_later handle advances the wheel one tick at a time
+    while any timer is pending. Scheduling and cancelling are dict
+    operations, so pending timers cost nothing until their bucket comes up.
+    Timers more than a full turn away stay in their bucket until the turn
+    they expire on.
+    '''
+
+    def __init__(self, tick: float = 1, slots: int = 64):
+        self.tick = tick
+        self.wheel = [{} for _ in range(slots)] # key = timer key, value = (expiry tick, callback)
+        self.timers = {} # key = timer key, value = expiry tick
+        self.current = 0
+        self.handle = None
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, key) -> bool:
+        return key in self.timers
+
+    def schedule(self, key, delay: float, callback) -> None:
+        '''Calls callback after delay seconds, replacing any timer with the key
+
+        The callback can be a plain function or a coroutine function.
+        '''
+        self.cancel(key)
+        expiry = self.current + max(1, math.ceil(delay / self.tick))
+        self.wheel[expiry % len(self.wheel)][key] = (expiry, callback)
+        self.timers[key] = expiry
+        if self.handle is None:
+            self.handle = asyncio.get_event_loop().call_later(self.tick, self._tick)
+
+    def remaining(self, key) -> float:
+        '''Returns the seconds until a timer fires, or None if it isn't pending'''
+        if (expiry := self.timers.get(key)) is not None:
+            return (expiry - self.current) * self.tick
+
+    def cancel(self, key) -> bool:
+        '''Cancels a pending timer, returns False if there was none'''
+        if (expiry := self.timers.pop(key, None)) is None:
+            return False
+        del self.wheel[expiry % len(self.wheel)][key]
+        if not self.timers and self.handle:
+            self.handle.cancel()
+            self.handle = None
+        return True
+
+    def _tick(self) -> None:
+        self.handle = None
+        self.advance()
+        if self.timers and self.handle is None:
+            self.handle = asyncio.get_event_loop().call_later(self.tick, self._tick)
+
+    def advance(self) -> list[asyncio.Future]:
+        '''Moves the wheel one tick forward and fires the expired timers
+
+        Returns the tasks started for coroutine callbacks.
+        '''
+        self.current += 1
+        bucket = self.wheel[self.current % len(self.wheel)]
+        expired = [key for key, (expiry, _) in bucket.items() if expiry <= self.current]
+        tasks = []
+        for key in expired:
+            _, callback = bucket.pop(key)
+            del self.timers[key]
+            try:
+                if asyncio.iscoroutine(result := callback()):
+                    tasks.append(asyncio.ensure_future(result))
+            except Exception as e:
+                logger.warning(f'Timer {key} failed: {str(e)}')
+        if not self.timers and self.handle:
+            self.handle.cancel()
+            self.handle = None
+        return tasks
+
+# races keep their split deadlines and presence checks on this wheel
+wheel = TimerWheel()
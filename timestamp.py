@@ -1,6 +1,6 @@
 from pyparsing import QuotedString, Regex
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class Timestamp:
@@ -12,9 +12,12 @@ class Timestamp:
     split or a skipped/undo. In the latter cases, the timestamp
     is set to sys.maxsize to push it to the bottom of sorting for
     race standings
+
+    The split name is left out of comparisons, since runners store times
+    as ms and name them after the split's catalog name when read back.
     '''
 
-    split_name: str = ''
+    split_name: str = field(default='', compare=False)
     hours: int = 0
     minutes: int = 0
     seconds: int = 0
@@ -40,6 +43,13 @@ class Timestamp:
             return f'[{self.split_name}]: {self.time_string}'
         return self.time_string
 
+def from_ms(total_ms: int, split_name='') -> Timestamp:
+    '''Builds a Timestamp from a duration in milliseconds'''
+    seconds, ms = divmod(total_ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return Timestamp(split_name, hours, minutes, seconds, ms)
+
 class BlankTimestamp(Timestamp):
     '''Represents a "default" empty timestamp'''
     @property
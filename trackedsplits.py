@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+import json
+import os
 from typing import Tuple
 
 @dataclass(eq=True, frozen=True)
@@ -21,45 +23,52 @@ class TrackedSplit:
         alias_match = name in {alias.lower() for alias in self.Aliases}
         return exact_match or alias_match
 
+    def __hash__(self):
+        # equal splits always share a position, and this avoids hashing the
+        # whole field tuple on every dict and set lookup
+        return hash(self.Position)
+
     def __repr__(self):
         return f'{self.Name} - Position: {self.Position}'
 
 class TrackedSplits:
-    '''Class represents the collection of TrackedSplits that make up a run'''
-    def __init__(self):
-        self.splits = []
+    '''Class represents the collection of TrackedSplits that make up a run
+
+    Lookups by name go through a compiled index of lowercased names and
+    aliases, so the collection should be treated as immutable once built.
+    Reloading a catalog means building a new TrackedSplits and swapping it in.
+    '''
+    def __init__(self, splits=()):
+        self.splits = list(splits)
+        self.index = {}
+        self.positions = {}
+        for split in self.splits:
+            self.positions.setdefault(split.Position, split)
+            for name in (split.Name, *split.Aliases):
+                self.index.setdefault(name.lower(), split)
 
     def __getitem__(self, name):
         if isinstance(name, int):
             return self.splits[name]
-        split = [x for x in self.splits if x.matches(name)]
-        if split:
-            return split[0]
+        return self.index.get(name.lower())
+
+    def by_position(self, position: int) -> TrackedSplit:
+        '''Returns the split at a given position, or None'''
+        return self.positions.get(position)
+
+def load_splits(path: str) -> list[TrackedSplit]:
+    '''Reads a split catalog from a json file
+
+    The file is a list of objects with a position, name and optional aliases.
+    '''
+
+    with open(path, encoding='utf8') as f:
+        catalog = json.load(f)
+    return [TrackedSplit(int(x['position']), x['name'], tuple(x.get('aliases', ())))
+            for x in catalog]
+
+RBY_SPLITS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rby_splits.json')
 
 class RBYSplits(TrackedSplits):
-    def __init__(self):
-        super().__init__()
-        self.splits.append(TrackedSplit(-1, 'Forfeit'))
-        self.splits.append(TrackedSplit(0, 'N/A'))
-        self.splits.append(TrackedSplit(1, 'Rival 1', ('Rival', 'Blue 1', 'Gary 1', 'Leave Lab')))
-        self.splits.append(TrackedSplit(2, 'Nidoran', ('Nido', 'NidoranM')))
-        self.splits.append(TrackedSplit(3, 'Brock'))
-        self.splits.append(TrackedSplit(4, 'Route 3', ('Route 03', 'Rt 3', 'Rt. 3', 'Rt. 03')))
-        self.splits.append(TrackedSplit(5, 'Mt. Moon', ('Mt Moon', 'Moon')))
-        self.splits.append(TrackedSplit(6, 'Nugget Bridge', ('Bridge',)))
-        self.splits.append(TrackedSplit(7, 'Misty'))
-        self.splits.append(TrackedSplit(8, 'Surge', ('Lt Surge', 'Lt. Surge')))
-        self.splits.append(TrackedSplit(9, 'Fly', ('HM02', 'HM 02', 'HM Fly')))
-        self.splits.append(TrackedSplit(10, 'Flute', ('PokeFlute', 'Poke Flute')))
-        self.splits.append(TrackedSplit(11, 'Koga'))
-        self.splits.append(TrackedSplit(12, 'Erika'))
-        self.splits.append(TrackedSplit(13, 'Blaine'))
-        self.splits.append(TrackedSplit(14, 'Sabrina'))
-        self.splits.append(TrackedSplit(15, 'Giovanni', ('Gio 2',)))
-        self.splits.append(TrackedSplit(16, 'Lorelei'))
-        self.splits.append(TrackedSplit(17, 'Bruno'))
-        self.splits.append(TrackedSplit(18, 'Agatha'))
-        self.splits.append(TrackedSplit(19, 'Lance'))
-        self.splits.append(TrackedSplit(20, 'Champion', ('Champ', 'Blue')))
-        self.splits.append(TrackedSplit(21, 'Hall of Fame', ('HoF', 'End'))) # redundant?
-        self.splits.append(TrackedSplit(100, 'Done'))
+    def __init__(self, path=RBY_SPLITS_FILE):
+        super().__init__(load_splits(path))